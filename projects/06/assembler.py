@@ -1,3 +1,12 @@
+import struct
+import sys
+from array import array
+from itertools import chain
+
+from build_cache import BuildCache
+from dead_code import DeadCodeEliminator
+
+
 class HackAssembler:
 
     INSTRUCTIONS = {
@@ -53,7 +62,27 @@ class HackAssembler:
         'JMP' : '111'
     }
 
-    def __init__(self, path):
+    C_INSTRUCTIONS = {}  # every legal C-instruction text -> 16 bit int, filled in from the tables above
+
+    ROM_HEADER = struct.Struct('<4sBBHI')  # magic, version, byte order, reserved, number of words
+    ROM_MAGIC = b'HACK'
+    ROM_VERSION = 1
+    BYTE_ORDERS = {'big': 0, 'little': 1}
+
+    ROM_SIZE = 32768
+    MAX_CONSTANT = 32767  # an A-instruction has 15 bits for its value, the top bit set makes a C-instruction
+
+    def __init__(self, path, streaming=False, eliminate_dead_code=False, rom_size=ROM_SIZE):
+        """
+        :param path: String, path of the asm file, None in streaming mode when the program is fed with feed()
+        :param streaming: Boolean, assemble in a single pass without holding the program in memory
+        :param eliminate_dead_code: Boolean, drop the code no execution can reach before encoding,
+                                    see DeadCodeEliminator, needs the whole program so not with streaming
+        :param rom_size: Int, number of words the program must fit in, labels included. None for no limit, only
+                         for throughput measurements over programs larger than any ROM, their words do not run
+        """
+        if streaming and eliminate_dead_code:
+            raise ValueError('dead code elimination needs the whole program, it cannot be streamed')
         self.st = {'R0': 0,
                    'R1': 1,
                    'R2': 2,
@@ -77,16 +106,139 @@ class HackAssembler:
                    'ARG': 2,
                    'THIS': 3,
                    'THAT': 4}
-        self.instructions = self._get_instruction(path)
+        self.path = path
+        self.streaming = streaming
+        # streaming mode never holds the whole program, instructions are read while assembling
+        self.instructions = None if streaming else self._get_instruction(path)
+        self.words_removed = 0  # number of unreachable words dropped by dead code elimination
+        if eliminate_dead_code:
+            eliminator = DeadCodeEliminator()
+            self.instructions = eliminator.eliminate(self.instructions)
+            self.words_removed = eliminator.words_removed
         self.next_avail_reg = 16
+        self.labels = {}  # label -> ROM address, the (LABEL) pseudo instructions seen while assembling
+        self.rom_size = rom_size
+
+    def assemble(self, path_to_file, output_format='text', byteorder='big', cache=None, symbol_path=None):
+        """
+        Assemble the program and write the ROM image to the output path
+
+        :param path_to_file: String, output path of the ROM image
+        :param output_format: String, 'text' for the .hack format of the course tools, 'binary' for a packed ROM
+        :param byteorder: String, 'big' or 'little', byte order of the words in a binary ROM
+        :param cache: BuildCache, if given an unchanged program is copied from the cache instead of reassembled
+        :param symbol_path: String, if given the label map of the program is written there, see write_symbol_map
+        :return: Nothing, assembled program written to the output path
+        """
+        if output_format not in ('text', 'binary'):
+            raise ValueError('output format not recognized: {output_format}'.format(output_format=output_format))
+
+        if cache is not None:
+            key = self.cache_key(output_format, byteorder)
+            data = cache.get(key)
+            if data is not None:
+                with open(path_to_file, 'wb') as f:
+                    f.write(data)
+                if symbol_path is not None:
+                    self._build_st(self.instructions if not self.streaming else self._iter_instruction(self.path))
+                    self.write_symbol_map(symbol_path)
+                return
+
+        if self.streaming:
+            with open(path_to_file, 'wb+') as f:
+                if output_format == 'text':
+                    self._encode_streaming(_TextRomWriter(f))
+                else:
+                    self._encode_streaming(_BinaryRomWriter(f, byteorder))
+        else:
+            self.write_rom(self.assemble_to_array(), path_to_file, output_format, byteorder)
+
+        if cache is not None:
+            with open(path_to_file, 'rb') as f:
+                cache.put(key, f.read())
+        if symbol_path is not None:
+            self.write_symbol_map(symbol_path)
+
+    def write_symbol_map(self, path):
+        """
+        Write the labels of the assembled program, one 'address label' line per label sorted by address,
+        so that tools running the ROM can map addresses back to the source
+        """
+        with open(path, 'w') as f:
+            for label, address in sorted(self.labels.items(), key=lambda item: item[1]):
+                f.write('{address} {label}\n'.format(address=address, label=label))
+
+    @staticmethod
+    def load_symbol_map(path):
+        """Read a map written by write_symbol_map, return a dictionary of label -> ROM address"""
+        labels = {}
+        with open(path, 'r') as f:
+            for line in f:
+                address, label = line.split()
+                labels[label] = int(address)
+        return labels
+
+    def cache_key(self, output_format='text', byteorder='big'):
+        """
+        Hash of the normalized instruction stream, without comments or whitespace, and of the output options.
+        Two sources that only differ in formatting share the same key.
+        """
+        instructions = self.instructions if not self.streaming else self._iter_instruction(self.path)
+        options = ['HackAssembler', str(self.ROM_VERSION), output_format,
+                   byteorder if output_format == 'binary' else '']
+        return BuildCache.key(chain(options, (''.join(instr.split()) for instr in instructions)))
+
+    def assemble_to_array(self):
+        """Assemble the program in memory and return the ROM as an array('H') of 16 bit words"""
+        if self.streaming:
+            writer = _ArrayRomWriter()
+            self._encode_streaming(writer)
+            return writer.words
 
-    def assemble(self, path_to_file):
         self._build_st()
-        bin_list = self._parse_instruction()
-        with open(path_to_file, 'w') as f:
-            for bins in bin_list:
-                f.write(bins)
-                f.write('\n')
+        return array('H', self._parse_instruction())
+
+    def assemble_to_bytes(self, byteorder='big'):
+        """Assemble the program in memory and return the same bytes a binary ROM file would hold"""
+        return self.pack_rom(self.assemble_to_array(), byteorder)
+
+    @classmethod
+    def pack_rom(cls, words, byteorder='big'):
+        """
+        Pack ROM words into a binary ROM image: a small header followed by the words as uint16.
+        The header is always little endian: magic, format version, byte order flag (0 big, 1 little),
+        a reserved short and the number of words.
+
+        :param words: array('H') of the ROM words
+        :param byteorder: String, 'big' or 'little', byte order of the packed words
+        :return: bytes, binary ROM image
+        """
+        if byteorder not in cls.BYTE_ORDERS:
+            raise ValueError('byte order not recognized: {byteorder}'.format(byteorder=byteorder))
+        if byteorder != sys.byteorder:
+            words = array('H', words)
+            words.byteswap()
+        return cls.ROM_HEADER.pack(cls.ROM_MAGIC, cls.ROM_VERSION, cls.BYTE_ORDERS[byteorder], 0,
+                                   len(words)) + words.tobytes()
+
+    @classmethod
+    def load_rom(cls, path):
+        """
+        Load a binary ROM image written by assemble(output_format='binary')
+
+        :param path: String, path of the binary ROM
+        :return: array('H') of the ROM words in native byte order
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, order_flag, _, n_words = cls.ROM_HEADER.unpack_from(data)
+        if magic != cls.ROM_MAGIC or version != cls.ROM_VERSION:
+            raise ValueError('{path} is not a binary Hack ROM'.format(path=path))
+        words = array('H')
+        words.frombytes(data[cls.ROM_HEADER.size:cls.ROM_HEADER.size + 2 * n_words])
+        if order_flag != cls.BYTE_ORDERS[sys.byteorder]:
+            words.byteswap()
+        return words
 
     def _parse_instruction(self):
         parsed = []
@@ -94,68 +246,261 @@ class HackAssembler:
             if instr.startswith('(') and instr.endswith(')'): # skip pseudo symbols
                 continue
             if instr.startswith('@'):
-                binaries = self.__parse_a_instruction(instr)
+                word = self.__parse_a_instruction(instr, len(parsed))
             else:
-                binaries = self.__parse_c_instruction(instr)
-            parsed.append(binaries)
+                word = self.__parse_c_instruction(instr)
+            parsed.append(word)
         return parsed
 
-    def __parse_a_instruction(self, instruction):
+    def __parse_a_instruction(self, instruction, address):
         symbol = instruction[1:]
+        val = self.__constant(symbol, address)
+        if val is None:
+            val = self.st.get(symbol)
+        if val is None:
+            val = self.st[symbol] = self.next_avail_reg
+            self.next_avail_reg += 1
+        return val
+
+    def __constant(self, symbol, address):
+        """
+        Return the value of a numeric A-instruction, None when the symbol is not a number
+
+        :raise ValueError: when the number is one no A-instruction can load
+        """
         try:
-            val = int(symbol)
+            value = int(symbol)
         except ValueError:
-            val = self.st.get(symbol)
-        if val is not None:
-            binary = '0{}'.format('{0:015b}'.format(val))
+            return None
+        if not 0 <= value <= self.MAX_CONSTANT:
+            raise ValueError('constant out of range, @{symbol} at ROM address {address}, A-instructions load '
+                              '0 to {max}'.format(symbol=symbol, address=address, max=self.MAX_CONSTANT))
+        return value
+
+    def __check_address(self, instruction, address):
+        """Refuse an instruction or a label past the end of the ROM, whose address no A-instruction can load"""
+        if self.rom_size is not None and address >= self.rom_size:
+            raise ValueError('program too large, {instruction} at ROM address {address} is past the {size} words '
+                             'of ROM'.format(instruction=instruction, address=address, size=self.rom_size))
+
+    def __parse_c_instruction(self, instruction):
+        try:
+            return self.C_INSTRUCTIONS[instruction]
+        except KeyError:
+            pass
+        try:
+            return self.C_INSTRUCTIONS[''.join(instruction.split())]  # tolerate whitespace around = and ;
+        except KeyError:
+            raise ValueError('invalid C-instruction: {instruction}'.format(instruction=instruction))
+
+    def _encode_streaming(self, writer):
+        """
+        Single pass assembly. Each instruction is encoded and handed to the writer as soon as it is read.
+        A-instructions referring to a symbol that is not known yet are written as placeholders
+        and backpatched in place once the label is defined, since every record has the same width.
+        Symbols still unresolved at the end of the file are variables, allocated in order of first use
+        exactly like the two pass assembly.
+
+        :param writer: ROM writer, receives the words with append() and the backpatches with patch()
+        :return: Nothing, assembled words written to the writer
+        """
+        self.start_stream(writer)
+        for instr in self._iter_instruction(self.path):
+            self.feed(instr)
+        self.finish_stream()
+
+    def start_stream(self, writer=None):
+        """
+        Start a single pass assembly fed one instruction at a time with feed(), for producers such as
+        a compiler that generate the program instead of reading it from a file, see _encode_streaming
+
+        :param writer: ROM writer, by default the words are collected in memory and returned by finish_stream
+        """
+        self.__writer = writer if writer is not None else _ArrayRomWriter()
+        self.__unresolved = {}  # symbol -> list of instruction addresses waiting for its value
+        self.__address = 0
+
+    def feed(self, instr):
+        """Encode the next instruction of a stream opened by start_stream, labels included"""
+        self.__check_address(instr, self.__address)
+        if instr.startswith('(') and instr.endswith(')'):
+            label = instr.lstrip('(').rstrip(')')
+            self.st[label] = self.labels[label] = self.__address
+            if label in self.__unresolved:
+                self.__writer.patch(self.__unresolved.pop(label), self.__address)
+            return
+
+        if instr.startswith('@'):
+            symbol = instr[1:]
+            word = self.__constant(symbol, self.__address)
+            if word is None:
+                word = self.st.get(symbol)
+            if word is None:
+                self.__unresolved.setdefault(symbol, []).append(self.__address)
+                word = 0  # placeholder
         else:
+            word = self.__parse_c_instruction(instr)
+        self.__writer.append(word)
+        self.__address += 1
+
+    def finish_stream(self):
+        """
+        Allocate the variables of a stream opened by start_stream and close its writer
+
+        :return: array('H') of the ROM words when the stream was assembled in memory, None otherwise
+        """
+        writer = self.__writer
+        for symbol, addresses in self.__unresolved.items():  # whatever is left are variables
             self.st[symbol] = self.next_avail_reg
-            binary = '0{}'.format('{0:015b}'.format(self.next_avail_reg))
+            writer.patch(addresses, self.next_avail_reg)
             self.next_avail_reg += 1
-        return binary
+        writer.close(self.__address)
+        self.__writer = self.__unresolved = None
+        return writer.words if isinstance(writer, _ArrayRomWriter) else None
 
-    def __parse_c_instruction(self, instruction):
-        bin_list = ['111', '0000000', '000', '000']  # prefix for C instruction
-        if '=' in instruction:  # non null d
-            dest_split = instruction.split('=')
-            dest = dest_split[0].strip()
-            bin_list[2] = self.DESTINATION[dest]
-            comp_and_jmp = dest_split[1].strip()
-            if ';' in comp_and_jmp:
-                comp_split = comp_and_jmp.split(';')
-                comp, jmp = comp_split[0].strip(), comp_split[1].strip()
-                bin_list[1] = self.INSTRUCTIONS[comp]
-                bin_list[3] = self.JUMP[jmp]
-            else:
-                bin_list[1] = self.INSTRUCTIONS[comp_and_jmp]
-        elif ';' in instruction:
-            comp_split = instruction.split(';')
-            comp, jmp = comp_split[0].strip(), comp_split[1].strip()
-            bin_list[1] = self.INSTRUCTIONS[comp]
-            bin_list[3] = self.JUMP[jmp]
+    @classmethod
+    def write_rom(cls, words, path, output_format='text', byteorder='big'):
+        """
+        Write assembled words to a ROM file
+
+        :param words: array('H') of the ROM words
+        :param path: String, output path of the ROM image
+        :param output_format: String, 'text' for the .hack format of the course tools, 'binary' for a packed ROM
+        :param byteorder: String, 'big' or 'little', byte order of the words in a binary ROM
+        """
+        if output_format == 'text':
+            with open(path, 'w') as f:
+                for word in words:
+                    f.write(cls.__format_word(word))
+        elif output_format == 'binary':
+            with open(path, 'wb') as f:
+                f.write(cls.pack_rom(words, byteorder))
+        else:
+            raise ValueError('output format not recognized: {output_format}'.format(output_format=output_format))
 
-        return ''.join(bin_list)
+    @staticmethod
+    def __format_word(word):
+        """Format an encoded 16 bit instruction as a line of the .hack text format"""
+        return '{0:016b}\n'.format(word)
 
-    def _build_st(self):
+    def _build_st(self, instructions=None):
         i = 0
-        for instr in self.instructions:
+        for instr in self.instructions if instructions is None else instructions:
+            self.__check_address(instr, i)
             if instr.startswith('(') and instr.endswith(')'):
-                self.st[instr.lstrip('(').rstrip(')')] = i
+                label = instr.lstrip('(').rstrip(')')
+                self.st[label] = self.labels[label] = i
                 continue
             i += 1
 
     @staticmethod
     def _get_instruction(path):
-        instructions = []
+        return list(HackAssembler._iter_instruction(path))
+
+    @staticmethod
+    def _iter_instruction(path):
+        """Yield the instructions of an asm file one line at a time, without comments and blank lines"""
         with open(path, 'r') as f:
-            file = f.read().split("\n")
-            for line in file:
+            for line in f:
                 l = line.strip()
                 if l.startswith('//') or l == '':
                     continue
                 else:
-                    instructions.append(l.split('//')[0].strip())
-        return instructions
+                    yield l.split('//')[0].strip()
+
+
+class _TextRomWriter:
+    """Writes words in the .hack text format, every record is 16 bits and a newline"""
+    RECORD_WIDTH = 17
+
+    def __init__(self, f):
+        self.f = f
+
+    def append(self, word):
+        self.f.write('{0:016b}\n'.format(word).encode())
+
+    def patch(self, addresses, word):
+        record = '{0:016b}'.format(word).encode()
+        end = self.f.tell()
+        for address in addresses:
+            self.f.seek(address * self.RECORD_WIDTH)
+            self.f.write(record)
+        self.f.seek(end)
+
+    def close(self, n_words):
+        pass
+
+
+class _BinaryRomWriter:
+    """Writes words to a binary ROM, the header word count is filled in on close"""
+
+    def __init__(self, f, byteorder):
+        if byteorder not in HackAssembler.BYTE_ORDERS:
+            raise ValueError('byte order not recognized: {byteorder}'.format(byteorder=byteorder))
+        self.f = f
+        self.byteorder = byteorder
+        self.word = struct.Struct('>H' if byteorder == 'big' else '<H')
+        self.f.write(HackAssembler.pack_rom(array('H'), byteorder))  # header with a word count of 0
+
+    def append(self, word):
+        self.f.write(self.word.pack(word))
+
+    def patch(self, addresses, word):
+        record = self.word.pack(word)
+        end = self.f.tell()
+        for address in addresses:
+            self.f.seek(HackAssembler.ROM_HEADER.size + address * self.word.size)
+            self.f.write(record)
+        self.f.seek(end)
+
+    def close(self, n_words):
+        self.f.seek(0)
+        self.f.write(HackAssembler.ROM_HEADER.pack(HackAssembler.ROM_MAGIC, HackAssembler.ROM_VERSION,
+                                                   HackAssembler.BYTE_ORDERS[self.byteorder], 0, n_words))
+        self.f.seek(0, 2)
+
+
+class _ArrayRomWriter:
+    """Collects words in memory"""
+
+    def __init__(self):
+        self.words = array('H')
+
+    def append(self, word):
+        self.words.append(word)
+
+    def patch(self, addresses, word):
+        for address in addresses:
+            self.words[address] = word
+
+    def close(self, n_words):
+        pass
+
+
+def _build_c_instruction_table(comps, destinations, jumps):
+    """
+    Encode every legal dest=comp;jump combination once as a 16 bit int, keyed by the instruction text
+    with whitespace removed. Both the null dest and null jump can be written either by omission or as '0',
+    and operands of +, & and | in either order.
+    """
+    table = {}
+    comps = dict(comps)
+    for comp, comp_bits in list(comps.items()):  # the commutative operators are accepted in either order
+        if len(comp) == 3 and comp[1] in '+&|':
+            comps.setdefault(comp[2] + comp[1] + comp[0], comp_bits)
+    dest_prefixes = [('', 0)] + [(dest + '=', int(bits, 2)) for dest, bits in destinations.items()]
+    jump_suffixes = [('', 0)] + [(';' + jump, int(bits, 2)) for jump, bits in jumps.items()]
+    for comp, comp_bits in comps.items():
+        comp_word = 0b111 << 13 | int(comp_bits, 2) << 6
+        for dest, dest_bits in dest_prefixes:
+            for jump, jump_bits in jump_suffixes:
+                table[dest + comp + jump] = comp_word | dest_bits << 3 | jump_bits
+    return table
+
+
+HackAssembler.C_INSTRUCTIONS = _build_c_instruction_table(HackAssembler.INSTRUCTIONS,
+                                                          HackAssembler.DESTINATION,
+                                                          HackAssembler.JUMP)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,181 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from assembler import HackAssembler
+
+SHIPPED_PROGRAMS = ['add/Add.asm', 'max/Max.asm', 'rect/Rect.asm', 'pong/Pong.asm', 'pong/PongL.asm']
+
+
+class AssemblerBenchmark:
+
+    @staticmethod
+    def generate_program(path, n_lines, label_ratio=0.02, variable_ratio=0.1, c_ratio=0.5, n_variables=200,
+                         seed=0):
+        """
+        Write a synthetic asm program. Every line is a label declaration, an A-instruction or a C-instruction.
+        A-instructions load a variable, a label (declared before or after the reference) or a constant.
+        Programs over 32K words do not fit the ROM, they are only assembled with the ROM size check off to
+        measure throughput, see HackAssembler.
+
+        :param path: String, output path of the asm file
+        :param n_lines: Int, number of lines to generate
+        :param label_ratio: Float, fraction of lines that declare a label
+        :param variable_ratio: Float, fraction of lines that are A-instructions loading a variable
+        :param c_ratio: Float, fraction of lines that are C-instructions, the rest load labels and constants
+        :param n_variables: Int, number of distinct variables used by the program
+        :param seed: Int, random seed, the same arguments always generate the same program
+        :return: Nothing, program written to the path
+        """
+        rng = random.Random(seed)
+        comps = list(HackAssembler.INSTRUCTIONS)
+        dests = [d for d in HackAssembler.DESTINATION if d != '0']
+        jumps = [j for j in HackAssembler.JUMP if j != '0']
+        n_labels = max(1, int(n_lines * label_ratio))
+        label_lines = set(rng.sample(range(n_lines), n_labels))
+        next_label = 0
+        with open(path, 'w') as f:
+            f.write('// synthetic program, {n} lines\n'.format(n=n_lines))
+            for line in range(n_lines):
+                if line in label_lines:
+                    f.write('(L{i})\n'.format(i=next_label))
+                    next_label += 1
+                    continue
+                r = rng.random() * (1 - label_ratio)
+                if r < c_ratio:
+                    if rng.random() < 0.1:
+                        f.write('D;{jump}\n'.format(jump=rng.choice(jumps)))
+                    else:
+                        f.write('{dest}={comp}\n'.format(dest=rng.choice(dests), comp=rng.choice(comps)))
+                elif r < c_ratio + variable_ratio:
+                    f.write('@v{i}\n'.format(i=rng.randrange(n_variables)))
+                elif rng.random() < 0.5:
+                    f.write('@L{i}\n'.format(i=rng.randrange(n_labels)))
+                else:
+                    f.write('@{i}\n'.format(i=rng.randrange(32768)))
+
+    @staticmethod
+    def run_workload(name, path, repeat=3):
+        """
+        Assemble one program, timing every phase of the two pass assembler, then the streaming assembler.
+        Meant to run in a fresh process so that the peak RSS belongs to this workload only.
+
+        :param name: String, name of the workload in the report
+        :param path: String, path of the asm file
+        :param repeat: Int, number of runs, the fastest run of each phase is reported
+        :return: Dictionary, measurements of the workload
+        """
+        out_path = os.path.join(tempfile.gettempdir(), 'assembler_benchmark_{pid}.hack'.format(pid=os.getpid()))
+        phases = {'read': [], 'build_symbols': [], 'encode': [], 'write': [], 'two_pass_total': [],
+                  'streaming_total': []}
+        n_words = 0
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                assembler = HackAssembler(path, rom_size=None)
+                read_done = time.perf_counter()
+                assembler._build_st()
+                symbols_done = time.perf_counter()
+                words = assembler._parse_instruction()
+                encode_done = time.perf_counter()
+                with open(out_path, 'w') as f:
+                    for word in words:
+                        f.write('{0:016b}\n'.format(word))
+                write_done = time.perf_counter()
+                phases['read'].append(read_done - start)
+                phases['build_symbols'].append(symbols_done - read_done)
+                phases['encode'].append(encode_done - symbols_done)
+                phases['write'].append(write_done - encode_done)
+                phases['two_pass_total'].append(write_done - start)
+                n_words = len(words)
+                del assembler, words
+
+            two_pass_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            for _ in range(repeat):
+                start = time.perf_counter()
+                HackAssembler(path, streaming=True, rom_size=None).assemble(out_path)
+                phases['streaming_total'].append(time.perf_counter() - start)
+        finally:
+            if os.path.exists(out_path):
+                os.remove(out_path)
+
+        with open(path) as f:
+            n_lines = sum(1 for _ in f)
+        best = {phase: min(times) for phase, times in phases.items()}
+        return {'name': name,
+                'path': path,
+                'lines': n_lines,
+                'words': n_words,
+                'seconds': best,
+                'lines_per_sec': {'two_pass': n_lines / best['two_pass_total'],
+                                  'streaming': n_lines / best['streaming_total']},
+                'peak_rss_kb': {'two_pass': two_pass_rss,
+                                'overall': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}
+
+    @staticmethod
+    def run(sizes, repeat=3, mix=None, work_dir=None):
+        """
+        Benchmark the shipped programs and synthetic programs of the given sizes, each in its own process
+
+        :param sizes: List, line counts of the synthetic programs
+        :param repeat: Int, number of runs per workload
+        :param mix: Dictionary, keyword arguments of generate_program controlling the instruction mix
+        :param work_dir: String, directory for the generated programs, a temporary directory if None
+        :return: Dictionary, machine readable report
+        """
+        mix = mix or {}
+        here = os.path.dirname(os.path.abspath(__file__))
+        workloads = [(path, os.path.join(here, path)) for path in SHIPPED_PROGRAMS]
+        with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+            for size in sizes:
+                path = os.path.join(tmp_dir, 'synthetic_{size}.asm'.format(size=size))
+                AssemblerBenchmark.generate_program(path, size, **mix)
+                workloads.append(('synthetic_{size}'.format(size=size), path))
+
+            results = []
+            context = multiprocessing.get_context('spawn')  # fresh interpreter, so RSS is not inherited
+            for name, path in workloads:
+                with context.Pool(1) as pool:
+                    results.append(pool.apply(AssemblerBenchmark.run_workload, (name, path, repeat)))
+                results[-1]['path'] = os.path.relpath(path, here) if not path.startswith(tmp_dir) else None
+
+        return {'python': platform.python_version(),
+                'platform': platform.platform(),
+                'repeat': repeat,
+                'mix': mix,
+                'workloads': results}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Measure HackAssembler throughput')
+    arg_parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000, 1000000],
+                            help='line counts of the synthetic programs, up to 10000000')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--label-ratio', type=float, default=0.02)
+    arg_parser.add_argument('--variable-ratio', type=float, default=0.1)
+    arg_parser.add_argument('--c-ratio', type=float, default=0.5)
+    arg_parser.add_argument('--json', default=None, help='write the report to this path instead of stdout')
+    args = arg_parser.parse_args()
+
+    report = AssemblerBenchmark.run(args.sizes, repeat=args.repeat,
+                                    mix={'label_ratio': args.label_ratio, 'variable_ratio': args.variable_ratio,
+                                         'c_ratio': args.c_ratio})
+    for workload in report['workloads']:
+        sys.stderr.write('{name:<18} {lines:>9} lines  {two_pass:>10.0f} lines/s  {streaming:>10.0f} lines/s '
+                         'streaming  {rss:>8} KB peak\n'.format(name=workload['name'], lines=workload['lines'],
+                                                                two_pass=workload['lines_per_sec']['two_pass'],
+                                                                streaming=workload['lines_per_sec']['streaming'],
+                                                                rss=workload['peak_rss_kb']['two_pass']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
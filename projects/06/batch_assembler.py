@@ -0,0 +1,136 @@
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from assembler import HackAssembler
+from build_cache import BuildCache
+
+
+class BatchAssembler:
+    OUTPUT_EXTENSION = {'text': '.hack', 'binary': '.rom'}
+
+    @staticmethod
+    def find_sources(target):
+        """
+        Collect the asm files to assemble
+
+        :param target: String, a directory searched recursively, a single asm file or a glob pattern
+        :return: List, sorted paths of the asm files
+        """
+        if os.path.isdir(target):
+            paths = [os.path.join(root, name)
+                     for root, _, names in os.walk(target) for name in names if name.endswith('.asm')]
+        else:
+            paths = [path for path in glob.glob(target, recursive=True) if path.endswith('.asm')]
+        return sorted(paths)
+
+    @staticmethod
+    def assemble_file(input_path, output_format='text', byteorder='big', streaming=False, cache_dir=None,
+                      cache_size=None, eliminate_dead_code=False):
+        """
+        Assemble a single file next to its source. The ROM is written to a temporary file in the same
+        directory and renamed over the destination, so readers never see a partially written ROM.
+
+        :param input_path: String, path of the asm file
+        :param output_format: String, 'text' or 'binary', see HackAssembler.assemble
+        :param byteorder: String, 'big' or 'little', byte order of a binary ROM
+        :param streaming: Boolean, whether to use the single pass streaming assembler
+        :param cache_dir: String, directory of the incremental assembly cache, None to always reassemble
+        :param cache_size: Int, size cap of the cache in bytes, None for no cap
+        :param eliminate_dead_code: Boolean, drop unreachable code before encoding, see DeadCodeEliminator
+        :return: Tuple, (input path, output path, seconds taken, cache hit, error message or None)
+        """
+        output_path = os.path.splitext(input_path)[0] + BatchAssembler.OUTPUT_EXTENSION[output_format]
+        start = time.perf_counter()
+        fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(output_path) or '.')
+        os.close(fd)
+        cache = BuildCache(cache_dir, cache_size) if cache_dir else None
+        try:
+            assembler = HackAssembler(input_path, streaming=streaming, eliminate_dead_code=eliminate_dead_code)
+            assembler.assemble(tmp_path, output_format=output_format, byteorder=byteorder, cache=cache)
+            os.chmod(tmp_path, BatchAssembler.output_mode(output_path))
+            os.replace(tmp_path, output_path)
+        except Exception as e:  # report the failure and keep going with the rest of the batch
+            os.remove(tmp_path)
+            return (input_path, output_path, time.perf_counter() - start, False,
+                    '{}: {}'.format(type(e).__name__, e))
+        return input_path, output_path, time.perf_counter() - start, cache is not None and cache.hits > 0, None
+
+    @staticmethod
+    def output_mode(path):
+        """
+        Permissions for a ROM written to the path: those of the ROM it replaces, otherwise those open() would
+        give a new file. Temporary files are only readable by their owner and renaming one keeps its mode.
+        """
+        try:
+            return os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
+
+    @staticmethod
+    def assemble_all(input_paths, workers=None, output_format='text', byteorder='big', streaming=False,
+                     cache_dir=None, cache_size=None, eliminate_dead_code=False):
+        """
+        Assemble many files in parallel over a process pool
+
+        :param input_paths: List, paths of the asm files
+        :param workers: Int, number of worker processes, defaults to the number of cores
+        :param output_format: String, 'text' or 'binary', see HackAssembler.assemble
+        :param byteorder: String, 'big' or 'little', byte order of a binary ROM
+        :param streaming: Boolean, whether to use the single pass streaming assembler
+        :param cache_dir: String, directory of the incremental assembly cache, None to always reassemble
+        :param cache_size: Int, size cap of the cache in bytes, None for no cap
+        :param eliminate_dead_code: Boolean, drop unreachable code before encoding, see DeadCodeEliminator
+        :return: List of (input path, output path, seconds taken, cache hit, error message or None),
+                 in input order
+        """
+        n = len(input_paths)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(BatchAssembler.assemble_file, input_paths, [output_format] * n,
+                                 [byteorder] * n, [streaming] * n, [cache_dir] * n, [cache_size] * n,
+                                 [eliminate_dead_code] * n,
+                                 chunksize=max(1, n // 64)))
+
+    @staticmethod
+    def print_summary(results, wall_time, out=sys.stdout):
+        """Print the per file timings followed by the totals"""
+        width = max([len(result[0]) for result in results] + [4])
+        for input_path, output_path, seconds, cached, error in results:
+            status = 'FAILED ' + error if error else output_path + (' (cached)' if cached else '')
+            out.write('{path:<{width}}  {ms:9.1f} ms  {status}\n'.format(path=input_path, width=width,
+                                                                         ms=seconds * 1000, status=status))
+        n_failed = sum(1 for result in results if result[4])
+        n_cached = sum(1 for result in results if result[3])
+        out.write('{n} files, {failed} failed, {hits} cache hits, {misses} cache misses, '
+                  '{cpu:.2f}s assembling, {wall:.2f}s wall\n'
+                  .format(n=len(results), failed=n_failed, hits=n_cached,
+                          misses=len(results) - n_cached - n_failed,
+                          cpu=sum(result[2] for result in results), wall=wall_time))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Assemble every .asm file under a directory or glob')
+    arg_parser.add_argument('target', help='directory searched recursively, or a glob such as "**/*.asm"')
+    arg_parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes, default all cores')
+    arg_parser.add_argument('--format', choices=('text', 'binary'), default='text', dest='output_format')
+    arg_parser.add_argument('--byteorder', choices=('big', 'little'), default='big')
+    arg_parser.add_argument('--streaming', action='store_true', help='use the single pass assembler')
+    arg_parser.add_argument('--cache-dir', default=None, help='reuse ROMs of unchanged programs from this directory')
+    arg_parser.add_argument('--cache-size', type=int, default=None, help='cache size cap in bytes, LRU eviction')
+    arg_parser.add_argument('--eliminate-dead-code', action='store_true', help='drop unreachable code')
+    args = arg_parser.parse_args()
+
+    sources = BatchAssembler.find_sources(args.target)
+    started = time.perf_counter()
+    batch_results = BatchAssembler.assemble_all(sources, workers=args.workers, output_format=args.output_format,
+                                                byteorder=args.byteorder, streaming=args.streaming,
+                                                cache_dir=args.cache_dir, cache_size=args.cache_size,
+                                                eliminate_dead_code=args.eliminate_dead_code)
+    BatchAssembler.print_summary(batch_results, time.perf_counter() - started)
+    sys.exit(1 if any(result[4] for result in batch_results) else 0)
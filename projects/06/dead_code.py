@@ -0,0 +1,162 @@
+class DeadCodeEliminator:
+    """
+    Reachability analysis over the labels and jumps of a Hack program, used to drop code no execution can get to.
+
+    Hack jumps go to whatever address A holds, and A only ever gets a ROM address from an @LABEL instruction:
+    either right before the jump, or earlier when a return address is saved to memory. So every label loaded
+    by live code is a possible jump target and is live too. Execution starts at address 0 and falls through
+    from one instruction to the next, except after an unconditional jump.
+    A plain number loaded by live code is a code address when it is in code position: jumped to right away, or
+    saved as is with D=A then @X M=D, the way a return address is, or still in D at a jump. It is data when the
+    next instruction accesses M, e.g. @24576 D=M, when D=A then combines it with another value, e.g. @5 D=A @LCL
+    A=M+D, or stores it to the stack, a VM segment, temp or a static, where the VM translators only ever store
+    return addresses as labels. Numbers within the program that are code addresses or used any other way are followed
+    like labels, and removing code before them would move the code they may point at, programs where that would
+    happen are refused instead of silently broken.
+    Jump targets computed by arithmetic on an address are not followed, the pass is off unless asked for.
+    """
+
+    # where the VM translators push and pop, they only ever store return addresses as labels
+    VM_REGISTERS = {'SP', 'LCL', 'ARG', 'THIS', 'THAT'} | {'R{i}'.format(i=i) for i in range(5, 13)}
+    D_SCAN = 8  # instructions followed from a D=A to the first use of D
+
+    def __init__(self):
+        self.words_removed = 0
+        self.labels_removed = []
+
+    def eliminate(self, instructions):
+        """
+        :param instructions: List, instructions without comments, as read by HackAssembler._get_instruction
+        :return: List, the instructions that are reachable and the labels of reachable code
+        """
+        words, label_positions = self._split(instructions)
+        live, loaded, addresses = self._reachable(words, label_positions)
+        if addresses:
+            first_dead = next((position for position in range(len(words)) if position not in live), None)
+            if first_dead is not None and first_dead < max(addresses):
+                raise ValueError('cannot eliminate dead code, the number {address} may be a code address and the '
+                                 'unreachable word at ROM address {position} comes before it'
+                                 .format(address=max(addresses), position=first_dead))
+
+        kept = []
+        position = 0  # index of the next word, labels refer to the word that follows them
+        for instr in instructions:
+            if instr.startswith('(') and instr.endswith(')'):
+                if position in live or instr[1:-1] in loaded:  # a label may also end the program
+                    kept.append(instr)
+                else:
+                    self.labels_removed.append(instr[1:-1])
+                continue
+            if position in live:
+                kept.append(instr)
+            else:
+                self.words_removed += 1
+            position += 1
+        return kept
+
+    @staticmethod
+    def _split(instructions):
+        """Return the words of the program and the dictionary label -> index of the word after it"""
+        words = []
+        label_positions = {}
+        for instr in instructions:
+            if instr.startswith('(') and instr.endswith(')'):
+                label_positions[instr[1:-1]] = len(words)
+            else:
+                words.append(''.join(instr.split()))
+        return words, label_positions
+
+    @staticmethod
+    def _reachable(words, label_positions):
+        """
+        Return the set of word indices reachable from address 0, following every label and every number within
+        the program loaded on the way, the set of those labels and the set of those numbers
+        """
+        live = set()
+        loaded = set()
+        addresses = set()
+        pending = [0] if words else []
+        while pending:
+            position = pending.pop()
+            while position < len(words) and position not in live:
+                live.add(position)
+                word = words[position]
+                if word.startswith('@'):
+                    symbol = word[1:]
+                    if symbol in label_positions:
+                        loaded.add(symbol)
+                        pending.append(label_positions[symbol])
+                    elif (symbol.isdigit() and int(symbol) < len(words) and
+                          DeadCodeEliminator._numeric_use(words, position) != 'data'):
+                        addresses.add(int(symbol))
+                        pending.append(int(symbol))
+                elif word.endswith(';JMP'):
+                    break
+                position += 1
+        return live, loaded, addresses
+
+    @staticmethod
+    def _numeric_use(words, position):
+        """Return 'code', 'data' or 'ambiguous', how the number loaded by the A-instruction at the position is used"""
+        following = words[position + 1:position + 2 + DeadCodeEliminator.D_SCAN]
+        if not following:
+            return 'ambiguous'
+        if following[0].startswith('@'):  # overwritten before any use
+            return 'data'
+        dest, comp, jump = DeadCodeEliminator._fields(following[0])
+        if jump:
+            return 'code'
+        if 'M' in dest or 'M' in comp:
+            return 'data'
+        if following[0] != 'D=A':
+            return 'ambiguous'
+
+        # follow the number in D to its first use, base is the last symbol loaded, which a store goes through
+        base = None
+        for word in following[1:]:
+            if word.startswith('@'):
+                base = word[1:]
+                continue
+            dest, comp, jump = DeadCodeEliminator._fields(word)
+            if 'D' in comp and comp != 'D':  # combined with another value
+                return 'data'
+            if comp == 'D' and (jump or 'A' in dest):
+                return 'ambiguous'
+            if jump:  # e.g. @123 D=A @ROUTINE 0;JMP, a return address handed over in D
+                return 'code'
+            if comp == 'D' and base is not None:  # stored as is
+                vm_static = base.rpartition('.')[2].isdigit()  # File.3, see CodeWriter
+                return 'data' if base in DeadCodeEliminator.VM_REGISTERS or vm_static else 'code'
+            if 'D' in dest:
+                return 'data'
+        return 'ambiguous'
+
+    @staticmethod
+    def _fields(word):
+        """Return the dest, comp and jump fields of a C-instruction, empty when left out"""
+        instruction, _, jump = word.partition(';')
+        dest, _, comp = instruction.rpartition('=')
+        return dest, comp, jump
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from assembler import HackAssembler
+
+    arg_parser = argparse.ArgumentParser(description='Report the unreachable code of asm programs')
+    arg_parser.add_argument('paths', nargs='+', help='asm files')
+    args = arg_parser.parse_args()
+
+    for asm_path in args.paths:
+        program = HackAssembler._get_instruction(asm_path)
+        eliminator = DeadCodeEliminator()
+        n_words = sum(1 for instr in program if not instr.startswith('('))
+        try:
+            eliminator.eliminate(program)
+        except ValueError as e:
+            print('{path}: {error}'.format(path=asm_path, error=e))
+            continue
+        print('{path}: {words} words, {removed} unreachable, {labels} dead labels'
+              .format(path=asm_path, words=n_words, removed=eliminator.words_removed,
+                      labels=len(eliminator.labels_removed)))
@@ -0,0 +1,242 @@
+from array import array
+
+from assembler import HackAssembler
+
+try:
+    import numpy as np
+except ImportError:  # RAM falls back to a signed 16 bit array
+    np = None
+
+
+class HackEmulator:
+    """
+    Emulator of the Hack computer. The ROM is predecoded once into (comp, dest, jump) tuples, A-instructions
+    are (-1, value, 0). RAM is an int16 NumPy array when NumPy is installed and an array('h') otherwise,
+    values are kept signed like the Hack ALU sees them.
+    """
+
+    RAM_SIZE = 32768
+    SCREEN = 16384
+    SCREEN_SIZE = 8192
+    KBD = 24576
+
+    # comp ids are ordered by how often the VM translators emit them, the run loop tests them in this order
+    COMP_ORDER = ['M', 'D', 'A', '0', 'M+1', 'M-1', 'D+M', 'D-M', 'M-D', 'D+A', 'D-A', 'A-D', 'D+1', 'D-1',
+                  'A+1', 'A-1', '-1', '1', '!D', '!A', '!M', '-D', '-A', '-M', 'D&A', 'D|A', 'D&M', 'D|M']
+    COMP_IDS = {int(HackAssembler.INSTRUCTIONS[comp], 2): i for i, comp in enumerate(COMP_ORDER)}
+
+    def __init__(self, rom):
+        """
+        :param rom: iterable of the 16 bit ROM words, e.g. the array returned by HackAssembler.assemble_to_array
+        """
+        self.rom = array('H', rom)
+        self.program = self._predecode(self.rom)
+        if np is not None:
+            self.ram = np.zeros(self.RAM_SIZE, dtype=np.int16)
+            self.screen = self.ram[self.SCREEN:self.SCREEN + self.SCREEN_SIZE]
+        else:
+            self.ram = array('h', bytes(2 * self.RAM_SIZE))
+            self.screen = memoryview(self.ram)[self.SCREEN:self.SCREEN + self.SCREEN_SIZE]
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = False
+
+    @classmethod
+    def from_hack(cls, path):
+        """Load a program from a .hack text file"""
+        with open(path, 'r') as f:
+            return cls(int(line, 2) for line in f if line.strip())
+
+    @classmethod
+    def from_rom(cls, path):
+        """Load a program from a binary ROM written by HackAssembler"""
+        return cls(HackAssembler.load_rom(path))
+
+    @classmethod
+    def from_asm(cls, path):
+        """Assemble an asm file in memory and load it"""
+        return cls(HackAssembler(path).assemble_to_array())
+
+    @property
+    def keyboard(self):
+        return int(self.ram[self.KBD])
+
+    @keyboard.setter
+    def keyboard(self, key_code):
+        self.ram[self.KBD] = key_code
+
+    def reset(self):
+        """Restart the program from ROM address 0, RAM is left untouched"""
+        self.a = self.d = self.pc = 0
+        self.halted = False
+
+    def step(self):
+        """Execute a single instruction, straight on the RAM, without the copy of the whole RAM run makes"""
+        executed = self._execute(self.ram if np is None else _IntRam(self.ram), 1)
+        self.cycles += executed
+        return executed
+
+    def run(self, max_cycles=None, until=None):
+        """
+        Run the program until it halts, runs past the end of the ROM, reaches the `until` address
+        or has executed max_cycles instructions. A halt is the usual (END) @END 0;JMP infinite loop.
+        RAM is copied into a list for the duration of the run and copied back at the end, so it can be
+        read and poked freely between runs.
+
+        :param max_cycles: Int, maximum number of instructions to execute, None for no limit
+        :param until: Int, ROM address to stop at before executing it
+        :return: Int, number of instructions executed
+        """
+        mem = self.ram.tolist()
+        executed = self._execute(mem, max_cycles, until)
+        self.ram[:] = mem if np is not None else array('h', mem)
+        self.cycles += executed
+        return executed
+
+    def _execute(self, mem, max_cycles=None, until=None):
+        """Instruction at a time interpreter over a list copy of RAM, see run"""
+        program = self.program
+        n = len(program)
+        a, d, pc = self.a, self.d, self.pc
+        limit = max_cycles if max_cycles is not None else -1
+        stop = until if until is not None else -1
+        halt_at = self._halt_addresses
+        executed = 0
+
+        while executed != limit and pc < n and pc != stop:
+            comp, dest, jump = program[pc]
+            executed += 1
+            if comp < 0:
+                a = dest
+                pc += 1
+                continue
+
+            if comp == 0:
+                out = mem[a & 0x7FFF]
+            elif comp == 1:
+                out = d
+            elif comp == 2:
+                out = a
+            elif comp == 3:
+                out = 0
+            elif comp == 4:
+                out = mem[a & 0x7FFF] + 1
+                if out == 32768:
+                    out = -32768
+            elif comp == 5:
+                out = mem[a & 0x7FFF] - 1
+                if out == -32769:
+                    out = 32767
+            elif comp == 6:
+                out = ((d + mem[a & 0x7FFF] + 32768) & 0xFFFF) - 32768
+            elif comp == 7:
+                out = ((d - mem[a & 0x7FFF] + 32768) & 0xFFFF) - 32768
+            elif comp == 8:
+                out = ((mem[a & 0x7FFF] - d + 32768) & 0xFFFF) - 32768
+            elif comp == 9:
+                out = ((d + a + 32768) & 0xFFFF) - 32768
+            elif comp == 10:
+                out = ((d - a + 32768) & 0xFFFF) - 32768
+            elif comp == 11:
+                out = ((a - d + 32768) & 0xFFFF) - 32768
+            elif comp == 12:
+                out = d + 1 if d != 32767 else -32768
+            elif comp == 13:
+                out = d - 1 if d != -32768 else 32767
+            elif comp == 14:
+                out = a + 1 if a != 32767 else -32768
+            elif comp == 15:
+                out = a - 1 if a != -32768 else 32767
+            elif comp == 16:
+                out = -1
+            elif comp == 17:
+                out = 1
+            elif comp == 18:
+                out = ~d
+            elif comp == 19:
+                out = ~a
+            elif comp == 20:
+                out = ~mem[a & 0x7FFF]
+            elif comp == 21:
+                out = -d if d != -32768 else d
+            elif comp == 22:
+                out = -a if a != -32768 else a
+            elif comp == 23:
+                m = mem[a & 0x7FFF]
+                out = -m if m != -32768 else m
+            elif comp == 24:
+                out = d & a
+            elif comp == 25:
+                out = d | a
+            elif comp == 26:
+                out = d & mem[a & 0x7FFF]
+            else:
+                out = d | mem[a & 0x7FFF]
+
+            target = a  # the jump uses A as it was before this instruction wrote it
+            if dest:
+                if dest & 1:
+                    mem[a & 0x7FFF] = out
+                if dest & 2:
+                    d = out
+                if dest & 4:
+                    a = out
+
+            if jump and ((jump & 1 and out > 0) or (jump & 2 and out == 0) or (jump & 4 and out < 0)):
+                if pc in halt_at:
+                    self.halted = True
+                    pc = target & 0x7FFF
+                    break
+                pc = target & 0x7FFF
+            else:
+                pc += 1
+
+        self.a, self.d, self.pc = a, d, pc
+        return executed
+
+    def _predecode(self, rom):
+        """Decode every ROM word once, and find the jump instructions that spin on themselves forever"""
+        program = []
+        self._halt_addresses = set()
+        for address, word in enumerate(rom):
+            if not word & 0x8000:
+                program.append((-1, word, 0))
+                continue
+            try:
+                comp = self.COMP_IDS[(word >> 6) & 0x7F]
+            except KeyError:
+                raise ValueError('invalid instruction {word:016b} at ROM address {address}'
+                                 .format(word=word, address=address))
+            program.append((comp, (word >> 3) & 0x7, word & 0x7))
+            # @address-1 followed by an unconditional jump that does not touch A: the program is done
+            if word & 0x7 == 0x7 and not word & 0x20 and address and rom[address - 1] == address - 1:
+                self._halt_addresses.add(address)
+        return program
+
+
+class _IntRam:
+    """NumPy RAM read as Python ints, the interpreter computes the 16 bit wrap around on those"""
+
+    __slots__ = ('ram',)
+
+    def __init__(self, ram):
+        self.ram = ram
+
+    def __getitem__(self, address):
+        return int(self.ram[address])
+
+    def __setitem__(self, address, value):
+        self.ram[address] = value
+
+
+if __name__ == '__main__':
+    import time
+
+    emulator = HackEmulator.from_hack('pong/Pong.hack')
+    started = time.perf_counter()
+    n_executed = emulator.run(max_cycles=5000000)
+    elapsed = time.perf_counter() - started
+    print('{n} instructions in {s:.2f}s, {ips:.0f} instructions/s'.format(n=n_executed, s=elapsed,
+                                                                           ips=n_executed / elapsed))
@@ -0,0 +1,167 @@
+import argparse
+import bisect
+import json
+import re
+import sys
+from array import array
+
+from assembler import HackAssembler
+from block_emulator import BlockEmulator
+
+
+class HackProfiler:
+    """
+    Cycle profiler of Hack programs. The program runs on the block emulator, which records how often every
+    block ran. Per address counts are recovered from that and attributed to the nearest preceding label,
+    to the enclosing function and to loops, a loop being a backward jump to a label.
+    """
+
+    # Class.function labels emitted by the VM translators, minus their return address labels
+    FUNCTION_LABEL = re.compile(r'^[A-Za-z_][\w]*\.[\w]+$')
+    RETURN_LABEL = re.compile(r'RET\d+$|^RET_ADDRESS')
+
+    def __init__(self, rom, labels):
+        """
+        :param rom: iterable of the 16 bit ROM words
+        :param labels: Dictionary, label -> ROM address, as written by HackAssembler.write_symbol_map
+        """
+        self.emulator = BlockEmulator(rom)
+        self.emulator.block_counts = {}
+        self.labels = sorted((address, label) for label, address in labels.items())
+        self.label_addresses = [address for address, _ in self.labels]
+        function_labels = set(label for _, label in self.labels if self.is_function_label(label))
+        # translators also derive labels from function names, e.g. LOOP_Math.multiply, those are not functions
+        derived = set(label for label in function_labels
+                      if any(label.endswith('_' + other) for other in function_labels if other != label))
+        self.functions = [(address, label) for address, label in self.labels
+                          if label in function_labels and label not in derived]
+        self.function_addresses = [address for address, _ in self.functions]
+
+    @classmethod
+    def from_asm(cls, path):
+        """Assemble an asm file in memory and profile it"""
+        assembler = HackAssembler(path)
+        rom = assembler.assemble_to_array()
+        return cls(rom, assembler.labels)
+
+    @classmethod
+    def from_hack(cls, hack_path, symbol_path):
+        """Profile a .hack file, using the symbol map written next to it by HackAssembler.assemble"""
+        with open(hack_path, 'r') as f:
+            rom = [int(line, 2) for line in f if line.strip()]
+        return cls(rom, HackAssembler.load_symbol_map(symbol_path))
+
+    def is_function_label(self, label):
+        return bool(self.FUNCTION_LABEL.match(label)) and not self.RETURN_LABEL.search(label)
+
+    def run(self, max_cycles=None, until=None):
+        """Run the program, see HackEmulator.run, counts accumulate over successive runs"""
+        return self.emulator.run(max_cycles=max_cycles, until=until)
+
+    def address_counts(self):
+        """Return an array with the number of times every ROM address was executed"""
+        counts = array('q', bytes(8 * len(self.emulator.rom)))
+        # expand the block ranges with a difference array: +n at the start, -n right after the end
+        deltas = array('q', bytes(8 * (len(counts) + 1)))
+        for (start, length), n in self.emulator.block_counts.items():
+            deltas[start] += n
+            deltas[start + length] -= n
+        running = 0
+        for address in range(len(counts)):
+            running += deltas[address]
+            counts[address] = running
+        return counts
+
+    def report(self, top=20):
+        """
+        Summarize where the cycles went
+
+        :param top: Int, number of entries kept in every ranking
+        :return: Dictionary with the total cycles and the hottest labels, functions and loops
+        """
+        counts = self.address_counts()
+        total = sum(counts)
+        by_label = {}
+        by_function = {}
+        for address, n in enumerate(counts):
+            if not n:
+                continue
+            label = self._enclosing(self.label_addresses, self.labels, address)
+            by_label[label] = by_label.get(label, 0) + n
+            function = self._enclosing(self.function_addresses, self.functions, address)
+            by_function[function] = by_function.get(function, 0) + n
+
+        return {'total_cycles': total,
+                'labels': self._ranking(by_label, total, top),
+                'functions': self._ranking(by_function, total, top),
+                'loops': self._loops(counts, total)[:top]}
+
+    def format_report(self, top=20):
+        """Human readable version of report"""
+        report = self.report(top)
+        lines = ['{total} cycles'.format(total=report['total_cycles'])]
+        for title in ('functions', 'labels'):
+            lines.append('')
+            lines.append('hot {title}:'.format(title=title))
+            for entry in report[title]:
+                lines.append('  {cycles:>12} {share:6.2f}%  {name}'.format(**entry))
+        lines.append('')
+        lines.append('hot loops:')
+        for entry in report['loops']:
+            lines.append('  {cycles:>12} {share:6.2f}%  {name} [{start}-{end}] {iterations} iterations in {function}'
+                         .format(**entry))
+        return '\n'.join(lines)
+
+    def _loops(self, counts, total):
+        """Backward jumps to a label, with the cycles spent between the label and the jump"""
+        program = self.emulator.program
+        label_at = {address: label for address, label in self.labels}
+        loops = []
+        for address in range(1, len(program)):
+            comp, _, jump = program[address]
+            previous_comp, target, _ = program[address - 1]
+            if comp < 0 or not jump or previous_comp >= 0 or target > address or target not in label_at:
+                continue
+            if not counts[target]:
+                continue
+            function = self._enclosing(self.function_addresses, self.functions, target)
+            if label_at[target] == function:  # tail jump to the function start, not a loop
+                continue
+            cycles = sum(counts[target:address + 1])
+            loops.append({'name': label_at[target], 'start': target, 'end': address, 'function': function,
+                          'iterations': counts[address], 'cycles': cycles,
+                          'share': 100.0 * cycles / total if total else 0.0})
+        loops.sort(key=lambda entry: entry['cycles'], reverse=True)
+        return loops
+
+    @staticmethod
+    def _enclosing(addresses, labels, address):
+        i = bisect.bisect_right(addresses, address) - 1
+        return labels[i][1] if i >= 0 else '<start>'
+
+    @staticmethod
+    def _ranking(cycles_by_name, total, top):
+        ranking = sorted(cycles_by_name.items(), key=lambda item: item[1], reverse=True)[:top]
+        return [{'name': name, 'cycles': cycles, 'share': 100.0 * cycles / total if total else 0.0}
+                for name, cycles in ranking]
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Profile where a Hack program spends its cycles')
+    arg_parser.add_argument('program', help='.asm file, or .hack file with its symbol map given by --symbols')
+    arg_parser.add_argument('--symbols', default=None, help='symbol map written by HackAssembler.assemble')
+    arg_parser.add_argument('--cycles', type=int, default=10000000, help='cycle budget of the run')
+    arg_parser.add_argument('--top', type=int, default=20)
+    arg_parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = arg_parser.parse_args()
+
+    if args.program.endswith('.asm'):
+        profiler = HackProfiler.from_asm(args.program)
+    else:
+        profiler = HackProfiler.from_hack(args.program, args.symbols or args.program.rsplit('.', 1)[0] + '.sym')
+    profiler.run(max_cycles=args.cycles)
+    if args.json:
+        json.dump(profiler.report(args.top), sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        print(profiler.format_report(args.top))
@@ -0,0 +1,175 @@
+import argparse
+
+from assembler import HackAssembler
+
+
+class PeepholeOptimizer:
+    """
+    Peephole optimization pass over Hack assembly, aimed at the code emitted by the VM translators.
+    Every rule looks at a short window of adjacent instructions, a label always ends the window since
+    control can reach it from elsewhere. Rules run in turn until none of them fires anymore.
+
+    The stack slot just above SP is dead by the VM conventions, rules may skip writes to it.
+    """
+
+    PUSH_D = ['@SP', 'M=M+1', 'A=M-1', 'M=D']
+    POP_D = ['@SP', 'M=M-1', 'A=M', 'D=M']
+
+    RULES = ('pop_push_d', 'push_pop_d', 'redundant_a_load', 'dead_a_load', 'store_load', 'jump_to_next')
+
+    def __init__(self, rules=None):
+        """
+        :param rules: List, names of the rules to apply, all of RULES by default
+        """
+        rules = list(self.RULES if rules is None else rules)
+        for rule in rules:
+            if rule not in self.RULES:
+                raise ValueError('rule not recognized: {rule}'.format(rule=rule))
+        self.rules = rules
+        self.hits = {rule: 0 for rule in rules}
+
+    def optimize(self, instructions):
+        """
+        :param instructions: iterable of asm instructions without comments, e.g. from HackAssembler._iter_instruction
+        :return: List, optimized instructions
+        """
+        instructions = [''.join(instr.split()) for instr in instructions]
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                instructions, n = getattr(self, '_' + rule)(instructions)
+                self.hits[rule] += n
+                changed = changed or n > 0
+        return instructions
+
+    def optimize_file(self, input_path, output_path):
+        """Optimize an asm file, return the number of instructions before and after, labels excluded"""
+        before = list(HackAssembler._iter_instruction(input_path))
+        after = self.optimize(before)
+        with open(output_path, 'w') as f:
+            for instr in after:
+                f.write(instr)
+                f.write('\n')
+        return self.count_words(before), self.count_words(after)
+
+    @staticmethod
+    def count_words(instructions):
+        return sum(1 for instr in instructions if not instr.startswith('('))
+
+    def _pop_push_d(self, instructions):
+        """Popping the stack top to D and pushing it straight back only needs to read it: @SP A=M-1 D=M"""
+        return self.__replace_window(instructions, self.POP_D + self.PUSH_D, ['@SP', 'A=M-1', 'D=M'])
+
+    def _push_pop_d(self, instructions):
+        """
+        Pushing D and popping it straight back leaves D, SP and the live stack as they were.
+        Only A differs, so the pair is dropped when the next instruction loads A anyway.
+        """
+        window = self.PUSH_D + self.POP_D
+        optimized = []
+        hits = 0
+        i = 0
+        n = len(instructions)
+        while i < n:
+            if (instructions[i] == '@SP' and instructions[i:i + len(window)] == window
+                    and i + len(window) < n and instructions[i + len(window)].startswith('@')):
+                i += len(window)
+                hits += 1
+                continue
+            optimized.append(instructions[i])
+            i += 1
+        return optimized, hits
+
+    def _redundant_a_load(self, instructions):
+        """Drop @X when A already holds X, e.g. the @SP reloaded right after M=M+1"""
+        optimized = []
+        hits = 0
+        known_a = None
+        for instr in instructions:
+            if instr.startswith('('):
+                known_a = None
+            elif instr.startswith('@'):
+                if instr == known_a:
+                    hits += 1
+                    continue
+                known_a = instr
+            elif 'A' in self.__dest(instr):
+                known_a = None
+            optimized.append(instr)
+        return optimized, hits
+
+    def _dead_a_load(self, instructions):
+        """Drop @X immediately followed by @Y, nothing can observe the first value of A"""
+        optimized = []
+        hits = 0
+        for i, instr in enumerate(instructions):
+            if instr.startswith('@') and i + 1 < len(instructions) and instructions[i + 1].startswith('@'):
+                hits += 1
+                continue
+            optimized.append(instr)
+        return optimized, hits
+
+    def _store_load(self, instructions):
+        """M=D followed by D=M, or D=M followed by M=D: the second instruction changes nothing"""
+        optimized = []
+        hits = 0
+        for instr in instructions:
+            if optimized and (optimized[-1], instr) in (('M=D', 'D=M'), ('D=M', 'M=D')):
+                hits += 1
+                continue
+            optimized.append(instr)
+        return optimized, hits
+
+    def _jump_to_next(self, instructions):
+        """@L 0;JMP (L) jumps to the next instruction, dropped when that instruction loads A anyway"""
+        optimized = []
+        hits = 0
+        i = 0
+        n = len(instructions)
+        while i < n:
+            instr = instructions[i]
+            if (instr.startswith('@') and i + 3 < n and instructions[i + 1] == '0;JMP'
+                    and instructions[i + 2] == '({label})'.format(label=instr[1:])
+                    and instructions[i + 3].startswith('@')):
+                i += 2
+                hits += 1
+                continue
+            optimized.append(instr)
+            i += 1
+        return optimized, hits
+
+    @staticmethod
+    def __replace_window(instructions, window, replacement):
+        optimized = []
+        hits = 0
+        i = 0
+        n = len(instructions)
+        while i < n:
+            if instructions[i] == window[0] and instructions[i:i + len(window)] == window:
+                optimized.extend(replacement)
+                i += len(window)
+                hits += 1
+                continue
+            optimized.append(instructions[i])
+            i += 1
+        return optimized, hits
+
+    @staticmethod
+    def __dest(instruction):
+        return instruction.split('=')[0] if '=' in instruction else ''
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Peephole optimize a Hack asm file')
+    arg_parser.add_argument('input_path')
+    arg_parser.add_argument('output_path')
+    arg_parser.add_argument('--rules', nargs='*', default=None, choices=PeepholeOptimizer.RULES,
+                            help='rules to apply, all by default')
+    args = arg_parser.parse_args()
+
+    optimizer = PeepholeOptimizer(args.rules)
+    n_before, n_after = optimizer.optimize_file(args.input_path, args.output_path)
+    print('{before} -> {after} instructions'.format(before=n_before, after=n_after))
+    for name, count in optimizer.hits.items():
+        print('  {name:<18} {count}'.format(name=name, count=count))
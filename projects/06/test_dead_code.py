@@ -0,0 +1,88 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', '08'))
+sys.path.append(os.path.join(HERE, '..', '11'))
+
+from assembler import HackAssembler
+from dead_code import DeadCodeEliminator
+from jack_compiler import CompilationEngine
+from jack_tokenizer import JackTokenizer
+from symbol_table import SymbolTable
+from vm_translator import VMTranslator
+from vm_writer import VMWriter
+
+OS_CLASSES = ['Array', 'Keyboard', 'Math', 'Memory', 'Output', 'Screen', 'String', 'Sys']
+
+
+def eliminate(tmp_path, source):
+    """Run the pass over an asm program given as text, return the eliminator and the instructions kept"""
+    asm_path = os.path.join(str(tmp_path), 'Program.asm')
+    with open(asm_path, 'w') as f:
+        f.write(source)
+    eliminator = DeadCodeEliminator()
+    return eliminator, eliminator.eliminate(HackAssembler._get_instruction(asm_path))
+
+
+def test_compiled_sample_is_reduced(tmp_path, monkeypatch):
+    # Seven compiled, with the whole OS and the bootstrap: its numbers are data, e.g. push constant 16384
+    program_dir = tmp_path / 'Seven'
+    program_dir.mkdir()
+    shutil.copy(os.path.join(HERE, '..', '11', 'Seven', 'Main.jack'), str(program_dir))
+    for class_name in OS_CLASSES:
+        shutil.copy(os.path.join(HERE, '..', '12', class_name + 'Test', class_name + '.vm'), str(program_dir))
+    monkeypatch.chdir(str(program_dir))
+    vm_writer = VMWriter('Main.vm')
+    CompilationEngine(JackTokenizer('Main.jack'), 'Main.vm', SymbolTable(), vm_writer).compile()
+    vm_writer.writer_close()
+    VMTranslator.translate('.', 'Seven.asm', True, bootstrap=True)
+
+    instructions = HackAssembler._get_instruction('Seven.asm')
+    n_words = sum(1 for instr in instructions if not instr.startswith('('))
+    eliminator = DeadCodeEliminator()
+    kept = eliminator.eliminate(instructions)
+    assert n_words > HackAssembler.ROM_SIZE
+    assert eliminator.words_removed > 0
+    n_kept = sum(1 for instr in kept if not instr.startswith('('))
+    assert n_kept == n_words - eliminator.words_removed <= HackAssembler.ROM_SIZE
+
+
+def test_numeric_jump_target_is_refused(tmp_path):
+    source = ('@4\n0;JMP\n'
+              '@R15\nM=1\n'  # unreachable, removing it would move address 4
+              '@R14\nM=1\n')
+    with pytest.raises(ValueError):
+        eliminate(tmp_path, source)
+
+
+def test_saved_return_address_is_refused(tmp_path):
+    source = ('@8\nD=A\n@R13\nM=D\n@ROUTINE\n0;JMP\n'
+              '@R15\nM=1\n'  # unreachable, removing it would move the return address
+              '@R14\nM=1\n'  # only reached through the address saved in R13
+              '(END)\n@END\n0;JMP\n'
+              '(ROUTINE)\n@R13\nA=M\n0;JMP\n')
+    with pytest.raises(ValueError):
+        eliminate(tmp_path, source)
+
+
+def test_saved_return_address_after_dead_code_is_kept(tmp_path):
+    source = ('@6\nD=A\n@R13\nM=D\n@ROUTINE\n0;JMP\n'
+              '@R14\nM=1\n'
+              '(END)\n@END\n0;JMP\n'
+              '(ROUTINE)\n@R13\nA=M\n0;JMP\n'
+              '(DEAD)\n@R15\nM=1\n')
+    eliminator, kept = eliminate(tmp_path, source)
+    assert eliminator.words_removed == 2
+    assert kept[6:8] == ['@R14', 'M=1']
+
+
+def test_data_numbers_are_not_followed(tmp_path):
+    source = ('@24576\nD=M\n@7\nD=A\n@SP\nM=D\n@END\n0;JMP\n'
+              '@R15\nM=1\n'  # unreachable, before 24576 were it a code address
+              '(END)\n@END\n0;JMP\n')
+    eliminator, _ = eliminate(tmp_path, source)
+    assert eliminator.words_removed == 2
@@ -1,63 +1,78 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '08'))
+
+from asm_sink import AsmSink
+from vm_command import Command
+
+
 class CodeWriter:
     NON_COMP_OPERATOR = {
-        'and': ('binary', '&'),
-        'or': ('binary', '|'),
-        'not': ('unary', '!'),
-        'neg': ('unary', '-'),
-        'add': ('binary', '+'),
-        'sub': ('binary', '-')
+        Command.AND: ('binary', '&'),
+        Command.OR: ('binary', '|'),
+        Command.NOT: ('unary', '!'),
+        Command.NEG: ('unary', '-'),
+        Command.ADD: ('binary', '+'),
+        Command.SUB: ('binary', '-')
     }
 
     COMP_OPERATOR = {
-        'eq': 'JEQ',
-        'gt': 'JGT',
-        'lt': 'JLT'
+        Command.EQ: 'JEQ',
+        Command.GT: 'JGT',
+        Command.LT: 'JLT'
     }
 
     KEYWORD_ADDRESS = {
-        'local': 'LCL',
-        'argument': 'ARG',
-        'this': 'THIS',
-        'that': 'THAT',
-        'temp': '5',
-        'pointer': '3'}
-
-    def __init__(self, input_file_name, output_path):
+        Command.LOCAL: 'LCL',
+        Command.ARGUMENT: 'ARG',
+        Command.THIS: 'THIS',
+        Command.THAT: 'THAT',
+        Command.TEMP: '5',
+        Command.POINTER: '3'}
+
+    def __init__(self, input_file_name, output_path, sink=None):
+        """
+        :param input_file_name: String, name of the vm file being translated
+        :param output_path: String, path of the translated asm file
+        :param sink: AsmSink receiving the translated code, if None the writer opens its own on the output path
+                     and close() must be called once the file is translated
+        """
         self.file_prefix = input_file_name.split('.')[0]
         self.output_path = output_path
         self.comp_cond_count = 0
         self.num_commands_written = 0
+        self.owns_sink = sink is None
+        self.sink = AsmSink(output_path) if sink is None else sink
+
+        # translation method per opcode
+        self.translators = {opcode: self._translate_arithmetic_nocomp for opcode in self.NON_COMP_OPERATOR}
+        self.translators.update({opcode: self._translate_arithmetic_comp for opcode in self.COMP_OPERATOR})
+        self.translators[Command.PUSH] = self._translate_push
+        self.translators[Command.POP] = self._translate_pop
 
     def write(self, parsed_command):
         """
-        Translate the VM command and write Hack assembly code to the output path
+        Translate the VM command and write Hack assembly code to the sink
 
-        :param parsed_command: dictionary of parsed VM command
-        :return: Nothing, translated Hack assembly code written to output path
+        :param parsed_command: Command, parsed VM command
+        :return: Nothing, translated Hack assembly code written to the sink
         """
-        command_type = parsed_command['command_type']
-        if command_type == 'C_ARITHMETIC' and parsed_command['command'] in self.COMP_OPERATOR:
-            translated = self._translate_arithmetic_comp(parsed_command)
-        elif command_type == 'C_ARITHMETIC' and parsed_command['command'] in self.NON_COMP_OPERATOR:
-            translated = self._translate_arithmetic_nocomp(parsed_command)
-        elif command_type == 'C_PUSH':
-            translated = self._translate_push(parsed_command)
-        elif command_type == 'C_POP':
-            translated = self._translate_pop(parsed_command)
-
-        mode = 'w' if self.num_commands_written == 0 else 'a'
-
-        with open(self.output_path, mode) as f:
-            for line in translated:
-                f.write(line)
-                f.write('\n')
-
+        translator = self.translators.get(parsed_command.opcode)
+        if translator is None:
+            raise ValueError('command not supported: {command}'.format(command=parsed_command))
+        self.sink.write_lines(translator(parsed_command))
         self.num_commands_written += 1
 
+    def close(self):
+        """Write out the translated code, only needed when the writer opened its own sink"""
+        if self.owns_sink:
+            self.sink.close()
+
     def _translate_push(self, parsed_command):
         """Translates a push command"""
         translated = self.__resolve_address(parsed_command)
-        if parsed_command['segment'] == 'constant':
+        if parsed_command.segment == Command.CONSTANT:
             translated.append('D=A')
         else:
             translated.append('D=M')
@@ -70,24 +85,23 @@ class CodeWriter:
         This helper function assigns the right address to the A register depending on the
         segment given in the parsed command
 
-        :param parsed_command: dictionary of parsed VM command
+        :param parsed_command: Command, parsed VM command
         :return: List, list of translated commands up until the assignment of the right address to register A
         """
-        segment = parsed_command['segment']
-        index = parsed_command['index']
+        segment = parsed_command.segment
+        index = parsed_command.index
         translated = []
-        if segment in ('local', 'argument', 'this', 'that'):
+        if segment in (Command.LOCAL, Command.ARGUMENT, Command.THIS, Command.THAT):
             translated.append('@{index}'.format(index=index))
             translated.append('D=A')
             translated.append('@{address}'.format(address=self.KEYWORD_ADDRESS[segment]))
             translated.append('A=M+D')
-        elif segment == 'constant':
+        elif segment == Command.CONSTANT:
             translated.append('@{index}'.format(index=index))
-        elif segment == 'static':
+        elif segment == Command.STATIC:
             translated.append('@{prefix}.{index}'.format(prefix=self.file_prefix, index=index))
-        elif segment in ('temp', 'pointer'):
-            translated.append('@R{address}'.format(address=str((int(self.KEYWORD_ADDRESS[segment]) +
-                                                                int(index)))))  # Address is an int
+        elif segment in (Command.TEMP, Command.POINTER):
+            translated.append('@R{address}'.format(address=int(self.KEYWORD_ADDRESS[segment]) + index))
         else:
             raise ValueError('segment not recognized: {segment}'.format(segment=segment))
 
@@ -130,8 +144,7 @@ class CodeWriter:
 
     def _translate_arithmetic_nocomp(self, parsed_command):
         """Translates a arithmetic command that has is no a comparison statement"""
-        command = parsed_command['command']
-        operator_type, operator = self.NON_COMP_OPERATOR[command]
+        operator_type, operator = self.NON_COMP_OPERATOR[parsed_command.opcode]
 
         translated = list()
         translated.extend(self.__pop_stack_to_d())
@@ -152,8 +165,7 @@ class CodeWriter:
 
     def _translate_arithmetic_comp(self, parsed_command):
         """Translates a arithmetic command that has is a comparison statement"""
-        command = parsed_command['command']
-        directive = self.COMP_OPERATOR[command]
+        directive = self.COMP_OPERATOR[parsed_command.opcode]
         translated = list()
         translated.extend(self.__pop_stack_to_d())
         translated.append('@R13')
@@ -1,3 +1,9 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '08'))
+
+from asm_sink import AsmSink
 from code_writer import CodeWriter
 from parser import Parser
 
@@ -5,19 +11,25 @@ from parser import Parser
 class VMTranslator:
 
     @staticmethod
-    def translate(input_path, output_path):
+    def translate(input_path, output_path, sink=None):
         """
         Top level function that translates the VM code into Hack assembly code
 
         :param input_path: String, input path of the vm file
         :param output_path: String, output path of the translated asm file
+        :param sink: AsmSink receiving the translated code, e.g. an in-memory one, left open for the caller.
+                     By default the code is written to the output path in one go once translation succeeded
         :return: Nothing, vm file translated
         """
+        if sink is None:
+            with AsmSink(output_path) as sink:
+                VMTranslator.translate(input_path, output_path, sink)
+            return
+
         parser = Parser(input_path=input_path)
         file_name = input_path.split('/')[-1]
-        code_writer = CodeWriter(input_file_name=file_name, output_path=output_path)
-        while parser.has_more_commands():
-            parsed_command = parser.advance()
+        code_writer = CodeWriter(input_file_name=file_name, output_path=output_path, sink=sink)
+        for parsed_command in parser.parse_all():
             code_writer.write(parsed_command)
 
 
@@ -2,7 +2,7 @@
 D=A
 @SP
 M=D
-@Sys.initRET0
+@Main$Sys.initRET0
 D=A
 @SP
 M=M+1
@@ -44,7 +44,7 @@ D=M
 M=D
 @Sys.init
 0;JMP
-(Sys.initRET0)
+(Main$Sys.initRET0)
 (Main.fibonacci)
 @0
 D=A
@@ -73,31 +73,31 @@ A=M
 D=M
 @R13
 D=D-M
-@COND_TRUE_0
+@Main$COND_TRUE_0
 D;JLT
 D=0
 @SP
 M=M+1
 A=M-1
 M=D
-@END_COND_0
+@Main$END_COND_0
 0;JMP
-(COND_TRUE_0)
+(Main$COND_TRUE_0)
 D=-1
 @SP
 M=M+1
 A=M-1
 M=D
-(END_COND_0)
+(Main$END_COND_0)
 @SP
 M=M-1
 A=M
 D=M
-@FibonacciElement$IF_TRUE
+@Main.fibonacci$IF_TRUE
 D;JNE
-@FibonacciElement$IF_FALSE
+@Main.fibonacci$IF_FALSE
 0;JMP
-(FibonacciElement$IF_TRUE)
+(Main.fibonacci$IF_TRUE)
 @0
 D=A
 @ARG
@@ -160,7 +160,7 @@ M=D
 @R14
 A=M
 0;JMP
-(FibonacciElement$IF_FALSE)
+(Main.fibonacci$IF_FALSE)
 @0
 D=A
 @ARG
@@ -192,7 +192,7 @@ D=D-M
 M=M+1
 A=M-1
 M=D
-@Main.fibonacciRET1
+@Main$Main.fibonacciRET1
 D=A
 @SP
 M=M+1
@@ -234,7 +234,7 @@ D=M
 M=D
 @Main.fibonacci
 0;JMP
-(Main.fibonacciRET1)
+(Main$Main.fibonacciRET1)
 @0
 D=A
 @ARG
@@ -266,7 +266,7 @@ D=D-M
 M=M+1
 A=M-1
 M=D
-@Main.fibonacciRET2
+@Main$Main.fibonacciRET2
 D=A
 @SP
 M=M+1
@@ -308,7 +308,7 @@ D=M
 M=D
 @Main.fibonacci
 0;JMP
-(Main.fibonacciRET2)
+(Main$Main.fibonacciRET2)
 @SP
 M=M-1
 A=M
@@ -385,7 +385,7 @@ D=A
 M=M+1
 A=M-1
 M=D
-@Main.fibonacciRET0
+@Sys$Main.fibonacciRET0
 D=A
 @SP
 M=M+1
@@ -427,7 +427,7 @@ D=M
 M=D
 @Main.fibonacci
 0;JMP
-(Main.fibonacciRET0)
-(FibonacciElement$WHILE)
-@FibonacciElement$WHILE
+(Sys$Main.fibonacciRET0)
+(Sys.init$WHILE)
+@Sys.init$WHILE
 0;JMP
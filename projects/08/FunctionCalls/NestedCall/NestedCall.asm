@@ -33,7 +33,7 @@ D=M
 @R13
 A=M
 M=D
-@Sys.mainRET0
+@Sys$Sys.mainRET0
 D=A
 @SP
 M=M+1
@@ -75,7 +75,7 @@ D=M
 M=D
 @Sys.main
 0;JMP
-(Sys.mainRET0)
+(Sys$Sys.mainRET0)
 @R6
 D=A
 @R13
@@ -87,8 +87,8 @@ D=M
 @R13
 A=M
 M=D
-(NestedCall$LOOP)
-@NestedCall$LOOP
+(Sys.init$LOOP)
+@Sys.init$LOOP
 0;JMP
 (Sys.main)
 D=0
@@ -216,7 +216,7 @@ D=A
 M=M+1
 A=M-1
 M=D
-@Sys.add12RET1
+@Sys$Sys.add12RET1
 D=A
 @SP
 M=M+1
@@ -258,7 +258,7 @@ D=M
 M=D
 @Sys.add12
 0;JMP
-(Sys.add12RET1)
+(Sys$Sys.add12RET1)
 @R5
 D=A
 @R13
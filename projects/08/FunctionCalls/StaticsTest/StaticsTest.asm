@@ -2,7 +2,7 @@
 D=A
 @SP
 M=D
-@Sys.initRET0
+@Class1$Sys.initRET0
 D=A
 @SP
 M=M+1
@@ -44,7 +44,7 @@ D=M
 M=D
 @Sys.init
 0;JMP
-(Sys.initRET0)
+(Class1$Sys.initRET0)
 (Class1.set)
 @0
 D=A
@@ -422,7 +422,7 @@ D=A
 M=M+1
 A=M-1
 M=D
-@Class1.setRET0
+@Sys$Class1.setRET0
 D=A
 @SP
 M=M+1
@@ -464,7 +464,7 @@ D=M
 M=D
 @Class1.set
 0;JMP
-(Class1.setRET0)
+(Sys$Class1.setRET0)
 @R5
 D=A
 @R13
@@ -488,7 +488,7 @@ D=A
 M=M+1
 A=M-1
 M=D
-@Class2.setRET1
+@Sys$Class2.setRET1
 D=A
 @SP
 M=M+1
@@ -530,7 +530,7 @@ D=M
 M=D
 @Class2.set
 0;JMP
-(Class2.setRET1)
+(Sys$Class2.setRET1)
 @R5
 D=A
 @R13
@@ -542,7 +542,7 @@ D=M
 @R13
 A=M
 M=D
-@Class1.getRET2
+@Sys$Class1.getRET2
 D=A
 @SP
 M=M+1
@@ -584,8 +584,8 @@ D=M
 M=D
 @Class1.get
 0;JMP
-(Class1.getRET2)
-@Class2.getRET3
+(Sys$Class1.getRET2)
+@Sys$Class2.getRET3
 D=A
 @SP
 M=M+1
@@ -627,7 +627,7 @@ D=M
 M=D
 @Class2.get
 0;JMP
-(Class2.getRET3)
-(StaticsTest$WHILE)
-@StaticsTest$WHILE
+(Sys$Class2.getRET3)
+(Sys.init$WHILE)
+@Sys.init$WHILE
 0;JMP
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+
+class AsmSink:
+    """
+    Buffered destination of translated assembly: a file, an in-memory buffer or an open stream such as a pipe.
+    Lines are collected in memory and written with a single call when the sink is closed, so a translation
+    costs one write however many commands it has. A file is written to a temporary file in the same directory
+    and renamed over the destination on close, readers never see a partial program.
+    """
+
+    def __init__(self, target=None, append=False):
+        """
+        :param target: String path of the output file, a writable text stream, or None for an in-memory buffer
+        :param append: Boolean, add to the end of an existing file instead of replacing it, not atomic
+        """
+        self.target = target
+        self.append = append
+        self.lines = []
+        self.closed = False
+        self.value = None  # text of an in-memory sink once closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write_lines(self, lines):
+        """Queue lines of assembly, without their newline"""
+        self.lines.extend(lines)
+
+    def getvalue(self):
+        """Text of the program, everything written so far while the sink is open"""
+        if self.value is not None:
+            return self.value
+        return self.__render()
+
+    def close(self):
+        """Write everything out in one go, then rename a file over its destination"""
+        if self.closed:
+            return
+        self.closed = True
+        text = self.__render()
+        self.lines = []
+        if self.target is None:
+            self.value = text
+        elif isinstance(self.target, str):
+            self.__write_file(text)
+        else:
+            self.target.write(text)
+            self.target.flush()
+
+    def discard(self):
+        """Drop the buffered lines, the destination is left as it was"""
+        self.closed = True
+        self.lines = []
+
+    def __render(self):
+        return '\n'.join(self.lines) + '\n' if self.lines else ''
+
+    def __write_file(self, text):
+        if self.append:
+            with open(self.target, 'a') as f:
+                f.write(text)
+            return
+        fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(self.target) or '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            os.chmod(tmp_path, self.__output_mode())  # temporary files are only readable by their owner
+            os.replace(tmp_path, self.target)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def __output_mode(self):
+        """Permissions of the file replaced, otherwise those open() would give a new file"""
+        try:
+            return os.stat(self.target).st_mode & 0o7777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
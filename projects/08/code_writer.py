@@ -1,95 +1,326 @@
+from asm_sink import AsmSink
+from vm_command import Command
+
+
 class CodeWriter:
     NON_COMP_OPERATOR = {
-        'and': ('binary', '&'),
-        'or': ('binary', '|'),
-        'not': ('unary', '!'),
-        'neg': ('unary', '-'),
-        'add': ('binary', '+'),
-        'sub': ('binary', '-')
+        Command.AND: ('binary', '&'),
+        Command.OR: ('binary', '|'),
+        Command.NOT: ('unary', '!'),
+        Command.NEG: ('unary', '-'),
+        Command.ADD: ('binary', '+'),
+        Command.SUB: ('binary', '-')
     }
 
     COMP_OPERATOR = {
-        'eq': 'JEQ',
-        'gt': 'JGT',
-        'lt': 'JLT'
+        Command.EQ: 'JEQ',
+        Command.GT: 'JGT',
+        Command.LT: 'JLT'
+    }
+
+    # jump taken when the comparison is false, for a comparison followed by not and if-goto
+    NEGATED_COMP_OPERATOR = {
+        Command.EQ: 'JNE',
+        Command.GT: 'JLE',
+        Command.LT: 'JGE'
     }
 
     KEYWORD_ADDRESS = {
-        'local': 'LCL',
-        'argument': 'ARG',
-        'this': 'THIS',
-        'that': 'THAT',
-        'temp': '5',
-        'pointer': '3'}
-
-    def __init__(self, input_file_name, output_path, is_first_file):
-        self.file_prefix = output_path.split('/')[-1].split('.')[0]  # prefix used for function declaration
+        Command.LOCAL: 'LCL',
+        Command.ARGUMENT: 'ARG',
+        Command.THIS: 'THIS',
+        Command.THAT: 'THAT',
+        Command.TEMP: '5',
+        Command.POINTER: '3'}
+
+    # largest index popped to local, argument, this or that by stepping A one word at a time when caching the stack top
+    MAX_INDEX_STEPS = 6
+
+    # entry points of the routines shared by every call site and return in size mode
+    CALL_ROUTINE = '__VM_CALL'
+    RETURN_ROUTINE = '__VM_RETURN'
+
+    def __init__(self, input_file_name, output_path, is_first_file, sink=None, bootstrap=None, optimize_for='speed',
+                 comparisons='inline', cache_tos=False):
+        """
+        :param input_file_name: String, name of the vm file being translated
+        :param output_path: String, path of the translated asm file
+        :param is_first_file: Boolean, whether this is the first file of the program
+        :param sink: AsmSink shared by every file of the translation, if None the writer opens its own on
+                     the output path and close() must be called once the file is translated
+        :param bootstrap: Boolean, whether the first file starts with the bootstrap code setting SP and calling
+                          Sys.init. None keeps the default of the course tests, only the tests that need it
+        :param optimize_for: String, 'speed' inlines the code of every call and return, 'size' jumps to routines
+                             shared by the whole program instead, which the translator appends with write_runtime
+        :param comparisons: String, how eq, gt and lt are translated. 'inline' emits the whole comparison at
+                            every use, 'shared' calls one routine per operator appended with write_runtime,
+                            'jump' turns a comparison followed by if-goto, with or without a not in between,
+                            into a single conditional jump and inlines the other comparisons
+        :param cache_tos: Boolean, keep the top of the stack in D between the commands of a basic block instead of
+                          storing it to RAM after every command and loading it back at the start of the next one
+        """
+        if optimize_for not in ('speed', 'size'):
+            raise ValueError('optimization goal not recognized: {goal}'.format(goal=optimize_for))
+        if comparisons not in ('inline', 'shared', 'jump'):
+            raise ValueError('comparison mode not recognized: {mode}'.format(mode=comparisons))
+        self.file_prefix = output_path.split('/')[-1].split('.')[0]  # name of the program
         self.static_prefix = input_file_name.split('/')[-1].split('.')[0]  # prefix used for static variable
         self.output_path = output_path
         self.is_first_file = is_first_file
+        if bootstrap is None:  # need to bootstrap start these two tests
+            bootstrap = self.file_prefix in ('FibonacciElement', 'StaticsTest')
+        self.bootstrap = bootstrap
+        # labels are scoped by the enclosing function, or by the file outside of functions
+        self.current_function = self.static_prefix
         self.comp_cond_count = 0
         self.num_commands_written = 0
         self.num_functions_called = 0
+        self.optimize_for = optimize_for
+        self.comparisons = comparisons
+        self.pending_comparison = []  # comparison, and the not after it, held back until the next command
+        self.cache_tos = cache_tos
+        # whether the logical top of the stack lives in D instead of RAM[SP - 1], SP then excludes it.
+        # Always False at labels, jumps, calls and returns so every path into a block agrees on it
+        self.tos_in_d = False
+        self.runtime_used = set()  # shared routines the code written so far jumps to
+        self.owns_sink = sink is None
+        self.sink = AsmSink(output_path, append=not is_first_file) if sink is None else sink
+
+        # translation method per opcode, the stack top in RAM
+        self.translators = [None] * (Command.FUSED + 1)
+        for opcode in self.NON_COMP_OPERATOR:
+            self.translators[opcode] = self._translate_arithmetic_nocomp
+        for opcode in self.COMP_OPERATOR:
+            self.translators[opcode] = self._translate_arithmetic_comp
+        self.translators[Command.PUSH] = self._translate_push
+        self.translators[Command.POP] = self._translate_pop
+        self.translators[Command.LABEL] = self._translate_label
+        self.translators[Command.GOTO] = self._translate_goto
+        self.translators[Command.IF] = self._translate_if
+        self.translators[Command.FUNCTION] = self._translate_function
+        self.translators[Command.CALL] = self._translate_call
+        self.translators[Command.RETURN] = self._translate_return
+        self.translators[Command.FUSED] = self._translate_fused
 
     def write(self, parsed_command):
         """
-        Translate the VM command and write Hack assembly code to the output path
+        Translate the VM command and write Hack assembly code to the sink
 
-        :param parsed_command: dictionary of parsed VM command
-        :return: Nothing, translated Hack assembly code written to output file
+        :param parsed_command: Command, parsed VM command
+        :return: Nothing, translated Hack assembly code written to the sink
         """
-        command_type = parsed_command['command_type']
-        if command_type == 'C_ARITHMETIC' and parsed_command['command'] in self.COMP_OPERATOR:
-            translated = self._translate_arithmetic_comp(parsed_command)
-        elif command_type == 'C_ARITHMETIC' and parsed_command['command'] in self.NON_COMP_OPERATOR:
-            translated = self._translate_arithmetic_nocomp(parsed_command)
-        elif command_type == 'C_PUSH':
-            translated = self._translate_push(parsed_command)
-        elif command_type == 'C_POP':
-            translated = self._translate_pop(parsed_command)
-        elif command_type == 'C_LABEL':
-            translated = self._translate_label(parsed_command)
-        elif command_type == 'C_GOTO':
-            translated = self._translate_goto(parsed_command)
-        elif command_type == 'C_IF':
-            translated = self._translate_if(parsed_command)
-        elif command_type == 'C_CALL':
-            translated = self._translate_call(parsed_command)
-        elif command_type == 'C_FUNCTION':
-            translated = self._translate_function(parsed_command)
-        elif command_type == 'C_END_PROGRAM':
-            translated = ['(C_END_PROGRAM)', '@C_END_PROGRAM', '0;JMP']
+        if self.num_commands_written == 0 and self.is_first_file:
+            if self.bootstrap:
+                initial = ['@256', 'D=A', '@SP', 'M=D']  # setup stack pointer
+                initial.extend(self._translate_call(Command(Command.CALL, index=0, symbol='Sys.init')))
+                self.sink.write_lines(initial)
+
+        if self.comparisons == 'jump':
+            translated = self.__lower_comparison_jump(parsed_command)
         else:
-            translated = self._translate_return()
+            translated = self._translate(parsed_command)
+        self.sink.write_lines(translated)
+        self.num_commands_written += 1
 
-        # "w" mode only if the currently processed file is the first out of many and this is the first write
-        if self.num_commands_written == 0 and self.is_first_file:
-            mode = 'w'
-
-            if self.file_prefix in ('FibonacciElement', 'StaticsTest'):  # need to bootstrap start these two tests
-                with open(self.output_path, mode) as f:
-                    initial = ['@256', 'D=A', '@SP', 'M=D']  # setup stack pointer
-                    initial.extend(self._translate_call({'command_type': 'C_CALL',
-                                                         'function_name': 'Sys.init',
-                                                         'n_args': '0'}))  # call Sys.init
-                    initial = [c + '\n' for c in initial]
-                    for c in initial:
-                        f.write(c)
-                mode = 'a'
+    def finish(self):
+        """Write out any command still held back, to be called once the last command of the file is written"""
+        translated = list()
+        for parsed_command in self.pending_comparison:
+            translated.extend(self._translate(parsed_command))
+        self.pending_comparison = []
+        translated.extend(self.__flush_tos())
+        self.sink.write_lines(translated)
+
+    def _translate(self, parsed_command):
+        """Return the Hack assembly code of a VM command"""
+        if self.cache_tos:
+            return self.__translate_cached(parsed_command)
+        return self.__dispatch(parsed_command)
+
+    def __dispatch(self, parsed_command):
+        """Translate a VM command with its own method, the stack top in RAM"""
+        return self.translators[parsed_command.opcode](parsed_command)
+
+    def _translate_fused(self, parsed_command):
+        """
+        Translate a sequence of VM commands recognized by VMFusion as a whole, see VMFusion.RULES
+
+        :param parsed_command: FusedCommand, the rule name and the parsed commands it replaces
+        :return: List, translated commands working on the stack top in RAM
+        """
+        rule = parsed_command.rule
+        first, second = parsed_command.commands
+        translated = list()
+        if rule in ('add_constant', 'sub_constant'):
+            value = first.index
+            operator = '+' if rule == 'add_constant' else '-'
+            if value == 1:
+                translated.append('@SP')
+                translated.append('A=M-1')
+                translated.append('M=M{operator}1'.format(operator=operator))
+            else:
+                translated.append('@{value}'.format(value=value))
+                translated.append('D=A')
+                translated.append('@SP')
+                translated.append('A=M-1')
+                translated.append('M=M{operator}D'.format(operator=operator))
+        elif rule == 'move':
+            load = self.__resolve_address(first)
+            load.append('D=A' if first.segment == Command.CONSTANT else 'D=M')
+            store = self.__store_d(second)
+            if store is not None:
+                translated.extend(load)
+                translated.extend(store)
+            else:
+                translated.extend(self.__resolve_address(second))
+                translated.append('D=A')
+                translated.append('@R13')
+                translated.append('M=D')
+                translated.extend(load)
+                translated.append('@R13')
+                translated.append('A=M')
+                translated.append('M=D')
+        elif rule == 'compare_zero':
+            # x - 0 is x, the stack top is overwritten with the result in place
+            label = '{prefix}$ZERO_TRUE_{i}'.format(prefix=self.static_prefix, i=self.comp_cond_count)
+            self.comp_cond_count += 1
+            translated.append('@SP')
+            translated.append('A=M-1')
+            translated.append('D=M')
+            translated.append('M=-1')
+            translated.append('@{label}'.format(label=label))
+            translated.append('D;{directive}'.format(directive=self.COMP_OPERATOR[second.opcode]))
+            translated.append('@SP')
+            translated.append('A=M-1')
+            translated.append('M=0')
+            translated.append('({label})'.format(label=label))
+        elif rule == 'not_if_goto':
+            # not x is non zero unless x is -1, i.e. unless x + 1 is 0
+            translated.append('@SP')
+            translated.append('AM=M-1')
+            translated.append('D=M+1')
+            translated.append('@{function}${label}'.format(function=self.current_function, label=second.symbol))
+            translated.append('D;JNE')
         else:
-            mode = 'a'
+            raise ValueError('fusion rule not recognized: {rule}'.format(rule=rule))
 
-        with open(self.output_path, mode) as f:
-            for line in translated:
-                f.write(line)
-                f.write('\n')
+        return translated
 
-        self.num_commands_written += 1
+    def __translate_cached(self, parsed_command):
+        """
+        Translate a VM command while the top of the stack may be cached in D. Stack commands work on the cached
+        value and leave their result in D, everything that ends a basic block stores it back to RAM first.
+        """
+        opcode = parsed_command.opcode
+        translated = list()
+        if opcode == Command.PUSH:
+            translated.extend(self.__flush_tos())
+            translated.extend(self.__resolve_address(parsed_command))
+            translated.append('D=A' if parsed_command.segment == Command.CONSTANT else 'D=M')
+            self.tos_in_d = True
+        elif opcode == Command.POP:
+            translated.extend(self.__translate_pop_cached(parsed_command))
+        elif opcode in self.NON_COMP_OPERATOR:
+            operator_type, operator = self.NON_COMP_OPERATOR[opcode]
+            translated.extend(self.__pop_tos_to_d())
+            if operator_type == 'unary':
+                translated.append('D={syntax}D'.format(syntax=operator))
+            else:
+                # D is y, x is popped from RAM and combined with it
+                translated.append('@SP')
+                translated.append('AM=M-1')
+                translated.append('D=M-D' if opcode == Command.SUB else 'D=D{syntax}M'.format(syntax=operator))
+            self.tos_in_d = True
+        elif opcode in self.COMP_OPERATOR and self.comparisons != 'shared':
+            translated.extend(self.__pop_tos_to_d())
+            translated.append('@SP')
+            translated.append('AM=M-1')
+            translated.append('D=M-D')  # x - y
+            translated.append('@{prefix}$COND_TRUE_{i}'.format(prefix=self.static_prefix, i=self.comp_cond_count))
+            translated.append('D;{directive}'.format(directive=self.COMP_OPERATOR[opcode]))
+            translated.append('D=0')
+            translated.append('@{prefix}$END_COND_{i}'.format(prefix=self.static_prefix, i=self.comp_cond_count))
+            translated.append('0;JMP')
+            translated.append('({prefix}$COND_TRUE_{i})'.format(prefix=self.static_prefix, i=self.comp_cond_count))
+            translated.append('D=-1')
+            translated.append('({prefix}$END_COND_{i})'.format(prefix=self.static_prefix, i=self.comp_cond_count))
+            self.comp_cond_count += 1
+            self.tos_in_d = True
+        elif opcode == Command.IF:
+            translated.extend(self.__pop_tos_to_d())
+            translated.append('@{function}${label}'.format(function=self.current_function,
+                                                           label=parsed_command.symbol))
+            translated.append('D;JNE')
+        else:
+            translated.extend(self.__flush_tos())
+            translated.extend(self.__dispatch(parsed_command))
+
+        return translated
+
+    def __translate_pop_cached(self, parsed_command):
+        """Pop the top of the stack, cached in D or not, to a segment"""
+        translated = list()
+        store = self.__store_d(parsed_command)
+        if store is not None:
+            translated.extend(self.__pop_tos_to_d())
+            translated.extend(store)
+        elif self.tos_in_d:
+            translated.append('@R14')
+            translated.append('M=D')
+            translated.extend(self.__resolve_address(parsed_command))
+            translated.append('D=A')
+            translated.append('@R13')
+            translated.append('M=D')
+            translated.append('@R14')
+            translated.append('D=M')
+            translated.append('@R13')
+            translated.append('A=M')
+            translated.append('M=D')
+            self.tos_in_d = False
+        else:
+            translated.extend(self._translate_pop(parsed_command))
+
+        return translated
+
+    def __store_d(self, parsed_command):
+        """
+        Hack Assembly code storing D to a segment slot without going through R13, None when the address
+        cannot be reached without overwriting D
+        """
+        segment = parsed_command.segment
+        index = parsed_command.index
+        if segment in (Command.STATIC, Command.TEMP, Command.POINTER):
+            return self.__resolve_address(parsed_command) + ['M=D']
+        if segment in (Command.LOCAL, Command.ARGUMENT, Command.THIS, Command.THAT) and index <= self.MAX_INDEX_STEPS:
+            # walk A up to the slot one step at a time, cheaper than computing the address apart
+            return (['@{address}'.format(address=self.KEYWORD_ADDRESS[segment]), 'A=M'] + ['A=A+1'] * index +
+                    ['M=D'])
+        return None
+
+    def __pop_tos_to_d(self):
+        """Hack Assembly code leaving the top of the stack in D and removing it from the stack"""
+        if self.tos_in_d:
+            self.tos_in_d = False
+            return []
+        return ['@SP', 'AM=M-1', 'D=M']
+
+    def __flush_tos(self):
+        """Hack Assembly code storing a top of stack cached in D back to RAM"""
+        if not self.tos_in_d:
+            return []
+        self.tos_in_d = False
+        return self.__push_d_to_stack()
+
+    def close(self):
+        """Write out the translated code, only needed when the writer opened its own sink"""
+        self.finish()
+        if self.owns_sink:
+            self.sink.close()
 
     def _translate_push(self, parsed_command):
         """Translates a push command"""
         translated = self.__resolve_address(parsed_command)
-        if parsed_command['segment'] == 'constant':
+        if parsed_command.segment == Command.CONSTANT:
             translated.append('D=A')
         else:
             translated.append('D=M')
@@ -102,24 +333,24 @@ class CodeWriter:
         This helper function assigns the right address to the A register depending on the
         segment given in the parsed command
 
-        :param parsed_command: dictionary of parsed VM command
+        :param parsed_command: Command, parsed VM command
         :return: List, list of translated commands up until the assignment of the right address to register A
         """
-        segment = parsed_command['segment']
-        index = parsed_command['index']
+        segment = parsed_command.segment
+        index = parsed_command.index
         translated = []
-        if segment in ('local', 'argument', 'this', 'that'):
+        if segment in (Command.LOCAL, Command.ARGUMENT, Command.THIS, Command.THAT):
             translated.append('@{index}'.format(index=index))
             translated.append('D=A')
             translated.append('@{address}'.format(address=self.KEYWORD_ADDRESS[segment]))
             translated.append('A=M+D')
-        elif segment == 'constant':
+        elif segment == Command.CONSTANT:
             translated.append('@{index}'.format(index=index))
-        elif segment == 'static':
-            translated.append('@{prefix}.{index}'.format(prefix=self.static_prefix, index=index))
-        elif segment in ('temp', 'pointer'):
-            translated.append('@R{address}'.format(address=str((int(self.KEYWORD_ADDRESS[segment]) +
-                                                                int(index)))))  # Address is an int
+        elif segment == Command.STATIC:
+            translated.append('@{prefix}.{index}'.format(prefix=parsed_command.symbol or self.static_prefix,
+                                                          index=index))
+        elif segment in (Command.TEMP, Command.POINTER):
+            translated.append('@R{address}'.format(address=int(self.KEYWORD_ADDRESS[segment]) + index))
         else:
             raise ValueError('segment not recognized: {segment}'.format(segment=segment))
 
@@ -162,8 +393,7 @@ class CodeWriter:
 
     def _translate_arithmetic_nocomp(self, parsed_command):
         """Translates a arithmetic command that has is no a comparison statement"""
-        command = parsed_command['command']
-        operator_type, operator = self.NON_COMP_OPERATOR[command]
+        operator_type, operator = self.NON_COMP_OPERATOR[parsed_command.opcode]
 
         translated = list()
         translated.extend(self.__pop_stack_to_d())
@@ -184,38 +414,101 @@ class CodeWriter:
 
     def _translate_arithmetic_comp(self, parsed_command):
         """Translates a arithmetic command that has is a comparison statement"""
-        command = parsed_command['command']
-        directive = self.COMP_OPERATOR[command]
+        opcode = parsed_command.opcode
+        directive = self.COMP_OPERATOR[opcode]
         translated = list()
+        if self.comparisons == 'shared':
+            # the routine gets the return address in D and leaves the result on the stack
+            routine = self.__comparison_routine(opcode)
+            self.runtime_used.add(routine)
+            return_address = '{prefix}$COND_RET_{i}'.format(prefix=self.static_prefix, i=self.comp_cond_count)
+            self.comp_cond_count += 1
+            translated.append('@{return_address}'.format(return_address=return_address))
+            translated.append('D=A')
+            translated.append('@{routine}'.format(routine=routine))
+            translated.append('0;JMP')
+            translated.append('({return_address})'.format(return_address=return_address))
+            return translated
+
         translated.extend(self.__pop_stack_to_d())
         translated.append('@R13')
         translated.append('M=D')
         translated.extend((self.__pop_stack_to_d()))
         translated.append('@R13')
         translated.append('D=D-M')
-        translated.append('@COND_TRUE_{i}'.format(i=self.comp_cond_count))
+        translated.append('@{prefix}$COND_TRUE_{i}'.format(prefix=self.static_prefix, i=self.comp_cond_count))
         translated.append('D;{directive}'.format(directive=directive))
         translated.append('D=0')  # does not satisfy the condition
         translated.extend(self.__push_d_to_stack())
-        translated.append('@END_COND_{i}'.format(i=self.comp_cond_count))
+        translated.append('@{prefix}$END_COND_{i}'.format(prefix=self.static_prefix, i=self.comp_cond_count))
         translated.append('0;JMP')  # unconditional jump to exit comparison control flow
-        translated.append('(COND_TRUE_{i})'.format(i=self.comp_cond_count))
+        translated.append('({prefix}$COND_TRUE_{i})'.format(prefix=self.static_prefix, i=self.comp_cond_count))
         translated.append('D=-1')  # -1 = true
         translated.extend(self.__push_d_to_stack())
-        translated.append('(END_COND_{i})'.format(i=self.comp_cond_count))
+        translated.append('({prefix}$END_COND_{i})'.format(prefix=self.static_prefix, i=self.comp_cond_count))
         self.comp_cond_count += 1
 
         return translated
 
+    def __lower_comparison_jump(self, parsed_command):
+        """
+        Hold comparisons back until the command after them is known. When the comparison only feeds an if-goto,
+        possibly through a not, the three commands become one conditional jump on x - y and the boolean is
+        never pushed. Any other command first writes out what was held back.
+        """
+        opcode = parsed_command.opcode
+        pending = self.pending_comparison
+        if pending and opcode == Command.IF:
+            self.pending_comparison = []
+            comparison = pending[0].opcode
+            jumps = self.NEGATED_COMP_OPERATOR if len(pending) == 2 else self.COMP_OPERATOR
+            return self.__translate_comparison_jump(jumps[comparison], parsed_command.symbol)
+        if len(pending) == 1 and opcode == Command.NOT:
+            pending.append(parsed_command)
+            return []
+
+        translated = list()
+        for held_command in pending:
+            translated.extend(self._translate(held_command))
+        self.pending_comparison = []
+        if opcode in self.COMP_OPERATOR:
+            self.pending_comparison = [parsed_command]
+        else:
+            translated.extend(self._translate(parsed_command))
+        return translated
+
+    def __translate_comparison_jump(self, directive, label):
+        """Pop y and x and jump to the label when x - y satisfies the jump directive"""
+        translated = list()
+        if self.cache_tos:
+            translated.extend(self.__pop_tos_to_d())
+            translated.append('@SP')
+            translated.append('AM=M-1')
+            translated.append('D=M-D')
+        else:
+            translated.append('@SP')
+            translated.append('AM=M-1')
+            translated.append('D=M')
+            translated.append('A=A-1')
+            translated.append('D=M-D')
+            translated.append('@SP')
+            translated.append('M=M-1')
+        translated.append('@{function}${label}'.format(function=self.current_function, label=label))
+        translated.append('D;{directive}'.format(directive=directive))
+
+        return translated
+
+    def __comparison_routine(self, opcode):
+        return '__VM_{command}'.format(command=Command.NAMES[opcode].upper())
+
     def _translate_label(self, parsed_command):
-        return ['({file_prefix}${label})'.format(file_prefix=self.file_prefix,
-                                                 label=parsed_command['label'])]
+        return ['({function}${label})'.format(function=self.current_function, label=parsed_command.symbol)]
 
     def _translate_goto(self, parsed_command):
         """Translate unconditional jump to"""
         translated = list()
-        translated.append('@{file_prefix}${label}'.format(file_prefix=self.file_prefix,
-                                                          label=parsed_command['label']))
+        translated.append('@{function}${label}'.format(function=self.current_function,
+                                                       label=parsed_command.symbol))
         translated.append('0;JMP')
 
         return translated
@@ -224,8 +517,8 @@ class CodeWriter:
         """Translate conditional jump to"""
         translated = list()
         translated.extend(self.__pop_stack_to_d())
-        translated.append('@{file_prefix}${label}'.format(file_prefix=self.file_prefix,
-                                                          label=parsed_command['label']))
+        translated.append('@{function}${label}'.format(function=self.current_function,
+                                                       label=parsed_command.symbol))
         translated.append('D;JNE')
 
         return translated
@@ -233,53 +526,95 @@ class CodeWriter:
     def _translate_call(self, parsed_command):
         """Translate a function call command"""
         translated = list()
-        return_address = '{function_name}RET{i}'.format(function_name=parsed_command['function_name'],
-                                                        i=self.num_functions_called)
+        return_address = '{prefix}${function_name}RET{i}'.format(prefix=self.static_prefix,
+                                                                 function_name=parsed_command.symbol,
+                                                                 i=self.num_functions_called)
         self.num_functions_called += 1
 
+        if self.optimize_for == 'size':
+            # the shared routine gets the function in R13, nArgs + 5 in R14 and the return address in D
+            self.runtime_used.add(self.CALL_ROUTINE)
+            translated.append('@{function_name}'.format(function_name=parsed_command.symbol))
+            translated.append('D=A')
+            translated.append('@R13')
+            translated.append('M=D')
+            translated.append('@' + str(parsed_command.index + 5))
+            translated.append('D=A')
+            translated.append('@R14')
+            translated.append('M=D')
+            translated.append('@{return_address}'.format(return_address=return_address))
+            translated.append('D=A')
+            translated.append('@' + self.CALL_ROUTINE)
+            translated.append('0;JMP')
+            translated.append('({return_address})'.format(return_address=return_address))
+            return translated
+
         # push return address
         translated.append('@{return_address}'.format(return_address=return_address))
         translated.append('D=A')
         translated.extend(self.__push_d_to_stack())
 
-        # save current state
+        # save current state, ARG = SP - nArgs - 5, LCL = SP
+        translated.extend(self.__push_frame())
+        translated.append('@' + str(parsed_command.index + 5))
+        translated.append('D=A')
+        translated.extend(self.__reposition_frame())
+
+        # goto function
+        translated.append('@{function_name}'.format(function_name=parsed_command.symbol))
+        translated.append('0;JMP')
+
+        # return address command
+        translated.append('({return_address})'.format(return_address=return_address))
+
+        return translated
+
+    def __push_frame(self):
+        """Push the LCL, ARG, THIS and THAT of the caller"""
+        translated = list()
         for register in ('LCL', 'ARG', 'THIS', 'THAT'):
             translated.extend(self.__lookup_register_val_to_d(register=register))
             translated.extend(self.__push_d_to_stack())
 
-        translated.append('@' + str(int(parsed_command['n_args']) + 5))
-        translated.append('D=A')
+        return translated
+
+    @staticmethod
+    def __reposition_frame():
+        """ARG = SP - D and LCL = SP, D holding nArgs + 5"""
+        translated = list()
         translated.append('@SP')
         translated.append('D=M-D')
         translated.append('@ARG')
         translated.append('M=D')
 
         # LCL = *SP
-        translated.extend(self.__lookup_register_val_to_d(register='SP'))
+        translated.append('@SP')
+        translated.append('D=M')
         translated.append('@LCL')
         translated.append('M=D')
 
-        # goto function
-        translated.append('@{function_name}'.format(function_name=parsed_command['function_name']))
-        translated.append('0;JMP')
-
-        # return address command
-        translated.append('({return_address})'.format(return_address=return_address))
-
         return translated
 
     def _translate_function(self, parsed_command):
         """Translate a function declaration command"""
         translated = list()
-        translated.append('({function_name})'.format(function_name=parsed_command['function_name']))
-        for i in range(int(parsed_command['n_vars'])):
+        self.current_function = parsed_command.symbol
+        translated.append('({function_name})'.format(function_name=parsed_command.symbol))
+        for i in range(parsed_command.index):
             translated.append('D=0')
             translated.extend(self.__push_d_to_stack())
 
         return translated
 
-    def _translate_return(self):
+    def _translate_return(self, parsed_command=None):
         """Translate a return command"""
+        if self.optimize_for == 'size':
+            self.runtime_used.add(self.RETURN_ROUTINE)
+            return ['@' + self.RETURN_ROUTINE, '0;JMP']
+        return self.__return_body()
+
+    def __return_body(self):
+        """Restore the frame of the caller and jump back to it"""
         translated = list()
 
         end_frame = 'R13'
@@ -330,6 +665,54 @@ class CodeWriter:
 
         return translated
 
+    def write_runtime(self, routines):
+        """
+        Append the shared routines of size mode and of shared comparisons after the last command of the program,
+        behind a halt loop so that a program running off its end does not fall into them
+
+        :param routines: set of the routine names used by any file of the program, see runtime_used
+        """
+        if not routines:
+            return
+        translated = ['(__VM_END)', '@__VM_END', '0;JMP']
+        if self.CALL_ROUTINE in routines:
+            translated.append('({routine})'.format(routine=self.CALL_ROUTINE))
+            translated.extend(self.__push_d_to_stack())  # return address
+            translated.extend(self.__push_frame())
+            translated.append('@R14')
+            translated.append('D=M')
+            translated.extend(self.__reposition_frame())
+            translated.append('@R13')
+            translated.append('A=M')
+            translated.append('0;JMP')
+        if self.RETURN_ROUTINE in routines:
+            translated.append('({routine})'.format(routine=self.RETURN_ROUTINE))
+            translated.extend(self.__return_body())
+        for opcode, directive in self.COMP_OPERATOR.items():
+            routine = self.__comparison_routine(opcode)
+            if routine not in routines:
+                continue
+            # x - y in D, x's slot set to true, then to false unless the jump skips it, return through R15
+            translated.append('({routine})'.format(routine=routine))
+            translated.append('@R15')
+            translated.append('M=D')
+            translated.append('@SP')
+            translated.append('AM=M-1')
+            translated.append('D=M')
+            translated.append('A=A-1')
+            translated.append('D=M-D')
+            translated.append('M=-1')
+            translated.append('@{routine}_END'.format(routine=routine))
+            translated.append('D;{directive}'.format(directive=directive))
+            translated.append('@SP')
+            translated.append('A=M-1')
+            translated.append('M=0')
+            translated.append('({routine}_END)'.format(routine=routine))
+            translated.append('@R15')
+            translated.append('A=M')
+            translated.append('0;JMP')
+        self.sink.write_lines(translated)
+
     @staticmethod
     def __lookup_register_val_to_d(register):
         """Helper to get the value within the specified register to register D"""
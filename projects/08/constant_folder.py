@@ -0,0 +1,165 @@
+from vm_command import Command
+
+
+class ConstantFolder:
+    """
+    VM to VM pass folding arithmetic and comparisons on constants, e.g. push constant 3; push constant 4; add
+    becomes push constant 7, and a constant if-goto becomes a goto or nothing.
+
+    Values are 16 bit words and fold the way the Hack CPU computes them: add, sub and neg wrap around, and gt, lt
+    look at the sign of the wrapped x - y, exactly as the translated code does. Within a basic block, constants
+    popped to temp and pointer are remembered and pushing them back counts as pushing a constant. Calls clobber
+    temp and writes through this and that may alias any address, both forget what is known. The local and
+    argument segments are assumed to stay in the stack as the calling convention sets them up.
+
+    A folded value is written back as push constant n, push constant n; neg for negative values and
+    push constant 32767; not for -32768, unless the commands it replaces were fewer.
+    """
+
+    BINARY_OPERATORS = {
+        Command.ADD: lambda x, y: x + y,
+        Command.SUB: lambda x, y: x - y,
+        Command.AND: lambda x, y: x & y,
+        Command.OR: lambda x, y: x | y,
+        Command.EQ: lambda x, y: -1 if x == y else 0,
+        Command.GT: lambda x, y: -1 if ConstantFolder.signed(x - y) > 0 else 0,
+        Command.LT: lambda x, y: -1 if ConstantFolder.signed(x - y) < 0 else 0,
+    }
+    UNARY_OPERATORS = {
+        Command.NEG: lambda x: -x,
+        Command.NOT: lambda x: ~x,
+    }
+    # segments whose slots are tracked, their RAM cells are never written by the translated code behind our back
+    TRACKED_SEGMENTS = (Command.TEMP, Command.POINTER)
+
+    def __init__(self):
+        self.folded = 0  # operators evaluated at translation time
+        self.propagated = 0  # pushes of a temp or pointer slot whose value was known
+        self.branches_resolved = 0  # if-goto on a constant turned into a goto or dropped
+        self.pending = []  # (value, commands pushing it) of the known values on top of the stack, not written yet
+        self.known = {}  # (segment, index) -> value of the tracked slots within the current block
+
+    @staticmethod
+    def signed(value):
+        """Return the 16 bit two's complement value of an integer"""
+        value &= 0xFFFF
+        return value - 0x10000 if value & 0x8000 else value
+
+    @staticmethod
+    def constant_commands(value):
+        """Return the shortest parsed commands pushing a 16 bit value, the VM has no negative constants"""
+        value = ConstantFolder.signed(value)
+        if value >= 0:
+            return [Command(Command.PUSH, Command.CONSTANT, value)]
+        if value == -0x8000:
+            return [Command(Command.PUSH, Command.CONSTANT, 0x7FFF), Command(Command.NOT)]
+        return [Command(Command.PUSH, Command.CONSTANT, -value), Command(Command.NEG)]
+
+    def fold(self, commands):
+        """
+        :param commands: List of Commands, see Parser.advance
+        :return: List of Commands computing the same
+        """
+        folded = []
+        for parsed_command in commands:
+            folded.extend(self._step(parsed_command))
+        folded.extend(self.__flush())
+        self.known = {}
+        return folded
+
+    def _step(self, parsed_command):
+        """Return the commands to write out for one command, holding back the values still known"""
+        opcode = parsed_command.opcode
+        pending = self.pending
+        if opcode == Command.PUSH:
+            slot = (parsed_command.segment, parsed_command.index)
+            if slot[0] == Command.CONSTANT:
+                pending.append((slot[1] & 0xFFFF, [parsed_command]))
+                return []
+            if slot in self.known:
+                self.propagated += 1
+                pending.append((self.known[slot], [parsed_command]))
+                return []
+            return self.__flush() + [parsed_command]
+
+        if opcode <= Command.NOT:
+            if opcode in self.UNARY_OPERATORS and pending:
+                value, replaced = pending.pop()
+                pending.append(self.__folded(self.UNARY_OPERATORS[opcode](value), replaced + [parsed_command]))
+                return []
+            if opcode in self.BINARY_OPERATORS and len(pending) >= 2:
+                y, replaced_y = pending.pop()
+                x, replaced_x = pending.pop()
+                pending.append(self.__folded(self.BINARY_OPERATORS[opcode](x, y),
+                                             replaced_x + replaced_y + [parsed_command]))
+                return []
+            return self.__flush() + [parsed_command]
+
+        if opcode == Command.POP:
+            slot = (parsed_command.segment, parsed_command.index)
+            # the pending values may push the slot being overwritten, they are written out before it
+            value = pending[-1][0] if pending else None
+            translated = self.__flush() + [parsed_command]
+            if slot[0] in self.TRACKED_SEGMENTS:
+                if value is None:
+                    self.known.pop(slot, None)
+                else:
+                    self.known[slot] = value
+            elif slot[0] in (Command.THIS, Command.THAT):
+                self.known = {}
+            return translated
+
+        if opcode == Command.IF and pending:
+            value, replaced = pending.pop()
+            self.branches_resolved += 1
+            translated = self.__flush()
+            if value:
+                translated.append(Command(Command.GOTO, symbol=parsed_command.symbol))
+            self.known = {}
+            return translated
+
+        # labels, jumps, calls and returns end the block, nothing is known past them
+        translated = self.__flush()
+        self.known = {}
+        return translated + [parsed_command]
+
+    def __folded(self, value, replaced):
+        """Return the pending entry of a folded value, keeping the replaced commands when they are shorter"""
+        self.folded += 1
+        value &= 0xFFFF
+        commands = self.constant_commands(value)
+        return value, commands if len(commands) <= len(replaced) else replaced
+
+    def __flush(self):
+        """Write out the pending values, bottom first"""
+        translated = []
+        for value, replaced in self.pending:
+            translated.extend(replaced)
+        self.pending = []
+        return translated
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from parser import Parser
+
+    arg_parser = argparse.ArgumentParser(description='Report, or write out, the constant folding of vm files')
+    arg_parser.add_argument('paths', nargs='+', help='vm files')
+    arg_parser.add_argument('-o', '--output', default=None, help='write the folded vm code there, single input only')
+    args = arg_parser.parse_args()
+    if args.output is not None and len(args.paths) > 1:
+        arg_parser.error('--output needs a single input file')
+
+    for vm_path in args.paths:
+        parser = Parser(input_path=vm_path)
+        program = parser.parse_all()
+        folder = ConstantFolder()
+        optimized = folder.fold(program)
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                f.write(''.join(str(command) + '\n' for command in optimized))
+        print('{path}: {before} -> {after} commands, {folded} folded, {propagated} propagated, '
+              '{branches} branches resolved'.format(path=vm_path, before=len(program), after=len(optimized),
+                                                    folded=folder.folded, propagated=folder.propagated,
+                                                    branches=folder.branches_resolved))
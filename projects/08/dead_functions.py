@@ -0,0 +1,117 @@
+from vm_command import Command
+
+
+class DeadFunctionEliminator:
+    """
+    Linker style pass over all the vm files of a program, dropping the functions no execution can call.
+
+    VM code only calls functions by name, so the call graph is known exactly: a function is live when Sys.init
+    reaches it through call commands of live functions. Commands before the first function of a file run from
+    address 0 like the bootstrap does, the functions they call are live too.
+    """
+
+    ENTRY_POINT = 'Sys.init'
+
+    def __init__(self):
+        self.commands_removed = 0
+        self.functions_removed = []
+
+    def eliminate(self, programs):
+        """
+        :param programs: List of (file name, list of Commands), one per vm file of the program
+        :return: List of (file name, list of Commands) of the files with live code left, in order
+        """
+        bodies = {}  # function name -> its commands, the function command first
+        roots = [self.ENTRY_POINT]
+        for file_name, commands in programs:
+            for name, body in self._split(commands):
+                if name is None:
+                    roots.extend(self._callees(body))
+                elif name in bodies:
+                    raise ValueError('function {name} defined twice, again in {file}'.format(name=name,
+                                                                                          file=file_name))
+                else:
+                    bodies[name] = body
+        if self.ENTRY_POINT not in bodies:
+            raise ValueError('cannot eliminate dead functions, the program has no {entry}'
+                             .format(entry=self.ENTRY_POINT))
+
+        live = self._reachable(bodies, roots)
+        kept = []
+        for file_name, commands in programs:
+            kept_commands = []
+            for name, body in self._split(commands):
+                if name is None or name in live:
+                    kept_commands.extend(body)
+                else:
+                    self.functions_removed.append(name)
+                    self.commands_removed += len(body)
+            if kept_commands:
+                kept.append((file_name, kept_commands))
+        return kept
+
+    @staticmethod
+    def _split(commands):
+        """Yield (function name, commands) per function of a file, the name is None for code before the first one"""
+        name = None
+        body = []
+        for parsed_command in commands:
+            if parsed_command.opcode == Command.FUNCTION:
+                if body:
+                    yield name, body
+                name = parsed_command.symbol
+                body = []
+            body.append(parsed_command)
+        if body:
+            yield name, body
+
+    @staticmethod
+    def _callees(body):
+        return [parsed_command.symbol for parsed_command in body if parsed_command.opcode == Command.CALL]
+
+    @staticmethod
+    def _reachable(bodies, roots):
+        """Return the set of function names called, directly or not, from the roots"""
+        live = set()
+        pending = list(roots)
+        while pending:
+            name = pending.pop()
+            if name in live or name not in bodies:  # calls to missing functions are left for the assembler
+                continue
+            live.add(name)
+            pending.extend(DeadFunctionEliminator._callees(bodies[name]))
+        return live
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    from parser import Parser
+    from vm_pipeline import VMPipeline
+
+    arg_parser = argparse.ArgumentParser(description='Report the functions of vm programs that are never called')
+    arg_parser.add_argument('paths', nargs='+', help='directories of vm files')
+    args = arg_parser.parse_args()
+
+    for program_dir in args.paths:
+        programs = []
+        for file_name in sorted(os.listdir(program_dir)):
+            if file_name.endswith('.vm'):
+                programs.append((file_name, Parser(input_path=os.path.join(program_dir, file_name)).parse_all()))
+        eliminator = DeadFunctionEliminator()
+        try:
+            eliminator.eliminate(programs)
+        except ValueError as e:
+            print('{path}: {error}'.format(path=program_dir, error=e))
+            continue
+        try:
+            words = len(VMPipeline.build(program_dir, bootstrap=True))
+        except ValueError:  # the whole program may not fit the ROM, that is what the pass is for
+            words = 'too many'
+        words_left = len(VMPipeline.build(program_dir, bootstrap=True, eliminate_dead_functions=True))
+        print('{path}: {n} functions, {commands} commands removed, {words} -> {words_left} ROM words'
+              .format(path=program_dir, n=len(eliminator.functions_removed), commands=eliminator.commands_removed,
+                      words=words, words_left=words_left))
+        for name in eliminator.functions_removed:
+            print('  {name}'.format(name=name))
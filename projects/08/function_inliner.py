@@ -0,0 +1,233 @@
+from dead_functions import DeadFunctionEliminator
+from vm_command import Command
+
+
+class FunctionInliner:
+    """
+    Linker style pass over all the vm files of a program, replacing the calls of small leaf functions with their
+    bodies. A call costs the frame push and repositioning, and the return the frame restore, around a hundred
+    instructions, more than the whole work of Memory.peek, Math.abs or String.length.
+
+    A function is inlined when it calls nothing, so it cannot recurse either, has at most max_size commands and
+    its stack is at the same depth whatever path reaches a command, one value deep at every return. At a call
+    site the arguments are popped to static slots of the calling file and the locals set to 0 in the next ones,
+    the body then runs on them with its labels renamed apart and its returns jumping past its end, leaving the
+    return value where the call would. The body runs to its end before any other inlined body can, so every call
+    site of a file shares the same slots. The callee statics stay its own, e.g. push static Memory.0, and the
+    pointer segment slots it writes are saved to static slots too and restored after it, as its return would.
+    Temp is not restored, calls do not preserve it either.
+    """
+
+    MAX_SIZE = 16
+    # tools spot the end of a program by the call of Sys.halt, see VMEmulator
+    NEVER_INLINED = ('Sys.halt',)
+    # opcode -> change of the stack depth, -1 for the binary operators left out
+    STACK_EFFECTS = {Command.NEG: 0, Command.NOT: 0, Command.PUSH: 1, Command.POP: -1, Command.LABEL: 0,
+                     Command.GOTO: 0, Command.IF: -1}
+
+    def __init__(self, max_size=MAX_SIZE):
+        """
+        :param max_size: Int, largest number of commands of an inlined function, its function command excluded
+        """
+        self.max_size = max_size
+        self.calls_inlined = {}  # function name -> number of its call sites replaced
+        self.sites = 0
+
+    def inline(self, programs):
+        """
+        :param programs: List of (file name, list of Commands), one per vm file of the program
+        :return: List of (file name, list of Commands) computing the same, in order
+        """
+        candidates = {}  # function name -> (file prefix, reachable body without its function command)
+        for file_name, commands in programs:
+            for name, body in DeadFunctionEliminator._split(commands):
+                body = self._inlinable(name, body) if name is not None else None
+                if body is not None:
+                    candidates[name] = (self._prefix(file_name), body)
+
+        inlined = []
+        for file_name, commands in programs:
+            prefix = self._prefix(file_name)
+            statics = [parsed_command.index for parsed_command in commands
+                       if parsed_command.opcode <= Command.POP and parsed_command.segment == Command.STATIC and
+                       parsed_command.symbol is None]
+            first_slot = max(statics) + 1 if statics else 0
+            file_commands = []
+            for parsed_command in commands:
+                if parsed_command.opcode == Command.CALL and parsed_command.symbol in candidates:
+                    owner, body = candidates[parsed_command.symbol]
+                    file_commands.extend(self._expand(parsed_command, body, None if owner == prefix else owner,
+                                                      first_slot))
+                else:
+                    file_commands.append(parsed_command)
+            inlined.append((file_name, file_commands))
+        return inlined
+
+    @staticmethod
+    def _prefix(file_name):
+        """Name of the statics of a file, see CodeWriter"""
+        return file_name.split('/')[-1].split('.')[0]
+
+    def _inlinable(self, name, body):
+        """
+        :param body: List of Commands of a function, its function command first
+        :return: List of the reachable Commands of its body when the function calls nothing, is small and keeps
+                 its stack in order, None otherwise
+        """
+        if name in self.NEVER_INLINED or len(body) - 1 > self.max_size:
+            return None
+        if any(parsed_command.opcode == Command.CALL for parsed_command in body):
+            return None
+        depths = self._stack_depths(body[1:])
+        if depths is None:
+            return None
+        return [parsed_command for parsed_command, depth in zip(body[1:], depths) if depth is not None]
+
+    @classmethod
+    def _stack_depths(cls, body):
+        """
+        Follow the stack depth through a function body in order, the depth at a label being the one its jumps
+        left. Code after a goto or a return is only reached through its label, e.g. the goto past the else
+        branch the compiler leaves after a return is never reached.
+
+        :return: List of the depth before each command, None for the unreachable ones, or None when a depth is
+                 ambiguous, goes below the start or is not 1 at a return
+        """
+        depths = []
+        labels = {}
+        depth = 0
+        for parsed_command in body:
+            opcode = parsed_command.opcode
+            if opcode == Command.LABEL:
+                known = labels.get(parsed_command.symbol)
+                if depth is None:
+                    depth = known
+                elif known is not None and known != depth:
+                    return None
+                # None when unreachable so far, a jump back to it is then ambiguous
+                labels[parsed_command.symbol] = depth
+            depths.append(depth)
+            if depth is None:  # dead code
+                continue
+            if opcode == Command.RETURN:
+                if depth != 1:
+                    return None
+                depth = None
+                continue
+            depth += cls.STACK_EFFECTS.get(opcode, -1)
+            if depth < 0:
+                return None
+            if opcode == Command.GOTO or opcode == Command.IF:
+                known = labels.setdefault(parsed_command.symbol, depth)
+                if known != depth:
+                    return None
+                if opcode == Command.GOTO:
+                    depth = None
+        return depths
+
+    def _expand(self, call, body, owner, first_slot):
+        """
+        Return the commands replacing a call of an inlined function
+
+        :param call: Command, the call
+        :param body: List of the reachable Commands of the function, without its function command
+        :param owner: String, prefix of the statics of the function, None when it is the calling file
+        :param first_slot: Int, first static index of the calling file free for the arguments and locals
+        """
+        name = call.symbol
+        self.calls_inlined[name] = self.calls_inlined.get(name, 0) + 1
+        self.sites += 1
+        site = '{name}.{site}'.format(name=name, site=self.sites)
+        n_locals = max([c.index + 1 for c in body if c.opcode <= Command.POP and c.segment == Command.LOCAL] + [0])
+        local_slot = first_slot + call.index
+        pointers = sorted({c.index for c in body if c.opcode == Command.POP and c.segment == Command.POINTER})
+        save_slot = local_slot + n_locals
+
+        expanded = [Command(Command.POP, Command.STATIC, first_slot + i) for i in reversed(range(call.index))]
+        for i in range(n_locals):
+            expanded.append(Command(Command.PUSH, Command.CONSTANT, 0))
+            expanded.append(Command(Command.POP, Command.STATIC, local_slot + i))
+        for i, pointer in enumerate(pointers):
+            expanded.append(Command(Command.PUSH, Command.POINTER, pointer))
+            expanded.append(Command(Command.POP, Command.STATIC, save_slot + i))
+
+        end = '{site}.RETURN'.format(site=site)
+        jumps_to_end = False
+        for i, parsed_command in enumerate(body):
+            opcode = parsed_command.opcode
+            if opcode == Command.RETURN:
+                if i < len(body) - 1:
+                    expanded.append(Command(Command.GOTO, symbol=end))
+                    jumps_to_end = True
+            elif opcode in (Command.LABEL, Command.GOTO, Command.IF):
+                label = '{site}.{label}'.format(site=site, label=parsed_command.symbol)
+                expanded.append(Command(opcode, symbol=label))
+            elif opcode <= Command.NOT or parsed_command.segment in (Command.CONSTANT, Command.THIS, Command.THAT,
+                                                                      Command.TEMP, Command.POINTER):
+                expanded.append(parsed_command)
+            elif parsed_command.segment == Command.ARGUMENT:
+                expanded.append(Command(opcode, Command.STATIC, first_slot + parsed_command.index))
+            elif parsed_command.segment == Command.LOCAL:
+                expanded.append(Command(opcode, Command.STATIC, local_slot + parsed_command.index))
+            else:  # static
+                expanded.append(Command(opcode, Command.STATIC, parsed_command.index, parsed_command.symbol or owner))
+        if jumps_to_end:
+            expanded.append(Command(Command.LABEL, symbol=end))
+
+        for i, pointer in enumerate(pointers):
+            expanded.append(Command(Command.PUSH, Command.STATIC, save_slot + i))
+            expanded.append(Command(Command.POP, Command.POINTER, pointer))
+        return expanded
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import sys
+    import tempfile
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '06'))
+
+    from assembler import HackAssembler
+    from block_emulator import BlockEmulator
+    from parser import Parser
+    from vm_pipeline import VMPipeline
+
+    arg_parser = argparse.ArgumentParser(description='Report the cycles and ROM words leaf function inlining trades')
+    arg_parser.add_argument('paths', nargs='+', help='directories of vm files')
+    arg_parser.add_argument('--max-size', type=int, default=FunctionInliner.MAX_SIZE,
+                            help='largest number of commands of an inlined function')
+    arg_parser.add_argument('--cycles', type=int, default=50000000, help='cycle budget of each run')
+    args = arg_parser.parse_args()
+
+    def cycles_to_halt(program_dir, symbol_path, **options):
+        """
+        Return the ROM words of a build and the cycles it takes to call Sys.halt, None if it never does. Dead
+        functions are left out of both builds, those whose every call got inlined with them
+        """
+        words = VMPipeline.build(program_dir, bootstrap=True, symbol_path=symbol_path, eliminate_dead_functions=True,
+                                 **options)
+        halt = HackAssembler.load_symbol_map(symbol_path).get(FunctionInliner.NEVER_INLINED[0])
+        emulator = BlockEmulator(words)
+        emulator.run(max_cycles=args.cycles, until=halt)
+        return len(words), emulator.cycles if emulator.pc == halt else None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        symbols = os.path.join(tmp_dir, 'program.sym')
+        for program_dir in args.paths:
+            inliner = FunctionInliner(args.max_size)
+            inliner.inline([(file_name, Parser(input_path=os.path.join(program_dir, file_name)).parse_all())
+                            for file_name in sorted(os.listdir(program_dir)) if file_name.endswith('.vm')])
+            words, cycles = cycles_to_halt(program_dir, symbols)
+            words_inlined, cycles_inlined = cycles_to_halt(program_dir, symbols, inline_functions=True,
+                                                           inline_max_size=args.max_size)
+            if cycles is None or cycles_inlined is None:
+                timing = 'no Sys.halt within {budget} cycles'.format(budget=args.cycles)
+            else:
+                timing = '{cycles} -> {cycles_inlined} cycles ({saved:+.1f}%)'.format(
+                    cycles=cycles, cycles_inlined=cycles_inlined, saved=100.0 * (cycles_inlined - cycles) / cycles)
+            print('{path}: {sites} calls inlined, {words} -> {words_inlined} ROM words ({grown:+.1f}%), {timing}'
+                  .format(path=program_dir, sites=inliner.sites, words=words, words_inlined=words_inlined,
+                          grown=100.0 * (words_inlined - words) / words, timing=timing))
+            for name, n in sorted(inliner.calls_inlined.items(), key=lambda item: item[1], reverse=True):
+                print('  {n:>5}  {name}'.format(n=n, name=name))
@@ -0,0 +1,113 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '06'))
+
+from asm_sink import AsmSink
+from hack_emulator import HackEmulator
+from vm_translator import VMTranslator
+
+# SP, LCL, ARG, THIS, THAT, then the slots the snippets read
+INITIAL_RAM = {0: 256, 1: 300, 2: 400, 3: 3000, 4: 3010,
+               300: 7, 301: -1, 302: 0, 303: -32768, 400: 12, 401: 32767, 3000: 5, 3010: -9, 16: 21}
+
+
+def run_snippet(tmp_path, source, fuse):
+    """
+    Translate a vm snippet, with or without fusion, and run it on HackEmulator until it runs past its end
+
+    :return: Tuple, (the emulator, dictionary of fusion rule -> hits)
+    """
+    vm_path = os.path.join(str(tmp_path), 'Snippet.vm')
+    asm_path = os.path.join(str(tmp_path), 'Snippet.asm')
+    with open(vm_path, 'w') as f:
+        f.write(source)
+    hits = {}
+    with AsmSink(asm_path) as sink:
+        VMTranslator.translate(vm_path, asm_path, False, sink=sink, bootstrap=False, fuse=fuse, fusion_hits=hits)
+
+    emulator = HackEmulator.from_asm(asm_path)
+    for address, value in INITIAL_RAM.items():
+        emulator.ram[address] = value
+    emulator.run(max_cycles=10000)
+    assert emulator.pc >= len(emulator.program), 'the snippet did not run to its end'
+    return emulator, hits
+
+
+def visible_ram(emulator):
+    """RAM without the scratch registers R13-R15 and the stack above SP, which the translations use differently"""
+    ram = emulator.ram.tolist()
+    sp = ram[0]
+    return ram[:13] + ram[16:sp] + ram[2048:]
+
+
+def assert_same_as_unfused(tmp_path, source, rule, expected_hits):
+    fused, hits = run_snippet(tmp_path, source, fuse=True)
+    unfused, _ = run_snippet(tmp_path, source, fuse=False)
+    assert fused.ram[0] == unfused.ram[0]
+    assert visible_ram(fused) == visible_ram(unfused)
+    assert hits[rule] == expected_hits
+    return fused
+
+
+@pytest.mark.parametrize('source, expected_hits', [
+    ('push constant 7\npush constant 5\nadd\n', 1),
+    ('push local 0\npush constant 32767\nadd\npush argument 1\npush constant 1\nadd\n', 2),  # wraps around
+    ('push local 3\npush constant 0\nadd\n', 1),
+])
+def test_add_constant(tmp_path, source, expected_hits):
+    assert_same_as_unfused(tmp_path, source, 'add_constant', expected_hits)
+
+
+@pytest.mark.parametrize('source, expected_hits', [
+    ('push local 0\npush constant 3\nsub\n', 1),
+    ('push local 3\npush constant 1\nsub\npush local 2\npush constant 32767\nsub\n', 2),  # wraps around
+])
+def test_sub_constant(tmp_path, source, expected_hits):
+    assert_same_as_unfused(tmp_path, source, 'sub_constant', expected_hits)
+
+
+def test_move(tmp_path):
+    source = ('push argument 0\npop pointer 1\n'
+              'push constant 9\npop that 2\n'
+              'push static 0\npop temp 1\n'
+              'push local 1\npop local 3\n'
+              'push this 0\npop static 1\n')
+    emulator = assert_same_as_unfused(tmp_path, source, 'move', 5)
+    assert emulator.ram[0] == 256  # every pair leaves the stack as it found it
+    assert emulator.ram[4] == 12 and emulator.ram[14] == 9
+
+
+def test_compare_zero(tmp_path):
+    source = ''.join('push local {i}\npush constant 0\n{op}\n'.format(i=i, op=op)
+                     for i in range(4) for op in ('eq', 'gt', 'lt'))
+    emulator = assert_same_as_unfused(tmp_path, source, 'compare_zero', 12)
+    assert emulator.ram.tolist()[256:268] == [0, -1, 0, 0, 0, -1, -1, 0, 0, 0, 0, -1]
+
+
+@pytest.mark.parametrize('local', [0, 1, 2])
+def test_not_if_goto(tmp_path, local):
+    source = ('push local {local}\nnot\nif-goto SKIP\n'
+              'push constant 1\npop static 2\n'
+              'label SKIP\n'
+              'push local {local}\nnot\nif-goto END\n'
+              'push constant 2\npop static 3\n'
+              'label END\n').format(local=local)
+    emulator = assert_same_as_unfused(tmp_path, source, 'not_if_goto', 2)
+    taken = INITIAL_RAM[300 + local] != -1  # not of anything but true is a true value
+    # static 2 is the first variable of the program, RAM[16]
+    assert emulator.ram[16] == (INITIAL_RAM[16] if taken else 1)
+
+
+@pytest.mark.parametrize('source, rule', [
+    ('push constant 5\nlabel BETWEEN\nadd\n', 'add_constant'),
+    ('push local 0\npush constant 5\nlabel BETWEEN\nsub\n', 'sub_constant'),
+    ('push local 0\nlabel BETWEEN\npop local 1\n', 'move'),
+    ('push local 0\npush constant 0\nlabel BETWEEN\neq\n', 'compare_zero'),
+    ('push local 0\nnot\nlabel BETWEEN\nif-goto BETWEEN2\nlabel BETWEEN2\n', 'not_if_goto'),
+])
+def test_label_stops_fusion(tmp_path, source, rule):
+    # a jump to the label reaches the second command alone, so the pair cannot be translated as one
+    assert_same_as_unfused(tmp_path, 'push local 2\n' + source, rule, 0)
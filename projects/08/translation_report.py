@@ -0,0 +1,105 @@
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from vm_pipeline import VMPipeline
+
+PROJECTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FUNCTION_CALL_TESTS = ['FibonacciElement', 'NestedCall', 'SimpleFunction', 'StaticsTest']
+SAMPLE_PROGRAMS = ['Average', 'ComplexArrays', 'ConvertToBin', 'Pong', 'Seven', 'Square']
+OS_CLASSES = ['Array', 'Keyboard', 'Math', 'Memory', 'Output', 'Screen', 'String', 'Sys']
+
+
+class TranslationReport:
+    """ROM size of the course programs under different translation options"""
+
+    # name -> keyword arguments of VMPipeline.build
+    VARIANTS = {
+        'speed': {'optimize_for': 'speed'},
+        'size': {'optimize_for': 'size'},
+        'shared_comparisons': {'comparisons': 'shared'},
+        'comparison_jumps': {'comparisons': 'jump'},
+        'cache_tos': {'cache_tos': True},
+        'fusion': {'fuse': True},
+        'constant_folding': {'fold_constants': True},
+        'dead_functions': {'eliminate_dead_functions': True},
+        'inlining': {'inline_functions': True},
+    }
+
+    @staticmethod
+    def prepare_programs(work_dir):
+        """
+        Collect the programs to measure: the FunctionCalls tests as shipped, and the project 11 samples
+        compiled with the Jack compiler and linked with the VM code of the project 12 OS classes
+
+        :param work_dir: String, directory receiving the compiled samples
+        :return: List of (name, path of the vm file or directory, bootstrap flag)
+        """
+        programs = [(name, os.path.join(PROJECTS, '08', 'FunctionCalls', name), None) for name in FUNCTION_CALL_TESTS]
+        programs[FUNCTION_CALL_TESTS.index('NestedCall')] = \
+            ('NestedCall', os.path.join(PROJECTS, '08', 'FunctionCalls', 'NestedCall', 'Sys.vm'), None)
+
+        compiler_dir = os.path.join(PROJECTS, '11')
+        for name in SAMPLE_PROGRAMS:
+            program_dir = os.path.join(work_dir, name)
+            os.makedirs(program_dir)
+            for path in glob.glob(os.path.join(compiler_dir, name, '*.jack')):
+                shutil.copy(path, program_dir)
+            subprocess.run([sys.executable, 'jack_compiler.py', program_dir], cwd=compiler_dir, check=True,
+                           stdout=subprocess.DEVNULL)
+            for os_class in OS_CLASSES:
+                shutil.copy(os.path.join(PROJECTS, '12', os_class + 'Test', os_class + '.vm'), program_dir)
+            programs.append((name, program_dir, True))
+        return programs
+
+    @staticmethod
+    def rom_sizes(programs, variants=None):
+        """
+        :param programs: List of (name, path, bootstrap flag), see prepare_programs
+        :param variants: Dictionary, variant name -> keyword arguments of VMPipeline.build, VARIANTS by default
+        :return: List of (program name, dictionary of variant name -> number of ROM words, None when the
+                 variant does not apply to the program, e.g. dead function elimination without Sys.init)
+        """
+        variants = variants or TranslationReport.VARIANTS
+        sizes = []
+        for name, path, bootstrap in programs:
+            words = {}
+            for variant, options in variants.items():
+                try:
+                    words[variant] = len(VMPipeline.build(path, bootstrap=bootstrap, **options))
+                except ValueError:
+                    words[variant] = None
+            sizes.append((name, words))
+        return sizes
+
+    @staticmethod
+    def format_table(sizes):
+        """One row per program, the ROM size of every variant followed by its saving over the first one"""
+        variants = list(sizes[0][1])
+        lines = ['{name:<18}'.format(name='program') + ''.join('{v:>20}'.format(v=v) for v in variants)]
+        for name, words in sizes:
+            base = words[variants[0]]
+            cells = ['{n:>20}'.format(n='-' if base is None else base)]
+            for variant in variants[1:]:
+                if words[variant] is None or base is None:
+                    cells.append('{n:>20}'.format(n='-' if words[variant] is None else words[variant]))
+                    continue
+                cells.append('{n:>11} ({saved:+5.1f}%)'.format(n=words[variant],
+                                                              saved=100.0 * (words[variant] - base) / base))
+            lines.append('{name:<18}'.format(name=name) + ''.join(cells))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Compare the ROM size of the course programs per translation mode')
+    arg_parser.add_argument('--variants', nargs='*', default=None, choices=list(TranslationReport.VARIANTS))
+    args = arg_parser.parse_args()
+
+    selected = {name: TranslationReport.VARIANTS[name] for name in args.variants or TranslationReport.VARIANTS}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(TranslationReport.format_table(TranslationReport.rom_sizes(TranslationReport.prepare_programs(tmp_dir),
+                                                                         selected)))
@@ -0,0 +1,99 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from asm_sink import AsmSink
+from code_writer import CodeWriter
+from parser import Parser
+from translation_report import TranslationReport
+
+
+class TranslatorBenchmark:
+
+    # name -> keyword arguments of CodeWriter, the modes with a translation path of their own
+    MODES = {
+        'speed': {},
+        'size': {'optimize_for': 'size'},
+        'comparison_jumps': {'comparisons': 'jump'},
+        'cache_tos': {'cache_tos': True},
+    }
+
+    @staticmethod
+    def run_workload(name, program_dir, repeat=5, modes=None):
+        """
+        Parse then translate every vm file of a program, timing both phases apart
+
+        :param name: String, name of the workload in the report
+        :param program_dir: String, directory of the vm files
+        :param repeat: Int, number of runs, the fastest run of each phase is reported
+        :param modes: Dictionary, mode name -> keyword arguments of CodeWriter, MODES by default
+        :return: Dictionary, measurements of the workload
+        """
+        modes = modes or TranslatorBenchmark.MODES
+        paths = sorted(glob.glob(os.path.join(program_dir, '*.vm')))
+        times = {'parse': []}
+        times.update({mode: [] for mode in modes})
+        programs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            programs = [(path.split('/')[-1], Parser(input_path=path).parse_all()) for path in paths]
+            times['parse'].append(time.perf_counter() - start)
+        for mode, options in modes.items():
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for file_name, commands in programs:
+                    code_writer = CodeWriter(input_file_name=file_name, output_path=name + '.asm',
+                                             is_first_file=False, sink=AsmSink(), **options)
+                    for parsed_command in commands:
+                        code_writer.write(parsed_command)
+                    code_writer.finish()
+                times[mode].append(time.perf_counter() - start)
+
+        n_commands = sum(len(commands) for _, commands in programs)
+        best = {phase: min(phase_times) for phase, phase_times in times.items()}
+        return {'name': name,
+                'commands': n_commands,
+                'seconds': best,
+                'commands_per_sec': {phase: n_commands / seconds for phase, seconds in best.items()}}
+
+    @staticmethod
+    def run(repeat=5, modes=None):
+        """
+        Benchmark the project 11 samples linked with the OS, see TranslationReport.prepare_programs
+
+        :return: Dictionary, machine readable report
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            programs = [(name, path) for name, path, bootstrap in TranslationReport.prepare_programs(tmp_dir)
+                        if bootstrap]
+            results = [TranslatorBenchmark.run_workload(name, path, repeat, modes) for name, path in programs]
+        return {'python': platform.python_version(),
+                'platform': platform.platform(),
+                'repeat': repeat,
+                'workloads': results}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Measure VM parsing and translation throughput')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--modes', nargs='*', default=None, choices=list(TranslatorBenchmark.MODES))
+    arg_parser.add_argument('--json', default=None, help='write the report to this path instead of stdout')
+    args = arg_parser.parse_args()
+
+    selected = {mode: TranslatorBenchmark.MODES[mode] for mode in args.modes or TranslatorBenchmark.MODES}
+    report = TranslatorBenchmark.run(repeat=args.repeat, modes=selected)
+    for workload in report['workloads']:
+        sys.stderr.write('{name:<14} {n:>6} commands'.format(name=workload['name'], n=workload['commands']) +
+                         ''.join('  {phase} {rate:>8.0f}/s'.format(phase=phase, rate=rate)
+                                 for phase, rate in workload['commands_per_sec'].items()) + '\n')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
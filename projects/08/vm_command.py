@@ -0,0 +1,80 @@
+class Command:
+    """
+    Parsed VM command. The opcode and the segment are small ints, see the constants below, and numbers are parsed
+    once: index holds the index of push and pop, the number of locals of function and of arguments of call.
+    symbol holds the label of label, goto and if-goto and the function name of function and call. A static
+    access may name the file whose statics it means, written push static Memory.0, when code of a file is copied
+    into another one, see FunctionInliner; symbol is None for the statics of the file itself.
+    """
+
+    __slots__ = ('opcode', 'segment', 'index', 'symbol')
+
+    # opcodes, arithmetic first so that opcode <= NOT tells an arithmetic or logical command
+    ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT, PUSH, POP, LABEL, GOTO, IF, FUNCTION, CALL, RETURN = range(17)
+    FUSED = 17  # pair of commands translated as one, see VMFusion
+    NAMES = ('add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not', 'push', 'pop', 'label', 'goto', 'if-goto',
+             'function', 'call', 'return')
+    OPCODES = {name: opcode for opcode, name in enumerate(NAMES)}
+    COMPARISONS = (EQ, GT, LT)
+
+    # segments
+    CONSTANT, LOCAL, ARGUMENT, THIS, THAT, TEMP, POINTER, STATIC = range(8)
+    SEGMENT_NAMES = ('constant', 'local', 'argument', 'this', 'that', 'temp', 'pointer', 'static')
+    SEGMENTS = {name: segment for segment, name in enumerate(SEGMENT_NAMES)}
+
+    def __init__(self, opcode, segment=None, index=None, symbol=None):
+        self.opcode = opcode
+        self.segment = segment
+        self.index = index
+        self.symbol = symbol
+
+    @staticmethod
+    def parse(line):
+        """
+        :param line: String, VM command without comment
+        :return: Command
+        """
+        words = line.split()
+        opcode = Command.OPCODES.get(words[0])
+        if opcode is None:
+            raise ValueError('command not recognized: {line}'.format(line=line))
+        if opcode <= Command.NOT or opcode == Command.RETURN:
+            return Command(opcode)
+        if opcode <= Command.POP:
+            segment = Command.SEGMENTS.get(words[1])
+            if segment is None:
+                raise ValueError('segment not recognized: {segment}'.format(segment=words[1]))
+            if segment == Command.STATIC and '.' in words[2]:
+                owner, index = words[2].rsplit('.', 1)
+                return Command(opcode, segment, int(index), owner)
+            return Command(opcode, segment, int(words[2]))
+        if opcode <= Command.IF:
+            return Command(opcode, symbol=words[1])
+        return Command(opcode, index=int(words[2]), symbol=words[1])  # function and call
+
+    @property
+    def name(self):
+        return self.NAMES[self.opcode]
+
+    def __eq__(self, other):
+        return (isinstance(other, Command) and self.opcode == other.opcode and self.segment == other.segment and
+                self.index == other.index and self.symbol == other.symbol)
+
+    def __hash__(self):
+        return hash((self.opcode, self.segment, self.index, self.symbol))
+
+    def __repr__(self):
+        return 'Command({line!r})'.format(line=str(self))
+
+    def __str__(self):
+        """VM code line of the command"""
+        opcode = self.opcode
+        if opcode <= Command.NOT or opcode == Command.RETURN:
+            return self.NAMES[opcode]
+        if opcode <= Command.POP:
+            index = self.index if self.symbol is None else '{owner}.{index}'.format(owner=self.symbol, index=self.index)
+            return '{command} {segment} {index}'.format(command=self.NAMES[opcode],
+                                                        segment=self.SEGMENT_NAMES[self.segment], index=index)
+        if opcode <= Command.IF:
+            return '{command} {label}'.format(command=self.NAMES[opcode], label=self.symbol)
+        return '{command} {name} {n}'.format(command=self.NAMES[opcode], name=self.symbol, n=self.index)
@@ -0,0 +1,654 @@
+import os
+import re
+from array import array
+
+from parser import Parser
+from vm_command import Command
+
+OS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '12')
+
+
+class VMEmulator:
+    """
+    Emulator running VM code directly, without translating it to Hack assembly. Memory is laid out like the Hack
+    RAM the translated code runs on: SP, LCL, ARG, THIS and THAT in RAM[0..4], temp from 5, statics from 16, the
+    stack from 256, then the heap, the screen and the keyboard, so Memory.peek and poke see what they expect.
+
+    The program is predecoded once into (operation, x, y) tuples: push and pop are specialized per kind of
+    segment, static, temp and pointer resolve to fixed addresses, and the targets of goto, if-goto and call
+    resolve to indices in the program. Labels take no operation of their own, like in the VM emulator of the course
+    they are not commands that execute. RAM is a signed 16 bit array, copied into a list for the duration of a run.
+
+    Runs execute traces compiled to Python functions the first time execution reaches their first command, see
+    _compile_trace, and fall back to the command at a time interpreter to stop exactly after max_commands.
+    """
+
+    RAM_SIZE = 32768
+    STACK_BASE = 256
+    HEAP_BASE = 2048
+    STATIC_BASE = 16
+    TEMP_BASE = 5
+    ENTRY_POINT = 'Sys.init'
+    HALT_FUNCTION = 'Sys.halt'  # calls to it stop the emulator, the OS implements it as an endless loop
+    TRACE_LIMIT = 200  # maximum number of commands compiled into one trace
+
+    # operations, ordered by how often compiled Jack code executes them
+    (PUSH_CONSTANT, PUSH_SEGMENT, PUSH_ADDRESS, POP_SEGMENT, POP_ADDRESS, ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+     GOTO, IF, FUNCTION, CALL, RETURN, HALT) = range(20)
+    ARITHMETIC = {Command.ADD: ADD, Command.SUB: SUB, Command.NEG: NEG, Command.EQ: EQ, Command.GT: GT,
+                  Command.LT: LT, Command.AND: AND, Command.OR: OR, Command.NOT: NOT}
+    # Python expression of the arithmetic and logical operations on the operands {a} and {b}, comparisons are
+    # conditions rather than values, see _compile_trace
+    OPERATIONS = {
+        ADD: '(({a} + {b} + 32768) & 65535) - 32768',
+        SUB: '(({a} - {b} + 32768) & 65535) - 32768',
+        NEG: '((32768 - {b}) & 65535) - 32768',
+        EQ: '{a} == {b}',
+        GT: '(({a} - {b} + 32768) & 65535) > 32768',
+        LT: '(({a} - {b} + 32768) & 65535) < 32768',
+        AND: '{a} & {b}',
+        OR: '{a} | {b}',
+        NOT: '~{b}',
+    }
+    CONDITIONS = (EQ, GT, LT)
+    # segment -> RAM address of its base pointer
+    SEGMENT_POINTERS = {Command.LOCAL: 1, Command.ARGUMENT: 2, Command.THIS: 3, Command.THAT: 4}
+    # base pointers of this and that, programs set them anywhere with pop pointer
+    POINTER_SEGMENTS = (3, 4)
+
+    def __init__(self, programs, os_classes=True):
+        """
+        :param programs: List of (file name, list of Commands), one per vm file of the program
+        :param os_classes: Boolean, load the classes the program calls but does not define from the project 12 OS.
+                           Compiled Jack programs have no Sys.vm, so Sys is loaded too when there is a Main.main
+        """
+        if os_classes:
+            programs = self._link_os(list(programs))
+        self.program, self.functions = self._predecode(programs)
+        self.traces = {}  # index of the first command -> (compiled trace, maximum number of commands)
+        self.zeros = [0] * max([x for op, x, _ in self.program if op == self.FUNCTION] or [0])
+        self.ram = array('h', bytes(2 * self.RAM_SIZE))
+        self.pc = 0
+        self.commands = 0
+        self.halted = False
+        if self.ENTRY_POINT in self.functions:
+            self._bootstrap()
+
+    @classmethod
+    def from_path(cls, path, os_classes=True):
+        """Load a vm file, or every vm file of a directory"""
+        if os.path.isdir(path):
+            paths = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.vm'))
+        else:
+            paths = [path]
+        return cls([(os.path.basename(path), Parser(input_path=path).parse_all()) for path in paths], os_classes)
+
+    @property
+    def finished(self):
+        """Whether the program halted or returned from its last function"""
+        return self.halted or self.pc >= len(self.program)
+
+    def _bootstrap(self):
+        """Call Sys.init like the bootstrap code of the translator, returning from it ends the program"""
+        ram = self.ram
+        sp = self.STACK_BASE
+        ram[sp] = len(self.program)  # return address
+        ram[sp + 1:sp + 5] = ram[1:5]
+        ram[0] = sp + 5
+        ram[1] = sp + 5
+        ram[2] = sp
+        self.pc = self.functions[self.ENTRY_POINT]
+
+    def run(self, max_commands=None):
+        """
+        Run until the program halts, returns from its last function or has executed max_commands commands
+
+        :param max_commands: Int, maximum number of VM commands to execute, None for no limit
+        :return: Int, number of VM commands executed
+        """
+        mem = self.ram.tolist()
+        executed = self._run_traces(mem, max_commands)
+        self.ram[:] = array('h', mem)
+        self.commands += executed
+        return executed
+
+    def step(self):
+        """Execute a single VM command"""
+        return self.run(max_commands=1)
+
+    def _run_traces(self, mem, max_commands):
+        """Run compiled traces, down to single commands when a whole trace could overrun max_commands"""
+        program = self.program
+        traces = self.traces
+        n = len(program)
+        pc = self.pc
+        sp = mem[0]
+        budget = max_commands if max_commands is not None else float('inf')
+        executed = 0
+
+        while pc < n and executed < budget:
+            if not self.STACK_BASE <= sp < self.HEAP_BASE:
+                # SP was moved out of the stack, e.g. by Memory.deAlloc storing to RAM[0]. Traces keep pushed values
+                # out of RAM, the Hack code writes them over whatever SP points at, so go a command at a time
+                mem[0] = sp
+                self.pc = pc
+                executed += self._execute(mem, 1)
+                pc = self.pc
+                sp = mem[0]
+                if self.halted:
+                    break
+                continue
+            trace = traces.get(pc)
+            if trace is None:
+                if program[pc][0] == self.HALT:
+                    self.halted = True
+                    break
+                trace = traces[pc] = self._compile_trace(pc)
+            function, length = trace
+            if executed + length > budget:  # the trace could overrun the budget, finish a command at a time
+                mem[0] = sp
+                self.pc = pc
+                executed += self._execute(mem, budget - executed)
+                pc = self.pc
+                sp = mem[0]
+                break
+            pc, sp, count = function(mem, sp)
+            executed += count
+
+        mem[0] = sp
+        self.pc = pc
+        return executed
+
+    def _execute(self, mem, max_commands):
+        """Command at a time interpreter over a list copy of RAM, see run"""
+        program = self.program
+        n = len(program)
+        pc = self.pc
+        sp = mem[0]
+        left = max_commands if max_commands is not None else -1
+
+        while left and pc < n:
+            left -= 1
+            op, x, y = program[pc]
+            pc += 1
+            if op == 0:  # PUSH_CONSTANT
+                mem[sp] = x
+                sp += 1
+            elif op == 1:  # PUSH_SEGMENT
+                address = (mem[x] + y) & 32767
+                mem[sp] = mem[address] if address else sp  # RAM[0] is SP, kept in a local
+                sp += 1
+            elif op == 2:  # PUSH_ADDRESS
+                mem[sp] = mem[x]
+                sp += 1
+            elif op == 3:  # POP_SEGMENT
+                sp -= 1
+                address = (mem[x] + y) & 32767
+                mem[address] = mem[sp]
+                if not address:  # e.g. pop that 0 with THAT 0 sets SP, as Memory.deAlloc does
+                    sp = mem[0]
+            elif op == 4:  # POP_ADDRESS
+                sp -= 1
+                mem[x] = mem[sp]
+            elif op == 5:  # ADD
+                sp -= 1
+                mem[sp - 1] = ((mem[sp - 1] + mem[sp] + 32768) & 65535) - 32768
+            elif op == 6:  # SUB
+                sp -= 1
+                mem[sp - 1] = ((mem[sp - 1] - mem[sp] + 32768) & 65535) - 32768
+            elif op == 7:  # NEG
+                mem[sp - 1] = ((32768 - mem[sp - 1]) & 65535) - 32768
+            elif op == 8:  # EQ
+                sp -= 1
+                mem[sp - 1] = -1 if mem[sp - 1] == mem[sp] else 0
+            elif op == 9:  # GT, compared like the Hack ALU does, on the wrapped difference
+                sp -= 1
+                mem[sp - 1] = -1 if ((mem[sp - 1] - mem[sp] + 32768) & 65535) > 32768 else 0
+            elif op == 10:  # LT
+                sp -= 1
+                mem[sp - 1] = -1 if ((mem[sp - 1] - mem[sp] + 32768) & 65535) < 32768 else 0
+            elif op == 11:  # AND
+                sp -= 1
+                mem[sp - 1] &= mem[sp]
+            elif op == 12:  # OR
+                sp -= 1
+                mem[sp - 1] |= mem[sp]
+            elif op == 13:  # NOT
+                mem[sp - 1] = ~mem[sp - 1]
+            elif op == 14:  # GOTO
+                pc = x
+            elif op == 15:  # IF
+                sp -= 1
+                if mem[sp]:
+                    pc = x
+            elif op == 16:  # FUNCTION
+                mem[sp:sp + x] = y
+                sp += x
+            elif op == 17:  # CALL
+                mem[sp] = pc
+                mem[sp + 1:sp + 5] = mem[1:5]
+                sp += 5
+                mem[2] = sp - 5 - y
+                mem[1] = sp
+                pc = x
+            elif op == 18:  # RETURN
+                frame = mem[1]
+                argument = mem[2]
+                pc = mem[frame - 5]
+                mem[argument] = mem[sp - 1]
+                sp = argument + 1
+                mem[1:5] = mem[frame - 4:frame]
+            else:  # HALT
+                pc -= 1
+                self.halted = True
+                break
+
+        mem[0] = sp
+        executed = (max_commands if max_commands is not None else -1) - left
+        if self.halted:
+            executed -= 1  # the call to Sys.halt is not executed
+        self.pc = pc
+        return executed
+
+    def _compile_trace(self, start, profile=False):
+        """
+        Generate and compile the Python function of the trace starting at the given index. The trace follows the
+        commands as they execute: through gotos and into called functions, if-gotos leave it through a side exit.
+        Returns from functions called in the trace go on with the command after the call, the trace ends at other
+        returns, at a call to Sys.halt, at a command it already went through or after TRACE_LIMIT commands.
+
+        Values pushed by the trace are Python expressions until they are popped, only memory reads go to a local
+        first, and only the values left on the stack are written to RAM on the way out: the stack above SP is not
+        in RAM in the middle of a trace. Comparisons stay Python conditions until a value is needed, and the
+        segment bases are read once per trace unless a call, a return or a pop to pointer changes them.
+        Accesses through this and that may land on RAM[0..4]: a push of RAM[0] reads SP, a pop there changes SP
+        or a base behind the trace, which leaves right after it. Local and argument are taken to point into the
+        stack, where calls put them, a program writing RAM[1] or RAM[2] itself is not followed by the traces.
+
+        :param start: Int, index of the first command of the trace
+        :param profile: Boolean, end the trace before any call or return instead, and have the function also
+                        return the highest SP went above the one it started with, see VMProfiler
+        :return: Tuple, (function(mem, sp) -> (next index, sp, commands executed[, highest SP offset]),
+                 maximum number of commands)
+        """
+        program = self.program
+        n = len(program)
+        lines = ['def trace(mem, sp):']
+        stack = []  # (Python expression, whether it is a condition) of the values pushed and not popped yet
+        bases = {}  # RAM address of a segment base -> local holding it
+        # values popped below the SP the trace started with, locals named, SP moves written and highest SP offset
+        state = {'consumed': 0, 'temps': 0, 'moved': 0, 'peak': 0}
+
+        def emit(line, indent=1):
+            lines.append('    ' * indent + line)
+
+        def temp(expression):
+            state['temps'] += 1
+            name = 't{n}'.format(n=state['temps'])
+            emit('{name} = {expression}'.format(name=name, expression=expression))
+            return name
+
+        def pop():
+            if stack:
+                return stack.pop()
+            state['consumed'] += 1
+            return temp('mem[sp - {k}]'.format(k=state['consumed'])), False
+
+        def value(entry):
+            expression, condition = entry
+            return '(-1 if {c} else 0)'.format(c=expression) if condition else expression
+
+        def address(x, y):
+            if x not in bases:
+                bases[x] = temp('mem[{x}]'.format(x=x))
+            return bases[x] if y == 0 else '({base} + {y}) & 32767'.format(base=bases[x], y=y)
+
+        def write_stack(indent=1):
+            """Write the values left on the stack to RAM, return how far SP moves"""
+            for i, entry in enumerate(stack):
+                emit('mem[sp + {offset}] = {value}'.format(offset=i - state['consumed'], value=value(entry)), indent)
+            return len(stack) - state['consumed']
+
+        def peak():
+            return ', {peak}'.format(peak=state['peak']) if profile else ''
+
+        def flush():
+            delta = write_stack()
+            if delta:
+                emit('sp += {delta}'.format(delta=delta))
+            state['moved'] += delta
+            del stack[:]
+            state['consumed'] = 0
+
+        index = start
+        visited = set()
+        returns = []  # indices after the calls the trace went through
+        count = 0
+        while True:
+            state['peak'] = max(state['peak'], state['moved'] + len(stack) - state['consumed'])
+            if (index >= n or index in visited or count >= self.TRACE_LIMIT or program[index][0] == self.HALT or
+                    profile and program[index][0] in (self.CALL, self.RETURN)):
+                emit('return {target}, sp + {delta}, {count}{peak}'.format(target=index, delta=write_stack(),
+                                                                          count=count, peak=peak()))
+                break
+            visited.add(index)
+            op, x, y = program[index]
+            index += 1
+            count += 1
+            if op == self.PUSH_CONSTANT:
+                stack.append((str(x), False))
+            elif op == self.PUSH_SEGMENT and x not in self.POINTER_SEGMENTS:
+                stack.append((temp('mem[{address}]'.format(address=address(x, y))), False))
+            elif op == self.PUSH_SEGMENT:
+                target = address(x, y) if y == 0 else temp(address(x, y))
+                # RAM[0] is SP, which is sp moved by the values pushed and popped since
+                stack.append((temp('mem[{target}] if {target} else sp + {depth}'.format(
+                    target=target, depth=len(stack) - state['consumed'])), False))
+            elif op == self.PUSH_ADDRESS:
+                stack.append((temp('mem[{x}]'.format(x=x)), False))
+            elif op == self.POP_SEGMENT and x not in self.POINTER_SEGMENTS:
+                entry = pop()
+                emit('mem[{address}] = {value}'.format(address=address(x, y), value=value(entry)))
+            elif op == self.POP_SEGMENT:
+                entry = pop()
+                target = address(x, y) if y == 0 else temp(address(x, y))
+                emit('mem[{target}] = {value}'.format(target=target, value=value(entry)))
+                # a store to SP or a segment base, e.g. by Memory.deAlloc, leaves the trace to read them again
+                emit('if {target} < 5:'.format(target=target))
+                emit('return {next}, mem[0] if {target} == 0 else sp + {delta}, {count}{peak}'
+                     .format(next=index, target=target, delta=write_stack(indent=2), count=count, peak=peak()),
+                     indent=2)
+            elif op == self.POP_ADDRESS:
+                entry = pop()
+                if x in self.SEGMENT_POINTERS.values():  # pop pointer, the base of this or that changes
+                    bases[x] = temp(value(entry))
+                    emit('mem[{x}] = {base}'.format(x=x, base=bases[x]))
+                else:
+                    emit('mem[{x}] = {value}'.format(x=x, value=value(entry)))
+            elif op == self.NOT or op == self.NEG:
+                entry = pop()
+                if op == self.NOT and entry[1]:
+                    stack.append(('not ({c})'.format(c=entry[0]), True))
+                else:
+                    stack.append(('(' + self.OPERATIONS[op].format(b=value(entry)) + ')', False))
+            elif op <= self.OR:
+                b = pop()
+                a = pop()
+                if op in (self.AND, self.OR) and a[1] and b[1]:
+                    stack.append(('({a}) {op} ({b})'.format(a=a[0], b=b[0], op='and' if op == self.AND else 'or'),
+                                  True))
+                else:
+                    stack.append(('(' + self.OPERATIONS[op].format(a=value(a), b=value(b)) + ')',
+                                  op in self.CONDITIONS))
+            elif op == self.GOTO:
+                index = x
+            elif op == self.IF:
+                expression, condition = pop()
+                emit('if {condition}:'.format(condition=expression))
+                emit('return {target}, sp + {delta}, {count}{peak}'.format(target=x, delta=write_stack(indent=2),
+                                                                          count=count, peak=peak()), indent=2)
+            elif op == self.FUNCTION:
+                flush()
+                if x:
+                    emit('mem[sp:sp + {n}] = zeros[:{n}]'.format(n=x))
+                    emit('sp += {n}'.format(n=x))
+                    state['moved'] += x
+            elif op == self.CALL:
+                flush()
+                emit('mem[sp] = {back}'.format(back=index))
+                emit('mem[sp + 1:sp + 5] = mem[1:5]')
+                emit('sp += 5')
+                bases[2] = temp('sp - {n}'.format(n=5 + y))
+                bases[1] = temp('sp')
+                emit('mem[2] = {argument}'.format(argument=bases[2]))
+                emit('mem[1] = {local}'.format(local=bases[1]))
+                returns.append(index)
+                index = x
+            elif returns:  # return from a function called in the trace, the return address is known
+                expression, condition = pop()
+                if not expression.isdigit():
+                    expression = temp(expression)
+                emit('frame = {local}'.format(local=bases.get(1, 'mem[1]')))
+                emit('sp = {argument}'.format(argument=bases.get(2, 'mem[2]')))
+                emit('mem[1:5] = mem[frame - 4:frame]')
+                bases.clear()
+                del stack[:]
+                stack.append((expression, condition))  # the value returned replaces the arguments
+                state['consumed'] = 0
+                index = returns.pop()
+            else:
+                entry = pop()
+                emit('frame = mem[1]')
+                emit('argument = mem[2]')
+                emit('back = mem[frame - 5]')
+                emit('mem[argument] = {value}'.format(value=value(entry)))
+                emit('mem[1:5] = mem[frame - 4:frame]')
+                emit('return back, argument + 1, {count}'.format(count=count))
+                break
+
+        namespace = {'zeros': self.zeros}
+        exec(compile('\n'.join(lines), '<vm trace {start}>'.format(start=start), 'exec'), namespace)
+        return namespace['trace'], count
+
+    def _link_os(self, programs):
+        """Append the OS classes the program needs, and those they need in turn"""
+        defined_classes = set()
+        for file_name, commands in programs:
+            defined_classes.update(c.symbol.split('.')[0] for c in commands if c.opcode == Command.FUNCTION)
+        needed = set()
+        if self.ENTRY_POINT.split('.')[0] not in defined_classes and 'Main' in defined_classes:
+            needed.add(self.ENTRY_POINT.split('.')[0])
+        pending = list(programs)
+        while pending:
+            file_name, commands = pending.pop()
+            needed.update(c.symbol.split('.')[0] for c in commands if c.opcode == Command.CALL)
+            for class_name in sorted(needed - defined_classes):
+                path = os.path.join(OS_DIR, class_name + 'Test', class_name + '.vm')
+                if not os.path.exists(path):
+                    continue  # reported as an undefined function by _predecode
+                os_file = (class_name + '.vm', Parser(input_path=path).parse_all())
+                defined_classes.add(class_name)
+                programs.append(os_file)
+                pending.append(os_file)
+        return programs
+
+    def _predecode(self, programs):
+        """
+        Translate the Commands of every file into the operations of the run loop
+
+        :return: Tuple, (list of (operation, x, y), dictionary of function name -> index of its function command)
+        """
+        program = []
+        functions = {}
+        labels = {}  # (function, label) -> index
+        unresolved = []  # (index, function of the jump or None for a call, label or function name)
+        statics = {}  # (file name without extension, index) -> address
+        for file_name, commands in programs:
+            function = None
+            for parsed_command in commands:
+                opcode = parsed_command.opcode
+                if opcode <= Command.NOT:
+                    program.append((self.ARITHMETIC[opcode], 0, 0))
+                elif opcode <= Command.POP:
+                    program.append(self._decode_access(parsed_command, file_name, statics))
+                elif opcode == Command.LABEL:
+                    labels[function, parsed_command.symbol] = len(program)
+                elif opcode == Command.GOTO or opcode == Command.IF:
+                    unresolved.append((len(program), function, parsed_command.symbol))
+                    program.append((self.GOTO if opcode == Command.GOTO else self.IF, None, 0))
+                elif opcode == Command.FUNCTION:
+                    function = parsed_command.symbol
+                    if function in functions:
+                        raise ValueError('function {name} defined twice'.format(name=function))
+                    functions[function] = len(program)
+                    program.append((self.FUNCTION, parsed_command.index, [0] * parsed_command.index))
+                elif opcode == Command.CALL:
+                    unresolved.append((len(program), None, parsed_command.symbol))
+                    program.append((self.CALL, None, parsed_command.index))
+                else:
+                    program.append((self.RETURN, 0, 0))
+        if len(program) >= self.RAM_SIZE:
+            raise ValueError('program of {n} commands too long, return addresses must fit in the RAM'
+                             .format(n=len(program)))
+
+        for index, function, symbol in unresolved:
+            op, _, y = program[index]
+            if function is not None or op != self.CALL:
+                target = labels.get((function, symbol))
+                if target is None:
+                    raise ValueError('label {label} not found in {function}'.format(label=symbol, function=function))
+            elif symbol == self.HALT_FUNCTION:
+                op, target = self.HALT, 0
+            else:
+                target = functions.get(symbol)
+                if target is None:
+                    raise ValueError('function {name} called but never defined'.format(name=symbol))
+            program[index] = (op, target, y)
+        return program, functions
+
+    def _decode_access(self, parsed_command, file_name, statics):
+        """Return the operation of a push or pop"""
+        segment = parsed_command.segment
+        index = parsed_command.index
+        push = parsed_command.opcode == Command.PUSH
+        if segment == Command.CONSTANT:
+            if not push:
+                raise ValueError('cannot pop to the constant segment')
+            return self.PUSH_CONSTANT, index, 0
+        if segment in self.SEGMENT_POINTERS:
+            return self.PUSH_SEGMENT if push else self.POP_SEGMENT, self.SEGMENT_POINTERS[segment], index
+        if segment == Command.STATIC:
+            owner = parsed_command.symbol or file_name.split('.')[0]
+            address = statics.get((owner, index))
+            if address is None:
+                address = statics[owner, index] = self.STATIC_BASE + len(statics)
+        elif segment == Command.TEMP:
+            address = self.TEMP_BASE + index
+        else:  # pointer
+            address = 3 + index
+        return self.PUSH_ADDRESS if push else self.POP_ADDRESS, address, 0
+
+
+class VMTestScript:
+    """
+    Runner of the VM emulator test scripts of the course, the *VME.tst files and the project 12 tests: load, set,
+    repeat, vmstep, output-list and output. The output is compared with the compare-to file, nothing is written.
+    """
+
+    REGISTERS = {'sp': 0, 'local': 1, 'argument': 2, 'this': 3, 'that': 4}
+    OUTPUT_FORMAT = re.compile(r'(\w+)(?:\[(\d+)\])?%D(\d+)\.(\d+)\.(\d+)')
+
+    def __init__(self, tst_path):
+        self.tst_path = tst_path
+        self.emulator = None
+        self.columns = []  # (label, RAM or register name, index or None, left padding, width, right padding)
+        self.output = []
+        self.compare_path = None
+
+    def run(self):
+        """
+        :return: Tuple, (whether the output matches the compare-to file, list of the output lines)
+        """
+        with open(self.tst_path, 'r') as f:
+            script = re.sub(r'//[^\n]*|/\*.*?\*/', ' ', f.read(), flags=re.S)
+        self._run_statements(re.findall(r'\s*repeat\s+\d+\s*\{[^}]*\}|[^,;{}]+', script))
+        if self.compare_path is None:
+            return True, self.output
+        with open(self.compare_path, 'r') as f:
+            expected = [line.rstrip() for line in f if line.strip()]
+        return self.output == expected, self.output
+
+    def _run_statements(self, statements):
+        directory = os.path.dirname(self.tst_path)
+        for statement in statements:
+            words = statement.split()
+            if not words:
+                continue
+            command = words[0]
+            if command == 'repeat':
+                count = int(words[1])
+                body = re.findall(r'[^,;{}]+', statement[statement.index('{') + 1:statement.rindex('}')])
+                if [part.strip() for part in body if part.strip()] == ['vmstep']:
+                    self.emulator.run(max_commands=count)  # in one go rather than count runs
+                else:
+                    for _ in range(count):
+                        self._run_statements(body)
+            elif command == 'vmstep':
+                self.emulator.step()
+            elif command == 'load':
+                self.emulator = VMEmulator.from_path(os.path.join(directory, words[1]) if len(words) > 1
+                                                     else directory)
+            elif command == 'compare-to':
+                self.compare_path = os.path.join(directory, words[1])
+            elif command == 'output-list':
+                self._set_output_list(words[1:])
+            elif command == 'output':
+                self.output.append(self._format_row())
+            elif command == 'set':
+                self._set(words[1], int(words[2]))
+            elif command != 'output-file':
+                raise ValueError('test script command not supported: {command}'.format(command=command))
+
+    def _address(self, name, index):
+        """RAM address of RAM[i], of a register such as sp, or of a segment entry such as argument[1]"""
+        if name == 'RAM':
+            return index
+        if index is None:
+            return self.REGISTERS[name]
+        if name == 'temp':
+            return VMEmulator.TEMP_BASE + index
+        return self.emulator.ram[self.REGISTERS[name]] + index
+
+    def _set(self, target, value):
+        match = re.match(r'(\w+)(?:\[(\d+)\])?$', target)
+        index = int(match.group(2)) if match.group(2) is not None else None
+        self.emulator.ram[self._address(match.group(1), index)] = value
+
+    def _set_output_list(self, specs):
+        self.columns = []
+        for spec in specs:
+            name, index, left, width, right = self.OUTPUT_FORMAT.match(spec).groups()
+            self.columns.append((spec.split('%')[0], name, int(index) if index is not None else None,
+                                 int(left), int(width), int(right)))
+        header = []
+        for label, _, _, left, width, right in self.columns:
+            total = left + width + right
+            padding = max(total - len(label), 0)
+            header.append((' ' * (padding // 2) + label + ' ' * (padding - padding // 2))[:total])
+        self.output.append('|' + '|'.join(header) + '|')
+
+    def _format_row(self):
+        cells = []
+        for _, name, index, left, width, right in self.columns:
+            value = self.emulator.ram[self._address(name, index)]
+            cells.append(' ' * left + str(value).rjust(width) + ' ' * right)
+        return '|' + '|'.join(cells) + '|'
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    arg_parser = argparse.ArgumentParser(description='Run a vm program, or a VM emulator test script')
+    arg_parser.add_argument('path', help='vm file, directory of vm files or .tst script')
+    arg_parser.add_argument('--max-commands', type=int, default=None)
+    arg_parser.add_argument('--ram', nargs=2, type=int, metavar=('START', 'END'), default=None,
+                            help='print RAM[START..END) once the program stopped')
+    arg_parser.add_argument('--no-os', action='store_true', help='do not load missing classes from the OS')
+    args = arg_parser.parse_args()
+
+    if args.path.endswith('.tst'):
+        passed, lines = VMTestScript(args.path).run()
+        print('\n'.join(lines))
+        print('passed' if passed else 'FAILED')
+    else:
+        emulator = VMEmulator.from_path(args.path, os_classes=not args.no_os)
+        started = time.perf_counter()
+        n_executed = emulator.run(max_commands=args.max_commands)
+        elapsed = time.perf_counter() - started
+        print('{state} after {n} commands in {s:.2f}s, {cps:.0f} commands/s'
+              .format(state='halted' if emulator.finished else 'stopped', n=n_executed, s=elapsed,
+                      cps=n_executed / elapsed if elapsed else 0))
+        if args.ram is not None:
+            for address in range(*args.ram):
+                print('RAM[{address}] = {value}'.format(address=address, value=emulator.ram[address]))
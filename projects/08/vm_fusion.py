@@ -0,0 +1,111 @@
+from vm_command import Command
+
+
+class FusedCommand(Command):
+    """Pair of commands matched by a VMFusion rule, its opcode is Command.FUSED"""
+
+    __slots__ = ('rule', 'commands')
+
+    def __init__(self, rule, commands):
+        super().__init__(Command.FUSED)
+        self.rule = rule
+        self.commands = commands
+
+    def __str__(self):
+        return '; '.join(str(parsed_command) for parsed_command in self.commands)
+
+
+class VMFusion:
+    """
+    Pattern based stage in front of CodeWriter.write. Pairs of VM commands that compilers emit over and over are
+    recognized and handed to the CodeWriter as one FusedCommand, translated with specialized assembly instead
+    of one generic sequence per command. Every other command goes through unchanged.
+
+    Rules, the first command of the pair is held back until the second one is known:
+        add_constant    push constant c; add      adds c to the stack top in place
+        sub_constant    push constant c; sub      subtracts c from the stack top in place
+        move            push seg i; pop seg j     copies a slot to another through D, the stack is untouched
+        compare_zero    push constant 0; eq/gt/lt compares the stack top with 0 in place
+        not_if_goto     not; if-goto              jumps unless the popped value is true, i.e. -1
+    """
+
+    RULES = ('add_constant', 'sub_constant', 'move', 'compare_zero', 'not_if_goto')
+
+    def __init__(self, code_writer, rules=None):
+        """
+        :param code_writer: CodeWriter receiving the commands
+        :param rules: Iterable of the rule names to apply, all of RULES by default
+        """
+        self.code_writer = code_writer
+        self.rules = set(self.RULES if rules is None else rules)
+        unknown = self.rules - set(self.RULES)
+        if unknown:
+            raise ValueError('fusion rules not recognized: {rules}'.format(rules=', '.join(sorted(unknown))))
+        if code_writer.comparisons == 'jump':
+            # the CodeWriter already turns comparisons feeding an if-goto into a single jump, leave them to it
+            self.rules.discard('compare_zero')
+        self.hits = {rule: 0 for rule in self.RULES}
+        self.pending = None
+        self.previous = None  # last command written, fused or not
+
+    def write(self, parsed_command):
+        """
+        Fuse the command with the one held back when they make a rule, otherwise write the held back command
+
+        :param parsed_command: Command, parsed VM command
+        :return: Nothing, commands written to the CodeWriter
+        """
+        if self.pending is not None:
+            rule = self._match(self.pending, parsed_command)
+            if rule is not None:
+                self.hits[rule] += 1
+                self.__emit(FusedCommand(rule, [self.pending, parsed_command]))
+                self.pending = None
+                return
+            self.__emit(self.pending)
+            self.pending = None
+
+        if self._starts_rule(parsed_command):
+            self.pending = parsed_command
+        else:
+            self.__emit(parsed_command)
+
+    def finish(self):
+        """Write the command still held back, then finish the CodeWriter"""
+        if self.pending is not None:
+            self.__emit(self.pending)
+            self.pending = None
+        self.code_writer.finish()
+
+    def _starts_rule(self, parsed_command):
+        opcode = parsed_command.opcode
+        if opcode == Command.PUSH:
+            return bool(self.rules & {'add_constant', 'sub_constant', 'move', 'compare_zero'})
+        if opcode == Command.NOT and 'not_if_goto' in self.rules:
+            # not after a comparison is already folded into the jump by the CodeWriter
+            return not (self.code_writer.comparisons == 'jump' and self.previous is not None and
+                        self.previous.opcode in Command.COMPARISONS)
+        return False
+
+    def _match(self, first, second):
+        """Return the name of the rule the two commands make, None if there is none"""
+        opcode = second.opcode
+        if first.opcode == Command.PUSH:
+            if opcode == Command.POP:
+                return 'move' if 'move' in self.rules else None
+            if first.segment != Command.CONSTANT:
+                return None
+            if opcode == Command.ADD and 'add_constant' in self.rules:
+                return 'add_constant'
+            if opcode == Command.SUB and 'sub_constant' in self.rules:
+                return 'sub_constant'
+            if opcode in Command.COMPARISONS and first.index == 0 and 'compare_zero' in self.rules:
+                return 'compare_zero'
+            return None
+        if first.opcode == Command.NOT and opcode == Command.IF:
+            return 'not_if_goto'
+        return None
+
+    def __emit(self, parsed_command):
+        self.code_writer.write(parsed_command)
+        self.previous = parsed_command
@@ -0,0 +1,162 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '06'))
+
+from asm_sink import AsmSink
+from assembler import HackAssembler
+from function_inliner import FunctionInliner
+from vm_translator import VMTranslator
+
+
+class VMPipeline:
+    """
+    VM code to Hack machine code in a single pass and a single process. The translated assembly never goes
+    to disk: every line the CodeWriter emits is fed straight to a streaming HackAssembler.
+    """
+
+    @staticmethod
+    def build(input_path, output_path=None, output_format='text', byteorder='big', keep_asm=False,
+              bootstrap=None, symbol_path=None, optimize_for='speed', comparisons='inline',
+              cache_tos=False, fuse=False, fusion_hits=None, fold_constants=False,
+              eliminate_dead_functions=False, removed_functions=None, inline_functions=False,
+              inline_max_size=FunctionInliner.MAX_SIZE, inlined_calls=None, workers=1, cache_dir=None,
+              cache_size=None, cache_stats=None):
+        """
+        Translate and assemble a vm file, or every vm file of a directory
+
+        :param input_path: String, path of the vm file or of the directory containing the vm files
+        :param output_path: String, path of the ROM image to write, None to only return the words
+        :param output_format: String, 'text' or 'binary', see HackAssembler.write_rom
+        :param byteorder: String, 'big' or 'little', byte order of the words in a binary ROM
+        :param keep_asm: Boolean, also write the translated assembly next to the ROM, for debugging
+        :param bootstrap: Boolean, whether to start with the bootstrap code calling Sys.init, see CodeWriter
+        :param symbol_path: String, if given the label map of the program is written there
+        :param optimize_for: String, 'speed' or 'size', how calls and returns are translated, see CodeWriter
+        :param comparisons: String, 'inline', 'shared' or 'jump', how eq, gt and lt are translated, see CodeWriter
+        :param cache_tos: Boolean, keep the top of the stack in D within basic blocks, see CodeWriter
+        :param fuse: Boolean, translate common pairs of commands as one, see VMFusion
+        :param fusion_hits: Dictionary, if given receives the number of times each fusion rule fired
+        :param fold_constants: Boolean, evaluate constant arithmetic before translating, see ConstantFolder
+        :param eliminate_dead_functions: Boolean, leave out the functions Sys.init never calls,
+                                         see DeadFunctionEliminator
+        :param removed_functions: List, if given receives the names of the functions left out
+        :param inline_functions: Boolean, replace the calls of small leaf functions with their bodies,
+                                 see FunctionInliner
+        :param inline_max_size: Int, largest number of commands of an inlined function
+        :param inlined_calls: Dictionary, if given receives the number of call sites inlined per function
+        :param workers: Int, number of processes translating files concurrently, None for one per core
+        :param cache_dir: String, directory of the translation cache reusing the code of unchanged files
+        :param cache_size: Int, size cap of the cache in bytes, None for no cap
+        :param cache_stats: Dictionary, if given receives the number of cache hits and misses, see VMTranslator
+        :return: array('H') of the ROM words
+        """
+        is_input_directory = os.path.isdir(input_path)
+        # the CodeWriter names the program after its output, e.g. to pick the default bootstrap
+        base_path = os.path.splitext(output_path or input_path.rstrip('/'))[0]
+        if is_input_directory and output_path is None:
+            base_path = os.path.join(input_path, os.path.basename(input_path.rstrip('/')))
+        asm_path = base_path + '.asm'
+
+        assembler = HackAssembler(None, streaming=True)
+        assembler.start_stream()
+        asm_sink = AsmSink(asm_path) if keep_asm else None
+        try:
+            VMTranslator.translate(input_path, asm_path, is_input_directory,
+                                   sink=_AssemblerSink(assembler, asm_sink), bootstrap=bootstrap,
+                                   optimize_for=optimize_for, comparisons=comparisons,
+                                   cache_tos=cache_tos, fuse=fuse, fusion_hits=fusion_hits,
+                                   fold_constants=fold_constants, eliminate_dead_functions=eliminate_dead_functions,
+                                   removed_functions=removed_functions, inline_functions=inline_functions,
+                                   inline_max_size=inline_max_size, inlined_calls=inlined_calls,
+                                   workers=workers, cache_dir=cache_dir, cache_size=cache_size,
+                                   cache_stats=cache_stats)
+        except BaseException:
+            if asm_sink is not None:
+                asm_sink.discard()
+            raise
+        words = assembler.finish_stream()
+
+        if asm_sink is not None:
+            asm_sink.close()
+        if output_path is not None:
+            HackAssembler.write_rom(words, output_path, output_format, byteorder)
+        if symbol_path is not None:
+            assembler.write_symbol_map(symbol_path)
+        return words
+
+
+class _AssemblerSink:
+    """CodeWriter sink feeding the lines to a streaming assembler, and to an AsmSink as well when given one"""
+
+    def __init__(self, assembler, asm_sink=None):
+        self.assembler = assembler
+        self.asm_sink = asm_sink
+
+    def write_lines(self, lines):
+        feed = self.assembler.feed
+        for line in lines:
+            feed(line)
+        if self.asm_sink is not None:
+            self.asm_sink.write_lines(lines)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Translate and assemble VM code straight to a Hack ROM')
+    arg_parser.add_argument('input_path', help='vm file or directory of vm files')
+    arg_parser.add_argument('-o', '--output', default=None, help='ROM path, by default next to the input')
+    arg_parser.add_argument('--format', choices=('text', 'binary'), default='text', dest='output_format')
+    arg_parser.add_argument('--byteorder', choices=('big', 'little'), default='big')
+    arg_parser.add_argument('--keep-asm', action='store_true', help='also write the translated assembly')
+    arg_parser.add_argument('--bootstrap', action='store_true', default=None, help='set SP and call Sys.init')
+    arg_parser.add_argument('--no-bootstrap', action='store_false', dest='bootstrap')
+    arg_parser.add_argument('--optimize-for', choices=('speed', 'size'), default='speed',
+                            help='inline calls and returns, or share one routine of each for a smaller ROM')
+    arg_parser.add_argument('--comparisons', choices=('inline', 'shared', 'jump'), default='inline',
+                            help='inline eq/gt/lt, share one routine per operator, or fuse them with if-goto')
+    arg_parser.add_argument('--cache-tos', action='store_true', help='keep the top of the stack in D')
+    arg_parser.add_argument('--fuse', action='store_true', help='translate common pairs of commands as one')
+    arg_parser.add_argument('--fold-constants', action='store_true', help='evaluate constant arithmetic first')
+    arg_parser.add_argument('-j', '--workers', type=int, default=1,
+                            help='processes translating files concurrently, 0 for one per core')
+    arg_parser.add_argument('--cache-dir', default=None, help='reuse the code of unchanged vm files from there')
+    arg_parser.add_argument('--cache-size', type=int, default=None, help='cache size cap in bytes, LRU eviction')
+    arg_parser.add_argument('--eliminate-dead-functions', action='store_true',
+                            help='leave out the functions Sys.init never calls')
+    arg_parser.add_argument('--inline-functions', action='store_true',
+                            help='replace the calls of small leaf functions with their bodies')
+    arg_parser.add_argument('--inline-max-size', type=int, default=FunctionInliner.MAX_SIZE,
+                            help='largest number of commands of an inlined function')
+    args = arg_parser.parse_args()
+
+    rom_path = args.output
+    if rom_path is None:
+        stem = args.input_path.rstrip('/')
+        if os.path.isdir(stem):
+            stem = os.path.join(stem, os.path.basename(stem))
+        rom_path = os.path.splitext(stem)[0] + ('.hack' if args.output_format == 'text' else '.rom')
+    hits = {}
+    removed = []
+    inlined = {}
+    stats = {}
+    rom = VMPipeline.build(args.input_path, rom_path, output_format=args.output_format, byteorder=args.byteorder,
+                           keep_asm=args.keep_asm, bootstrap=args.bootstrap,
+                           optimize_for=args.optimize_for, comparisons=args.comparisons,
+                           cache_tos=args.cache_tos, fuse=args.fuse, fusion_hits=hits,
+                           fold_constants=args.fold_constants,
+                           eliminate_dead_functions=args.eliminate_dead_functions, removed_functions=removed,
+                           inline_functions=args.inline_functions, inline_max_size=args.inline_max_size,
+                           inlined_calls=inlined, workers=args.workers or None, cache_dir=args.cache_dir,
+                           cache_size=args.cache_size, cache_stats=stats)
+    print('{path}: {n} words'.format(path=rom_path, n=len(rom)))
+    for rule, n in hits.items():
+        print('  {rule}: {n}'.format(rule=rule, n=n))
+    if args.inline_functions:
+        print('  {n} calls of {functions} functions inlined'.format(n=sum(inlined.values()),
+                                                                     functions=len(inlined)))
+    if args.eliminate_dead_functions:
+        print('  {n} dead functions left out'.format(n=len(removed)))
+    if args.cache_dir is not None:
+        print('  {hits} files from the cache, {misses} translated'.format(hits=stats.get('hits', 0),
+                                                                         misses=stats.get('misses', 0)))
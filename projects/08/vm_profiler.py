@@ -0,0 +1,210 @@
+import argparse
+import bisect
+import json
+import sys
+from array import array
+
+from vm_emulator import VMEmulator
+
+
+class VMProfiler:
+    """
+    Function level profiler of VM programs. The program runs on the VM emulator with traces that stop at every
+    call and return, which the profiler executes itself to keep the call stack of the program. Per function it
+    records the calls, the commands executed by the function itself and with its callees, and the highest SP
+    reached while the function itself ran, each trace reports the highest along the path it took. Per call stack
+    it records the commands executed, as folded stacks for flamegraphs.
+    """
+
+    def __init__(self, emulator):
+        """
+        :param emulator: VMEmulator, profiled from where it is, counts start at zero
+        """
+        self.emulator = emulator
+        self.traces = {}  # traces ending at calls and returns, apart from those of the emulator
+        self.names = {index: name for name, index in emulator.functions.items()}
+        self.starts = sorted(self.names)
+
+        self.calls = {}
+        self.self_commands = {}
+        self.inclusive_commands = {}
+        self.stack_high_water = {}  # function -> highest SP reached while it ran
+        self.folded = {}  # 'caller;callee' -> commands executed by the callee itself under that call stack
+        self.max_depth = 0
+        self.executed = 0
+        self.frames = []  # (function, folded stack, commands executed before it was called) of the open calls
+        self.active = {}  # function -> number of its calls open, inclusive counts go to the outermost one
+
+    @classmethod
+    def from_path(cls, path, os_classes=True):
+        """Profile a vm file, or every vm file of a directory, see VMEmulator.from_path"""
+        return cls(VMEmulator.from_path(path, os_classes))
+
+    def run(self, max_commands=None):
+        """Run the program, see VMEmulator.run, counts accumulate over successive runs"""
+        emulator = self.emulator
+        program = emulator.program
+        traces = self.traces
+        n = len(program)
+        mem = emulator.ram.tolist()
+        pc = emulator.pc
+        sp = mem[0]
+        budget = max_commands if max_commands is not None else float('inf')
+        executed = 0
+        before = self.executed  # commands executed by the previous runs
+        self_commands = self.self_commands
+        folded = self.folded
+        high_water = self.stack_high_water
+
+        while pc < n and executed < budget:
+            if not self.frames:  # first run, or returned from the function the profiler started in
+                self.executed = before + executed
+                self._enter(self._enclosing(pc))
+            op, x, y = program[pc]
+            function, stack, _ = self.frames[-1]
+            if op == VMEmulator.CALL:
+                mem[sp] = pc + 1
+                mem[sp + 1:sp + 5] = mem[1:5]
+                sp += 5
+                mem[2] = sp - 5 - y
+                mem[1] = sp
+                pc = x
+                executed += 1
+                self_commands[function] = self_commands.get(function, 0) + 1
+                folded[stack] = folded.get(stack, 0) + 1
+                if sp > high_water.get(function, 0):
+                    high_water[function] = sp
+                self.executed = before + executed
+                self._enter(self.names[x])
+                continue
+            if op == VMEmulator.RETURN:
+                frame = mem[1]
+                argument = mem[2]
+                pc = mem[frame - 5]
+                mem[argument] = mem[sp - 1]
+                sp = argument + 1
+                mem[1:5] = mem[frame - 4:frame]
+                executed += 1
+                self_commands[function] = self_commands.get(function, 0) + 1
+                folded[stack] = folded.get(stack, 0) + 1
+                self.executed = before + executed
+                self._leave()
+                continue
+            if op == VMEmulator.HALT:
+                emulator.halted = True
+                break
+
+            trace = traces.get(pc)
+            if trace is None:
+                trace = traces[pc] = emulator._compile_trace(pc, profile=True)
+            trace_function, length = trace
+            # one command at a time, calls and returns are handled above. SP out of the stack, see VMEmulator
+            if executed + length > budget or not VMEmulator.STACK_BASE <= sp < VMEmulator.HEAP_BASE:
+                mem[0] = sp
+                emulator.pc = pc
+                count = emulator._execute(mem, 1)
+                pc = emulator.pc
+                sp = peak = mem[0]
+            else:
+                peak = sp
+                pc, sp, count, offset = trace_function(mem, sp)
+                peak += offset
+            if peak > high_water.get(function, 0):
+                high_water[function] = peak
+            executed += count
+            self_commands[function] = self_commands.get(function, 0) + count
+            folded[stack] = folded.get(stack, 0) + count
+
+        self.executed = before + executed
+        mem[0] = sp
+        emulator.pc = pc
+        emulator.ram[:] = array('h', mem)
+        emulator.commands += executed
+        return executed
+
+    def _enter(self, function):
+        """Open a call of the function"""
+        stack = self.frames[-1][1] + ';' + function if self.frames else function
+        self.frames.append((function, stack, self.executed))
+        self.calls[function] = self.calls.get(function, 0) + 1
+        self.active[function] = self.active.get(function, 0) + 1
+        self.max_depth = max(self.max_depth, len(self.frames))
+
+    def _leave(self):
+        function, _, started = self.frames.pop()
+        self.active[function] -= 1
+        if not self.active[function]:  # recursive calls are already part of the outermost one
+            self.inclusive_commands[function] = self.inclusive_commands.get(function, 0) + self.executed - started
+
+    def _enclosing(self, index):
+        i = bisect.bisect_right(self.starts, index) - 1
+        return self.names[self.starts[i]] if i >= 0 else '<start>'
+
+    def report(self, top=20):
+        """
+        Summarize where the commands went
+
+        :param top: Int, number of functions kept, the ones executing the most commands themselves
+        :return: Dictionary with the totals and per function counts
+        """
+        inclusive = dict(self.inclusive_commands)
+        outermost = set()
+        for function, _, started in self.frames:  # calls still open count up to now
+            if function not in outermost:
+                outermost.add(function)
+                inclusive[function] = inclusive.get(function, 0) + self.executed - started
+        total = self.executed
+        functions = []
+        for function, commands in sorted(self.self_commands.items(), key=lambda item: item[1], reverse=True)[:top]:
+            functions.append({'name': function, 'calls': self.calls.get(function, 0),
+                              'self_commands': commands, 'inclusive_commands': inclusive.get(function, 0),
+                              'self_share': 100.0 * commands / total if total else 0.0,
+                              'inclusive_share': 100.0 * inclusive.get(function, 0) / total if total else 0.0,
+                              'stack_high_water': self.stack_high_water.get(function, 0)})
+        return {'total_commands': total,
+                'max_call_depth': self.max_depth,
+                'stack_high_water': max(self.stack_high_water.values() or [self.emulator.ram[0]]),
+                'functions': functions}
+
+    def format_report(self, top=20):
+        """Human readable version of report"""
+        report = self.report(top)
+        lines = ['{total_commands} commands, call depth up to {max_call_depth}, stack up to RAM[{stack_high_water}]'
+                 .format(**report),
+                 '',
+                 '  {calls:>10} {self:>12} {share:>7} {inclusive:>12} {inclusive_share:>7} {stack:>6}  function'
+                 .format(calls='calls', self='self', share='%', inclusive='inclusive', inclusive_share='%',
+                         stack='stack')]
+        for entry in report['functions']:
+            lines.append('  {calls:>10} {self_commands:>12} {self_share:6.2f}% {inclusive_commands:>12} '
+                         '{inclusive_share:6.2f}% {stack_high_water:>6}  {name}'.format(**entry))
+        return '\n'.join(lines)
+
+    def write_folded(self, path):
+        """
+        Write the commands executed per call stack in the folded format of flamegraph.pl and speedscope,
+        one 'outermost;...;innermost count' line per call stack
+        """
+        with open(path, 'w') as f:
+            for stack, commands in sorted(self.folded.items()):
+                f.write('{stack} {commands}\n'.format(stack=stack, commands=commands))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Profile where a vm program spends its commands')
+    arg_parser.add_argument('path', help='vm file or directory of vm files')
+    arg_parser.add_argument('--max-commands', type=int, default=None)
+    arg_parser.add_argument('--top', type=int, default=20)
+    arg_parser.add_argument('--folded', default=None, help='write the folded call stacks to this path')
+    arg_parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = arg_parser.parse_args()
+
+    profiler = VMProfiler.from_path(args.path)
+    profiler.run(max_commands=args.max_commands)
+    if args.folded:
+        profiler.write_folded(args.folded)
+    if args.json:
+        json.dump(profiler.report(args.top), sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        print(profiler.format_report(args.top))
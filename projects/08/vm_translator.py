@@ -1,13 +1,32 @@
+import json
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '06'))
+
+from asm_sink import AsmSink
+from build_cache import BuildCache
 from code_writer import CodeWriter
+from constant_folder import ConstantFolder
+from dead_functions import DeadFunctionEliminator
+from function_inliner import FunctionInliner
 from parser import Parser
+from vm_fusion import VMFusion
 
 
 class VMTranslator:
+    # part of the cache keys, to be bumped whenever the translated code of a file changes
+    TRANSLATOR_VERSION = 1
 
     @staticmethod
-    def translate(input_path, output_path, is_input_directory):
+    def translate(input_path, output_path, is_input_directory, sink=None, bootstrap=None, optimize_for='speed',
+                  comparisons='inline', cache_tos=False, fuse=False, fusion_hits=None, fold_constants=False,
+                  eliminate_dead_functions=False, removed_functions=None, inline_functions=False,
+                  inline_max_size=FunctionInliner.MAX_SIZE, inlined_calls=None, workers=1, cache_dir=None,
+                  cache_size=None, cache_stats=None):
         """
         Top level function that translates the VM code into Hack assembly code.
         If input path is directory, translates all .vm extension file within the directory
@@ -15,24 +34,166 @@ class VMTranslator:
         :param input_path: String, input path of the vm file, or path to the directory containing the vm files
         :param output_path: String, output path of the translated asm file
         :param is_input_directory: Boolean, whether input path is a path to a directory
+        :param sink: AsmSink receiving the translated code, e.g. an in-memory one, left open for the caller.
+                     By default the code is written to the output path in one go once translation succeeded
+        :param bootstrap: Boolean, whether to start with the bootstrap code calling Sys.init, see CodeWriter
+        :param optimize_for: String, 'speed' or 'size', how calls and returns are translated, see CodeWriter
+        :param comparisons: String, 'inline', 'shared' or 'jump', how eq, gt and lt are translated, see CodeWriter
+        :param cache_tos: Boolean, keep the top of the stack in D within basic blocks, see CodeWriter
+        :param fuse: Boolean, translate common pairs of commands as one, see VMFusion
+        :param fusion_hits: Dictionary, if given receives the number of times each fusion rule fired
+        :param fold_constants: Boolean, evaluate constant arithmetic before translating, see ConstantFolder
+        :param eliminate_dead_functions: Boolean, leave out the functions Sys.init never calls,
+                                         see DeadFunctionEliminator
+        :param removed_functions: List, if given receives the names of the functions left out
+        :param inline_functions: Boolean, replace the calls of small leaf functions with their bodies, before dead
+                                 functions are left out, see FunctionInliner
+        :param inline_max_size: Int, largest number of commands of an inlined function
+        :param inlined_calls: Dictionary, if given receives the number of call sites inlined per function
+        :param workers: Int, number of processes translating files concurrently, None for one per core.
+                        The chunks are merged in file name order whatever the number of workers
+        :param cache_dir: String, directory of the translation cache reusing the code of unchanged files,
+                          None to always translate
+        :param cache_size: Int, size cap of the cache in bytes, None for no cap
+        :param cache_stats: Dictionary, if given receives the number of files found in the cache, 'hits',
+                            and translated, 'misses'
         :return: Nothing, vm file translated
         """
+        if sink is None:
+            with AsmSink(output_path) as sink:
+                VMTranslator.translate(input_path, output_path, is_input_directory, sink, bootstrap, optimize_for,
+                                       comparisons, cache_tos, fuse, fusion_hits, fold_constants,
+                                       eliminate_dead_functions, removed_functions, inline_functions,
+                                       inline_max_size, inlined_calls, workers, cache_dir, cache_size, cache_stats)
+            return
+
         if is_input_directory:
-            input_paths = [os.path.join(input_path, path)
-                           for path in os.listdir(input_path) if path.endswith('.vm')]
+            input_paths = sorted(os.path.join(input_path, path)
+                                 for path in os.listdir(input_path) if path.endswith('.vm'))
         else:
             input_paths = [input_path]
 
-        for i, input_path in enumerate(input_paths):
-            is_first_file = i == 0
-            parser = Parser(input_path=input_path)
-            file_name = input_path.split('/')[-1]
+        # a path, or the parsed commands once a whole program pass has been over them
+        programs = [(path.split('/')[-1], path) for path in input_paths]
+        if inline_functions or eliminate_dead_functions:
+            programs = [(file_name, Parser(input_path=path).parse_all()) for file_name, path in programs]
+        if inline_functions:
+            inliner = FunctionInliner(inline_max_size)
+            programs = inliner.inline(programs)
+            if inlined_calls is not None:
+                for name, n_calls in inliner.calls_inlined.items():
+                    inlined_calls[name] = inlined_calls.get(name, 0) + n_calls
+        if eliminate_dead_functions:
+            eliminator = DeadFunctionEliminator()
+            programs = eliminator.eliminate(programs)
+            if removed_functions is not None:
+                removed_functions.extend(eliminator.functions_removed)
+
+        options = {'bootstrap': bootstrap, 'optimize_for': optimize_for, 'comparisons': comparisons,
+                   'cache_tos': cache_tos, 'fuse': fuse, 'fold_constants': fold_constants,
+                   'cache_dir': cache_dir, 'cache_size': cache_size}
+        n = len(programs)
+        if workers == 1 or n < 2:
+            # straight to the sink, file after file
+            results = (VMTranslator.translate_file(file_name, commands, output_path, i == 0, sink, **options)
+                       for i, (file_name, commands) in enumerate(programs))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(partial(VMTranslator.translate_file, **options),
+                                        [program[0] for program in programs], [program[1] for program in programs],
+                                        [output_path] * n, [i == 0 for i in range(n)]))
+
+        runtime_used = set()
+        for lines, file_runtime_used, hits, cache_hit in results:
+            if lines is not None:
+                sink.write_lines(lines)
+            runtime_used |= file_runtime_used
+            if fusion_hits is not None:
+                for rule, n_hits in hits.items():
+                    fusion_hits[rule] = fusion_hits.get(rule, 0) + n_hits
+            if cache_stats is not None and cache_hit is not None:
+                counter = 'hits' if cache_hit else 'misses'
+                cache_stats[counter] = cache_stats.get(counter, 0) + 1
+
+        if programs:
+            CodeWriter(input_file_name=programs[-1][0], output_path=output_path, is_first_file=False, sink=sink,
+                       bootstrap=bootstrap, optimize_for=optimize_for, comparisons=comparisons,
+                       cache_tos=cache_tos).write_runtime(runtime_used)
+
+    @staticmethod
+    def translate_file(file_name, commands, output_path, is_first_file, sink=None, bootstrap=None,
+                       optimize_for='speed', comparisons='inline', cache_tos=False, fuse=False, fold_constants=False,
+                       cache_dir=None, cache_size=None):
+        """
+        Translate the commands of a single vm file. Labels are scoped by file and function, so files translate
+        independently of each other and the code of a file can be reused as is in another build, only the
+        bootstrap goes with the first file. The other parameters are those of translate.
+
+        :param file_name: String, name of the vm file, prefix of its statics and labels
+        :param commands: String path of the vm file, or list of its Commands
+        :param output_path: String, output path of the translated asm file, names the program
+        :param is_first_file: Boolean, whether this is the first file of the program, see CodeWriter
+        :param sink: AsmSink receiving the translated code, None to return the lines instead
+        :return: Tuple, (list of the translated lines or None when written to the sink,
+                 set of the shared routines used, dictionary of fusion rule -> hits,
+                 whether the code came from the cache or None without a cache)
+        """
+        cache = BuildCache(cache_dir, cache_size) if cache_dir else None
+        target = sink
+        if sink is None or cache is not None:
+            sink = AsmSink()
+        code_writer = CodeWriter(input_file_name=file_name, output_path=output_path, is_first_file=is_first_file,
+                                 sink=sink, bootstrap=bootstrap, optimize_for=optimize_for,
+                                 comparisons=comparisons, cache_tos=cache_tos)
+
+        if cache is not None:
+            key = VMTranslator.cache_key(file_name, commands, is_first_file and code_writer.bootstrap, optimize_for,
+                                         comparisons, cache_tos, fuse, fold_constants)
+            data = cache.get(key)
+            if data is not None:
+                chunk = json.loads(data)
+                if target is not None:
+                    target.write_lines(chunk['lines'])
+                    return None, set(chunk['runtime_used']), chunk['hits'], True
+                return chunk['lines'], set(chunk['runtime_used']), chunk['hits'], True
 
-            code_writer = CodeWriter(input_file_name=file_name, output_path=output_path, is_first_file=is_first_file)
+        if isinstance(commands, str):
+            commands = Parser(input_path=commands).parse_all()
+        writer = VMFusion(code_writer) if fuse else code_writer
+        if fold_constants:
+            commands = ConstantFolder().fold(commands)
+        for parsed_command in commands:
+            writer.write(parsed_command)
+        writer.finish()
 
-            while parser.has_more_commands():
-                parsed_command = parser.advance()
-                code_writer.write(parsed_command)
+        hits = writer.hits if fuse else {}
+        cache_hit = None
+        if cache is not None:
+            cache.put(key, json.dumps({'lines': sink.lines, 'runtime_used': sorted(code_writer.runtime_used),
+                                       'hits': hits}).encode())
+            cache_hit = False
+        if target is None:
+            return sink.lines, code_writer.runtime_used, hits, cache_hit
+        if target is not sink:
+            target.write_lines(sink.lines)
+        return None, code_writer.runtime_used, hits, cache_hit
+
+    @staticmethod
+    def cache_key(file_name, commands, bootstrap, optimize_for, comparisons, cache_tos, fuse, fold_constants):
+        """
+        Hash of the vm code of a file and of everything else its translated code depends on: its name, which
+        prefixes its labels and statics, whether it carries the bootstrap and the translation options
+
+        :param commands: String path of the vm file, or list of its Commands
+        """
+        if isinstance(commands, str):
+            with open(commands, 'r') as f:
+                source = [f.read()]
+        else:
+            source = [str(parsed_command) for parsed_command in commands]
+        options = ['VMTranslator', str(VMTranslator.TRANSLATOR_VERSION), file_name, str(bool(bootstrap)), optimize_for,
+                   comparisons, str(cache_tos), str(fuse), str(fold_constants)]
+        return BuildCache.key(chain(options, source))
 
 
 if __name__ == '__main__':